@@ -9,6 +9,18 @@ import html
 import sys
 import platform
 
+import diary_db
+import git_local
+import github_plan
+import local_vault
+import metrics
+import profiling
+import resilience
+import scheduler
+import sharding
+import site_discovery
+import wordpress_wxr
+
 try:
     import msvcrt
 except Exception:
@@ -20,17 +32,63 @@ except Exception:
     tty = None
     termios = None
 
+# Crawled pages are read up to this many bytes ("max_bytes" in sources.json)
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+READ_CHUNK = 64 * 1024
+TEXT_TYPES = ('text/', 'application/xhtml+xml', 'application/xml')
+
 def fetch_url(url):
     try:
         req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with resilience.urlopen(req, timeout=10) as response:
             return response.read().decode('utf-8', errors='ignore')
     except Exception as e:
         print(f"Error fetching {url}: {e}")
         return None
 
-def fetch_wordpress(base_url):
-    all_posts = []
+def fetch_page(url, max_bytes=MAX_PAGE_BYTES):
+    """Fetch a crawled page as text; None for errors and non-text responses.
+
+    The headers are checked before any of the body is read: responses with
+    a non-text Content-Type are closed unread, and the body is streamed in
+    chunks and cut off after `max_bytes`. Without a Content-Type, a NUL
+    byte in the first chunk marks the response as binary.
+    """
+    try:
+        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+        with resilience.urlopen(req, timeout=10, max_bytes=max_bytes) as response:
+            content_type = response.headers.get('Content-Type') or ''
+            mime = content_type.split(';')[0].strip().lower()
+            if mime and not mime.startswith(TEXT_TYPES):
+                metrics.count_skip('content_type')
+                return None
+            chunks = []
+            size = 0
+            while size < max_bytes:
+                chunk = response.read(min(READ_CHUNK, max_bytes - size))
+                if not chunk:
+                    break
+                if not mime and not chunks and b'\x00' in chunk:
+                    metrics.count_skip('binary')
+                    return None
+                chunks.append(chunk)
+                size += len(chunk)
+            # Chunked or length-less bodies only show they go on past the cap when read
+            if size >= max_bytes and response.read(1):
+                metrics.count_skip('truncated')
+    except Exception as e:
+        print(f"Error fetching {url}: {e}")
+        return None
+    charset = 'utf-8'
+    if 'charset=' in content_type:
+        charset = content_type.split('charset=')[-1].split(';')[0].strip().strip('"')
+    try:
+        return b''.join(chunks).decode(charset, errors='ignore')
+    except LookupError:
+        return b''.join(chunks).decode('utf-8', errors='ignore')
+
+def iter_wordpress(base_url):
+    """Yield WordPress posts as each API page arrives."""
     page = 1
     per_page = 100
     while True:
@@ -43,21 +101,33 @@ def fetch_wordpress(base_url):
             if not data:
                 break
             for post in data:
-                all_posts.append({
+                yield {
                     'link': post['link'],
                     'date': post['date'].split('T')[0],
                     'title': post['title']['rendered'],
                     'type': 'wordpress'
-                })
+                }
             if len(data) < per_page:
                 break
             page += 1
         except Exception as e:
             print(f"Error fetching WordPress page {page}: {e}")
+            metrics.count_error('parse')
             break
-    return all_posts
 
-def fetch_quartz(base_url):
+def fetch_wordpress(base_url):
+    return list(iter_wordpress(base_url))
+
+def iter_wordpress_wxr(export_path, texts=None):
+    """Yield the published posts of a WordPress export file; see wordpress_wxr.py."""
+    print(f"Reading WordPress export: {export_path}...")
+    return wordpress_wxr.scan(export_path, texts)
+
+def fetch_wordpress_wxr(export_path, texts=None):
+    return list(iter_wordpress_wxr(export_path, texts))
+
+def iter_quartz(base_url):
+    """Yield Quartz notes from the content index, then any extra ones from the RSS feed."""
     print(f"Fetching Quartz: {base_url}...")
     base_url = base_url.rstrip('/')
     indices = ["/static/contentIndex.json", "/contentIndex.json", "/index.json"]
@@ -66,7 +136,7 @@ def fetch_quartz(base_url):
         content = fetch_url(base_url + idx)
         if content: break
 
-    posts = []
+    seen_links = set()
     if content:
         try:
             data = json.loads(content)
@@ -103,14 +173,16 @@ def fetch_quartz(base_url):
                         created_date = created_date.split('T')[0]
                         link = f"{base_url}/{slug.lstrip('/')}"
                         link = link.replace('https://https://', 'https://')
-                        posts.append({
+                        seen_links.add(link)
+                        yield {
                             'link': link,
                             'date': created_date,
                             'title': title,
                             'type': 'quartz'
-                        })
+                        }
         except Exception as e:
             print(f"Error parsing Quartz index: {e}")
+            metrics.count_error('parse')
 
     print("Fetching Quartz RSS fallback...")
     rss_url = base_url + "/index.xml"
@@ -129,21 +201,32 @@ def fetch_quartz(base_url):
                     if date_match:
                         d = datetime.strptime(date_match.group(0), "%d %b %Y")
                         date_str = d.strftime('%Y-%m-%d')
-                        if not any(p['link'] == link for p in posts):
-                            posts.append({
+                        if link not in seen_links:
+                            seen_links.add(link)
+                            yield {
                                 'link': link,
                                 'date': date_str,
                                 'title': title,
                                 'type': 'quartz'
-                            })
+                            }
                 except Exception as e:
                     print(f"Error parsing RSS item: {e}")
-    return posts
+                    metrics.count_error('parse')
+
+def fetch_quartz(base_url):
+    return list(iter_quartz(base_url))
 
-def fetch_github(username, exclude_repos=None, exclude_forks=False):
+def iter_github(username, exclude_repos=None, exclude_forks=False, history=None, plan_mode='auto', shard=None):
+    """Yield commits repo by repo, then one README entry per repo.
+
+    Commits are listed per repo or found with the commit search, whichever
+    github_plan estimates to be cheaper (`plan_mode` forces one); `history`
+    is the last run from `github_plan.load_history`. With a `shard` (see
+    sharding.py) only the repos of that shard are read.
+    """
     import time
 
-    print(f"Fetching GitHub data for user: {username} (per-repo mode)...")
+    print(f"Fetching GitHub data for user: {username}...")
     token = os.environ.get('GITHUB_TOKEN')
     headers = {'User-Agent': 'Mozilla/5.0'}
     if token:
@@ -151,6 +234,8 @@ def fetch_github(username, exclude_repos=None, exclude_forks=False):
 
     import urllib.error
 
+    request_counts = {'core': 0, 'search': 0}
+
     def request_json(url, accept_header=None, max_rate_wait=3600):
         """Request JSON, retrying on GitHub rate-limit HTTP errors by sleeping until reset.
 
@@ -162,8 +247,10 @@ def fetch_github(username, exclude_repos=None, exclude_forks=False):
             if accept_header:
                 req_headers['Accept'] = accept_header
             req = urllib.request.Request(url, headers=req_headers)
+            if '/rate_limit' not in url:
+                request_counts['search' if '/search/' in url else 'core'] += 1
             try:
-                with urllib.request.urlopen(req, timeout=15) as resp:
+                with resilience.urlopen(req, timeout=15) as resp:
                     text = resp.read().decode('utf-8', errors='ignore')
                     return json.loads(text), resp
             except urllib.error.HTTPError as e:
@@ -181,7 +268,7 @@ def fetch_github(username, exclude_repos=None, exclude_forks=False):
                         wait = max_rate_wait
                     attempts += 1
                     print(f"Rate limit hit (HTTP {e.code}). Sleeping {wait}s (attempt {attempts}) before retrying {url}")
-                    time.sleep(wait)
+                    metrics.rate_limit_sleep(wait)
                     continue
                 else:
                     raise
@@ -211,23 +298,92 @@ def fetch_github(username, exclude_repos=None, exclude_forks=False):
             if remaining <= 1:
                 wait = max(0, reset - int(time.time())) + 1
                 print(f"Rate limit reached, sleeping {wait}s")
-                time.sleep(wait)
+                metrics.rate_limit_sleep(wait)
         except Exception:
             pass
 
+    all_repos = repos
     if exclude_forks or exclude_repos:
         original_count = len(repos)
         repos = [r for r in repos if not (exclude_forks and r.get('fork')) and r.get('name') not in (exclude_repos or []) and r.get('full_name') not in (exclude_repos or [])]
         print(f"Filtered repos: {len(repos)} remaining (from {original_count})")
+    if shard:
+        repos = [r for r in repos if sharding.owns(shard, r.get('full_name') or '')]
+        print(f"Shard {sharding.label(shard)}: {len(repos)} repos")
+
+    # 2) Plan how to fetch the commits: per repo, by commit search or mixed
+    quotas = github_plan.fetch_quotas(request_json, bool(token))
+    fetch_plan = github_plan.plan(username, repos, all_repos, history or {}, quotas, mode=plan_mode)
+    print(fetch_plan.describe())
+    before = dict(request_counts)
 
-    all_entries = []
     repos_latest = {}
+    commits_by_repo = {}
+
+    def commit_entry(repo_name, item):
+        commit_date = item['commit']['author']['date'].split('T')[0]
+        msg = item['commit']['message'].split('\n')[0]
+        if repo_name not in repos_latest or commit_date > repos_latest[repo_name]:
+            repos_latest[repo_name] = commit_date
+        return {
+            'link': item.get('html_url'),
+            'date': commit_date,
+            'title': f"[{repo_name}] {msg}",
+            'type': 'github commit'
+        }
+
+    def search_commits(start, end):
+        """Search results for one committer-date range, split while over the 1000 result cap."""
+        page = 1
+        while True:
+            query = github_plan.search_query(username, fetch_plan.exclusions, start, end)
+            url = (f"https://api.github.com/search/commits?q={urllib.parse.quote(query)}"
+                   f"&sort=committer-date&order=desc&per_page={per_page}&page={page}")
+            data, resp = request_json(url, accept_header='application/vnd.github.cloak-preview+json')
+            total = data.get('total_count', 0)
+            if page == 1 and total > github_plan.SEARCH_MAX_RESULTS and start < end:
+                middle = start + (end - start) // 2
+                yield from search_commits(start, middle)
+                yield from search_commits(middle + timedelta(days=1), end)
+                return
+            items = data.get('items') or []
+            yield from items
+            if len(items) < per_page or page * per_page >= min(total, github_plan.SEARCH_MAX_RESULTS):
+                return
+            page += 1
 
-    # 2) For each repo, list commits by the user
+    # 3) Search commits of the repos the plan does not list; a failed search
+    # falls back to listing them
+    searched = set(fetch_plan.searched)
+    listed = set(fetch_plan.listed)
+    if searched:
+        try:
+            for start, end, _ in fetch_plan.ranges:
+                print(f"  Searching commits {start}..{end}...")
+                for item in search_commits(start, end):
+                    repo_name = (item.get('repository') or {}).get('full_name')
+                    if repo_name in searched:
+                        try:
+                            commits_by_repo.setdefault(repo_name, []).append(commit_entry(repo_name, item))
+                        except Exception:
+                            continue
+        except Exception as e:
+            print(f"    Error searching commits ({e}); listing those repos instead")
+            listed |= searched
+            searched = set()
+            commits_by_repo.clear()
+            repos_latest.clear()
+
+    # 4) For each repo, list commits by the user (or take them from the search)
     for repo in repos:
         repo_name = repo.get('full_name')
         if not repo_name:
             continue
+        if repo_name in searched:
+            yield from commits_by_repo.pop(repo_name, [])
+            continue
+        if repo_name not in listed:
+            continue
         print(f"  Fetching commits for repo: {repo_name}...")
         page = 1
         while True:
@@ -242,18 +398,10 @@ def fetch_github(username, exclude_repos=None, exclude_forks=False):
                 break
             for item in items:
                 try:
-                    commit_date = item['commit']['author']['date'].split('T')[0]
-                    msg = item['commit']['message'].split('\n')[0]
-                    all_entries.append({
-                        'link': item.get('html_url'),
-                        'date': commit_date,
-                        'title': f"[{repo_name}] {msg}",
-                        'type': 'github commit'
-                    })
-                    if repo_name not in repos_latest or commit_date > repos_latest[repo_name]:
-                        repos_latest[repo_name] = commit_date
+                    entry = commit_entry(repo_name, item)
                 except Exception:
                     continue
+                yield entry
 
             if len(items) < per_page:
                 break
@@ -265,11 +413,16 @@ def fetch_github(username, exclude_repos=None, exclude_forks=False):
                 if remaining <= 1:
                     wait = max(0, reset - int(time.time())) + 1
                     print(f"Rate limit reached, sleeping {wait}s")
-                    time.sleep(wait)
+                    metrics.rate_limit_sleep(wait)
             except Exception:
                 pass
 
-    # 3) Add README links for each repo using repo info from listing
+    core = request_counts['core'] - before['core']
+    search = request_counts['search'] - before['search']
+    print(f"GitHub plan '{fetch_plan.name}': estimated {fetch_plan.core + fetch_plan.search} commit requests "
+          f"({fetch_plan.core} core, {fetch_plan.search} search), made {core + search} ({core} core, {search} search)")
+
+    # 5) Add README links for each repo using repo info from listing
     for repo in repos:
         repo_name = repo.get('full_name')
         if not repo_name:
@@ -277,21 +430,42 @@ def fetch_github(username, exclude_repos=None, exclude_forks=False):
         last_date = repos_latest.get(repo_name, repo.get('pushed_at', '')[:10] if repo.get('pushed_at') else '')
         default_branch = repo.get('default_branch', 'main')
         readme_link = f"https://github.com/{repo_name}/blob/{default_branch}/README.md"
-        all_entries.append({
+        yield {
             'link': readme_link,
             'date': last_date,
             'title': f"[{repo_name}] README.md",
             'type': 'github readme'
-        })
-
-    return all_entries
-
-def fetch_legacy_html(base_url, exclude_paths=None):
+        }
+
+def fetch_github(username, exclude_repos=None, exclude_forks=False, history=None, plan_mode='auto', shard=None):
+    return list(iter_github(username, exclude_repos, exclude_forks, history, plan_mode, shard))
+
+def read_previous_entries(path):
+    """{link: (date, title)} of an existing sources CSV; empty if there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return {row['Link']: (row['Date'], row['Title']) for row in csv.DictReader(f)}
+
+def iter_legacy_html(base_url, exclude_paths=None, discovery='auto', max_bytes=MAX_PAGE_BYTES, shard=None,
+                     data_dir=None):
+    """Yield dated pages of a legacy site while crawling it.
+
+    Pages listed in a sitemap or feed (see site_discovery) come first. Feed
+    items carry their publication date and are not fetched. Sitemap pages
+    are fetched and dated like crawled ones, unless their `lastmod` is the
+    one recorded in `data_dir` by the last run: then the page keeps its row
+    of the previous sources CSV. With a sitemap the crawl follows no links;
+    with feeds it fills in the pages they do not list. `discovery='crawl'`
+    follows links only. Each page is read up to `max_bytes` (see fetch_page).
+    With a `shard` (see sharding.py) only the subtrees of that shard (the
+    first path segment below `base_url`) are crawled; every shard reads the
+    start page for its links.
+    """
     print(f"Fetching Legacy HTML: {base_url}...")
     base_url = base_url.rstrip('/') + '/'
     to_visit = [base_url]
     visited = set()
-    posts = []
     seen_links = set()
 
     # Only allow these text-like extensions; directories (paths ending with '/') are allowed
@@ -306,17 +480,92 @@ def fetch_legacy_html(base_url, exclude_paths=None):
         (r'\b(\d{1,2}\. [A-Z][a-z]+ \d{4})\b', '%d. %B %Y')
     ]
 
-    while to_visit and len(visited) < 800:
+    def is_excluded(url):
+        return bool(exclude_paths) and any(url.startswith(ex) for ex in exclude_paths)
+
+    def is_owned(url):
+        return sharding.owns(shard, url[len(base_url):].split('/', 1)[0])
+
+    def is_post(url):
+        if url.endswith(('index.html', 'navigator.html', 'rechts.html')):
+            return False
+        # normalize and filter by extension to include only text files
+        parsed = urllib.parse.urlparse(url)
+        path = parsed.path or ''
+        if path.endswith('/'):
+            return True
+        ext = os.path.splitext(path)[1].lower()
+        if not ext or ext in blacklist_exts:
+            return False
+        return ext in allowed_text_exts
+
+    def post(url, date_str, title):
+        norm = url.rstrip('/').lower()
+        if norm in seen_links:
+            return None
+        seen_links.add(norm)
+        print(".", end='', flush=True)
+        return {
+            'link': url,
+            'date': date_str,
+            'title': title,
+            'type': 'legacy_html'
+        }
+
+    listed = set()
+    complete = False
+    lastmods = {}       # url -> {'lastmod', 'post'} of this run, for the next one
+    pending = {}        # url -> lastmod of the sitemap pages to fetch
+    if discovery != 'crawl':
+        found = site_discovery.discover(base_url)
+        print(found.summary())
+        complete = found.complete
+        if complete:
+            to_visit = []
+        data_dir = data_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+        lastmods_file = site_discovery.lastmods_path(data_dir, base_url)
+        known = site_discovery.load_lastmods(lastmods_file)
+        previous = read_previous_entries(os.path.join(data_dir, "sources_legacy_html.csv"))
+        unchanged = 0
+        for url in sorted(found.pages):
+            page = found.pages[url]
+            url = url.split('#')[0]
+            if not url.startswith(base_url) or is_excluded(url) or not is_post(url) or not is_owned(url):
+                continue
+            record = known.get(url)
+            if page['date']:
+                # A feed item, with its publication date: no need to fetch the page
+                listed.add(url)
+                entry = post(url, page['date'], page['title'] or url.rstrip('/').split('/')[-1])
+                if entry:
+                    yield entry
+            elif (page['lastmod'] and record and record['lastmod'] == page['lastmod']
+                  and (not record['post'] or url in previous)):
+                # Unchanged since the last run: keep its previous entry, if it was one
+                listed.add(url)
+                lastmods[url] = record
+                unchanged += 1
+                if record['post']:
+                    entry = post(url, *previous[url])
+                    if entry:
+                        yield entry
+            else:
+                pending[url] = page['lastmod']
+                to_visit.append(url)
+        if pending or unchanged:
+            print(f"Sitemap pages: {len(pending)} to fetch, {unchanged} unchanged")
+
+    while to_visit and len(visited) < 800 + len(pending):
         url = to_visit.pop(0)
         url_no_frag = url.split('#')[0]
-        if url_no_frag in visited: continue
+        if url_no_frag in visited or url_no_frag in listed: continue
 
-        if exclude_paths and any(url_no_frag.startswith(ex) for ex in exclude_paths):
+        if is_excluded(url_no_frag) or (url_no_frag != base_url and not is_owned(url_no_frag)):
             continue
 
         visited.add(url_no_frag)
 
-        content = fetch_url(url_no_frag)
+        content = fetch_page(url_no_frag, max_bytes)
         if not content: continue
 
         found_date_str = None
@@ -336,43 +585,48 @@ def fetch_legacy_html(base_url, exclude_paths=None):
         title = re.sub('<[^<]+?>', '', title).strip()
         title = html.unescape(title)
 
-        if found_date_str and not url_no_frag.endswith(('index.html', 'navigator.html', 'rechts.html')):
-            # normalize and filter by extension to include only text files
-            parsed = urllib.parse.urlparse(url_no_frag)
-            path = parsed.path or ''
-            if path.endswith('/'):
-                allow_post = True
-            else:
-                ext = os.path.splitext(path)[1].lower()
-                if not ext:
-                    allow_post = False
-                elif ext in blacklist_exts:
-                    allow_post = False
-                else:
-                    allow_post = ext in allowed_text_exts
-
-            if allow_post:
-                norm = url_no_frag.rstrip('/').lower()
-                if norm not in seen_links:
-                    seen_links.add(norm)
-                    posts.append({
-                        'link': url_no_frag,
-                        'date': found_date_str,
-                        'title': title,
-                        'type': 'legacy_html'
-                    })
-                    print(".", end='', flush=True)
+        is_entry = bool(found_date_str and is_post(url_no_frag) and is_owned(url_no_frag))
+        if pending.get(url_no_frag):
+            lastmods[url_no_frag] = {'lastmod': pending[url_no_frag], 'post': is_entry}
+        if is_entry:
+            entry = post(url_no_frag, found_date_str, title)
+            if entry:
+                yield entry
 
+        if complete:
+            # The sitemap lists every page
+            continue
         links = re.findall(r'href=["\'](.*?)["\']', content)
         for link in links:
             abs_link = urllib.parse.urljoin(url_no_frag, link).split('#')[0]
-            if abs_link.startswith(base_url) and abs_link not in visited:
+            if abs_link.startswith(base_url) and abs_link not in visited and abs_link not in listed:
                 # continue crawling directories and HTML-like pages; skip common binary/media files
                 lower = abs_link.lower()
                 if not lower.endswith(('.jpg', '.jpeg', '.png', '.gif', '.pdf', '.zip', '.doc', '.css', '.js', '.exe', '.class', '.java', '.cpp', '.bin', '.o', '.so', '.dll')):
                     to_visit.append(abs_link)
 
-    return posts
+    if complete:
+        site_discovery.save_lastmods(lastmods_file, lastmods)
+
+def fetch_legacy_html(base_url, exclude_paths=None, discovery='auto', max_bytes=MAX_PAGE_BYTES, shard=None,
+                      data_dir=None):
+    return list(iter_legacy_html(base_url, exclude_paths, discovery, max_bytes, shard, data_dir))
+
+def iter_local_markdown(vault_dir, base_url=None, exclude_paths=None, manifest=None):
+    """Yield the notes of a local vault; see local_vault.py."""
+    print(f"Scanning vault: {vault_dir}...")
+    return local_vault.scan(vault_dir, base_url, exclude_paths, manifest)
+
+def fetch_local_markdown(vault_dir, base_url=None, exclude_paths=None, manifest=None):
+    return list(iter_local_markdown(vault_dir, base_url, exclude_paths, manifest))
+
+def iter_git_local(clones_dir, username, authors=None, exclude_repos=None, workers=git_local.DEFAULT_WORKERS, shard=None):
+    """Yield the GitHub entries of the local clones in `clones_dir`; see git_local.py."""
+    print(f"Reading GitHub commits of {username} from clones in {clones_dir}...")
+    return git_local.scan(clones_dir, username, authors, exclude_repos, workers, shard)
+
+def fetch_git_local(clones_dir, username, authors=None, exclude_repos=None, workers=git_local.DEFAULT_WORKERS, shard=None):
+    return list(iter_git_local(clones_dir, username, authors, exclude_repos, workers, shard))
 
 def save_to_csv(data, filename):
     # Delegate to save_to_csv_with_dir with the repo-root data directory
@@ -398,6 +652,69 @@ def save_to_csv_with_dir(data, filename, data_dir=None):
             })
     print(f"Saved {len(data)} entries to {filepath}")
 
+def iter_source(source, data_dir=None):
+    """Yield the entries of one `sources.json` entry as they are discovered.
+
+    `data_dir` holds the previous run, which the GitHub fetch planner uses.
+    """
+    type_name = source['type']
+    if type_name == 'wordpress':
+        return iter_wordpress(source['url'])
+    elif type_name == 'wordpress_wxr':
+        return iter_wordpress_wxr(source['url'], texts=wordpress_wxr.texts_path(data_dir, source.get('name', type_name)))
+    elif type_name == 'quartz':
+        return iter_quartz(source['url'])
+    elif type_name == 'legacy_html':
+        return iter_legacy_html(source['url'], exclude_paths=source.get('exclude'), discovery=source.get('discovery', 'auto'),
+                                max_bytes=source.get('max_bytes', MAX_PAGE_BYTES), shard=source.get('shard'),
+                                data_dir=data_dir)
+    elif type_name == 'github' and source.get('clones'):
+        return iter_git_local(source['clones'], source['url'], authors=source.get('authors'),
+                              exclude_repos=source.get('exclude'),
+                              workers=source.get('concurrency') or git_local.DEFAULT_WORKERS, shard=source.get('shard'))
+    elif type_name == 'github':
+        history = github_plan.load_history(data_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+        return iter_github(source['url'], exclude_repos=source.get('exclude'), exclude_forks=source.get('exclude_forks', False),
+                           history=history, plan_mode=source.get('plan', 'auto'), shard=source.get('shard'))
+    elif type_name == 'local_markdown':
+        manifest = local_vault.manifest_path(data_dir, source.get('name', type_name))
+        return iter_local_markdown(source['url'], base_url=source.get('publish_url'),
+                                   exclude_paths=source.get('exclude'), manifest=manifest)
+    return iter(())
+
+
+def fetch_source(source, data_dir=None):
+    """Fetch the entry list of one `sources.json` entry."""
+    return list(iter_source(source, data_dir))
+
+
+def create_sources(type_name, sources_of_type, data_dir, conn=None, progress=None, label=None):
+    """Fetch all sources of one type and write `sources_<type>.csv` (or the database).
+
+    Entries are counted on `progress` under `label` as they arrive.
+    """
+    all_data_of_type = []
+    for source in sources_of_type:
+        name = source.get('name', type_name)
+        print(f"\n--- Processing source: {name} ({source['url']}) ---")
+        data = []
+        with metrics.timer('create_sources', name), profiling.phase(f"fetch {type_name}"):
+            for item in iter_source(source, data_dir):
+                data.append(item)
+                if progress is not None:
+                    progress.add(label)
+        metrics.add_rows('create_sources', name, len(data))
+        all_data_of_type.extend(data)
+
+    with profiling.phase('write sources'):
+        if conn is not None:
+            changed = diary_db.upsert_entries(conn, type_name, all_data_of_type)
+            print(f"Stored {len(all_data_of_type)} {type_name} entries in the database ({changed} rows changed)")
+        else:
+            save_to_csv_with_dir(all_data_of_type, f"sources_{type_name}.csv", data_dir)
+    return all_data_of_type
+
+
 def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     # place data directory at the repository root (same level as `scripts`)
@@ -408,6 +725,9 @@ def main():
     with open(sources_file, "r") as f:
         sources = json.load(f)
 
+    profiling.setup('create_sources', sys.argv[1:], data_dir)
+    db_path = diary_db.path_from_args(sys.argv[1:], data_dir)
+
     # CLI arg handling: if called with 'all', process all sources
     selected_sources = []
     if len(sys.argv) > 1:
@@ -420,6 +740,10 @@ def main():
                 if name in args:
                     selected_sources.append(source)
 
+    if not selected_sources and not sys.stdin.isatty():
+        # No terminal for the menu (cron, CI, pipes): process everything
+        selected_sources = sources
+
     if not selected_sources:
         # Multi-selection menu
         indices = interactive_selection(sources, title="Select source(s) to fetch (Space to toggle, Enter to confirm)")
@@ -436,24 +760,25 @@ def main():
             sources_by_type[t] = []
         sources_by_type[t].append(source)
 
+    # Each type hits its own hosts and writes its own file: run them side by side
+    def job(type_name, sources_of_type, label):
+        def run(progress):
+            conn = diary_db.connect(db_path) if db_path else None
+            try:
+                return create_sources(type_name, sources_of_type, data_dir, conn, progress, label)
+            finally:
+                if conn is not None:
+                    conn.close()
+        return run
+
+    jobs = {}
     for type_name, sources_of_type in sources_by_type.items():
-        all_data_of_type = []
-        for source in sources_of_type:
-            name = source.get('name', type_name)
-            print(f"\n--- Processing source: {name} ({source['url']}) ---")
-            data = []
-            if type_name == 'wordpress':
-                data = fetch_wordpress(source['url'])
-            elif type_name == 'quartz':
-                data = fetch_quartz(source['url'])
-            elif type_name == 'legacy_html':
-                data = fetch_legacy_html(source['url'], exclude_paths=source.get('exclude'))
-            elif type_name == 'github':
-                data = fetch_github(source['url'], exclude_repos=source.get('exclude'), exclude_forks=source.get('exclude_forks', False))
-
-            all_data_of_type.extend(data)
-
-        save_to_csv_with_dir(all_data_of_type, f"sources_{type_name}.csv", data_dir)
+        label = ', '.join(s.get('name', type_name) for s in sources_of_type)
+        jobs[label] = job(type_name, sources_of_type, label)
+    try:
+        scheduler.run_all(jobs, sequential='--sequential' in sys.argv[1:])
+    finally:
+        metrics.write_report('create_sources', data_dir)
 
 
 def _getch():
@@ -6,6 +6,15 @@ import csv
 import html
 import sys
 import platform
+from concurrent.futures import ThreadPoolExecutor
+
+import content_store
+import diary_db
+import metrics
+import profiling
+import resilience
+import scheduler
+import side_texts
 
 try:
     import msvcrt
@@ -32,7 +41,7 @@ def fetch_url(url):
     """Fetch content from URL and decode using appropriate encoding."""
     try:
         req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with resilience.urlopen(req, timeout=10) as response:
             encoding = get_encoding(response)
             raw_data = response.read()
             try:
@@ -77,7 +86,7 @@ def fetch_github_content(link, source_type):
                 headers['Authorization'] = f'token {token}'
             try:
                 req = urllib.request.Request(api_url, headers=headers)
-                with urllib.request.urlopen(req, timeout=10) as response:
+                with resilience.urlopen(req, timeout=10) as response:
                     # Check for rate limiting in headers if possible
                     remaining = response.headers.get('X-RateLimit-Remaining')
                     if remaining and int(remaining) == 0:
@@ -100,8 +109,70 @@ def fetch_github_content(link, source_type):
         return strip_html(content)
     return ""
 
-def process_csv(source_type, data_dir):
-    """Read sources CSV and generate content CSV."""
+def extract_content(link, row_type, title, source_type, data_dir=None, texts=None):
+    """Plain-text content of one entry from stage 1.
+
+    `data_dir` holds stage 1's side files, read through `texts` (a
+    side_texts.SideTexts shared by the entries of a run).
+    """
+    content = ""
+    if source_type in ['wordpress', 'quartz', 'legacy_html']:
+        raw_content = fetch_url(link)
+        content = strip_html(raw_content)
+    elif source_type == 'github':
+        if row_type == 'github commit':
+            # Use commit message from title to avoid API rate limiting
+            # Title format: "[repo] message"
+            content = re.sub(r'^\[.*?\]\s*', '', title)
+        else:
+            content = fetch_github_content(link, row_type)
+    elif source_type in side_texts.SIDE_FILES:
+        # Read from disk by stage 1, which saved the text next to its CSV
+        content = (texts or side_texts.SideTexts()).text(source_type, link, data_dir)
+    return content
+
+def extract_all(rows, source_type, workers=1, progress=None, label=None, data_dir=None):
+    """Yield (link, content) for (link, type, title) rows, in order, with up to `workers` fetches in flight."""
+    texts = side_texts.SideTexts()
+
+    def extract(row):
+        link, row_type, title = row
+        print(f"  Processing {link}...")
+        content = extract_content(link, row_type, title, source_type, data_dir, texts)
+        if progress is not None:
+            progress.add(label)
+        return link, content
+
+    if workers <= 1:
+        yield from map(extract, rows)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(extract, rows)
+
+def process_db(source_type, conn, workers=1, progress=None, label=None):
+    """Fetch the content of new and changed stage 1 entries into the database."""
+    rows = list(diary_db.iter_stale_entries(conn, source_type))
+    if not rows:
+        print(f"No new or changed {source_type} entries in the database.")
+        return
+
+    print(f"Processing {len(rows)} {source_type} entries from the database...")
+    if progress is not None:
+        progress.set_total(label, len(rows))
+    batch = []
+    changed = 0
+    with metrics.timer('parse_sources', source_type), profiling.phase('fetch and extract'):
+        for link, content in extract_all(rows, source_type, workers, progress, label):
+            batch.append((link, content))
+            if len(batch) >= 100:
+                changed += diary_db.upsert_content(conn, source_type, batch)
+                batch = []
+        changed += diary_db.upsert_content(conn, source_type, batch)
+    metrics.add_rows('parse_sources', source_type, len(rows))
+    print(f"Stored content for {source_type} ({changed} rows changed)")
+
+def process_csv(source_type, data_dir, use_store=False, workers=1, progress=None, label=None):
+    """Read sources CSV and generate content CSV (or a compressed content store)."""
     input_file = os.path.join(data_dir, f"sources_{source_type}.csv")
     output_file = os.path.join(data_dir, f"content_{source_type}.csv")
 
@@ -110,33 +181,25 @@ def process_csv(source_type, data_dir):
         return
 
     print(f"Processing {input_file}...")
-    results = []
     with open(input_file, 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            link = row['Link']
-            row_type = row['Type']
-            title = row.get('Title', '')
-
-            print(f"  Processing {link}...")
-            content = ""
-            if source_type in ['wordpress', 'quartz', 'legacy_html']:
-                raw_content = fetch_url(link)
-                content = strip_html(raw_content)
-            elif source_type == 'github':
-                if row_type == 'github commit':
-                    # Use commit message from title to avoid API rate limiting
-                    # Title format: "[repo] message"
-                    content = re.sub(r'^\[.*?\]\s*', '', title)
-                else:
-                    content = fetch_github_content(link, row_type)
+        rows = [(row['Link'], row['Type'], row.get('Title', '')) for row in csv.DictReader(csvfile)]
+    if progress is not None:
+        progress.set_total(label, len(rows))
+    results = []
+    with metrics.timer('parse_sources', source_type), profiling.phase('fetch and extract'):
+        for link, content in extract_all(rows, source_type, workers, progress, label, data_dir):
+            results.append({'Link': link, 'Content': content})
+    metrics.add_rows('parse_sources', source_type, len(results))
 
-            results.append({
-                'Link': link,
-                'Content': content
-            })
+    if use_store:
+        output_file = content_store.store_path(data_dir, source_type)
+        with profiling.phase('write content store'):
+            n, raw_size, stored_size = content_store.write_store(
+                output_file, ((row['Link'], row['Content']) for row in results))
+        print(f"Saved {n} entries to {output_file} ({raw_size} -> {stored_size} bytes)")
+        return
 
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+    with profiling.phase('write content'), open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
         fieldnames = ['Link', 'Content']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
@@ -243,6 +306,10 @@ def main():
                 if name in args:
                     selected_sources.append(source)
 
+    if not selected_sources and not sys.stdin.isatty():
+        # No terminal for the menu (cron, CI, pipes): process everything
+        selected_sources = sources
+
     if not selected_sources:
         # Multi-selection menu
         indices = interactive_selection(sources, title="Select source(s) to parse (Space to toggle, Enter to confirm)")
@@ -251,10 +318,32 @@ def main():
             return
         selected_sources = [sources[i] for i in indices]
 
-    # Identify unique types to process
-    types_to_process = set(s['type'] for s in selected_sources)
-    for source_type in types_to_process:
-        process_csv(source_type, data_dir)
+    profiling.setup('parse_sources', sys.argv[1:], data_dir)
+    # Identify unique types to process, each with its own fetch budget
+    sources_by_type = {}
+    for source in selected_sources:
+        sources_by_type.setdefault(source['type'], []).append(source)
+    db_path = diary_db.path_from_args(sys.argv[1:], data_dir)
+    use_store = '--store' in sys.argv[1:]
+
+    def job(source_type, workers):
+        def run(progress):
+            if db_path:
+                conn = diary_db.connect(db_path)
+                try:
+                    process_db(source_type, conn, workers, progress, source_type)
+                finally:
+                    conn.close()
+            else:
+                process_csv(source_type, data_dir, use_store, workers, progress, source_type)
+        return run
+
+    jobs = {source_type: job(source_type, scheduler.concurrency(sources_of_type))
+            for source_type, sources_of_type in sources_by_type.items()}
+    try:
+        scheduler.run_all(jobs, sequential='--sequential' in sys.argv[1:])
+    finally:
+        metrics.write_report('parse_sources', data_dir)
 
 if __name__ == "__main__":
     main()
@@ -4,6 +4,11 @@ import re
 import sys
 import json
 
+import content_store
+import diary_db
+import metrics
+import profiling
+
 # Increase the CSV field size limit for large content
 csv.field_size_limit(sys.maxsize)
 
@@ -13,10 +18,24 @@ def count_words(text):
     words = re.findall(r'\w+', text)
     return len(words)
 
-def process_statistics(source_type, data_dir):
+def iter_content(content_file):
+    """(link, content) pairs from a content CSV or a compressed content store."""
+    if content_file.endswith('.dcs'):
+        with content_store.ContentStore(content_file) as store:
+            yield from store.items()
+        return
+    with open(content_file, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield row['Link'], row['Content']
+
+def process_statistics(source_type, data_dir, use_store=False):
     os.makedirs(data_dir, exist_ok=True)
     sources_file = os.path.join(data_dir, f"sources_{source_type}.csv")
-    content_file = os.path.join(data_dir, f"content_{source_type}.csv")
+    if use_store:
+        content_file = content_store.store_path(data_dir, source_type)
+    else:
+        content_file = os.path.join(data_dir, f"content_{source_type}.csv")
     output_file = os.path.join(data_dir, f"statistics_{source_type}.csv")
 
     if not os.path.exists(sources_file) or not os.path.exists(content_file):
@@ -25,39 +44,37 @@ def process_statistics(source_type, data_dir):
 
     print(f"Calculating statistics for {source_type}...")
 
-    # Load word/char counts from content file
-    counts = {}
-    with open(content_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            text = row['Content']
-            counts[row['Link']] = {
-                'word_count': count_words(text),
-                'char_count': len(text) if text else 0
-            }
-
-    results = []
-    with open(sources_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            link = row['Link']
-            stats = counts.get(link, {'word_count': 0, 'char_count': 0})
-            results.append({
-                'Link': link,
-                'Date': row['Date'],
-                'Title': row['Title'],
-                'Word Count': stats['word_count'],
-                'Character Count': stats['char_count']
-            })
+    rows = 0
+    with metrics.timer('parse_content', source_type):
+        # Load word/char counts from content file
+        profiling.switch('count words')
+        counts = {}
+        for link, text in iter_content(content_file):
+            counts[link] = (count_words(text), len(text) if text else 0)
 
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ['Link', 'Date', 'Title', 'Word Count', 'Character Count']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in results:
-            writer.writerow(row)
+        profiling.switch('write statistics')
+        # Dates are copied as they are: one that parse_day cannot read must not be lost here
+        with open(sources_file, 'r', encoding='utf-8', newline='') as src, \
+                open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Link', 'Date', 'Title', 'Word Count', 'Character Count'])
+            for row in csv.DictReader(src):
+                word_count, character_count = counts.get(row['Link'], (0, 0))
+                writer.writerow([row['Link'], row['Date'], row['Title'], word_count, character_count])
+                rows += 1
+        profiling.switch(None)
+    metrics.add_rows('parse_content', source_type, rows)
     print(f"Saved to {output_file}")
 
+def process_statistics_db(source_type, conn):
+    """Recompute stats only for entries whose content changed since the last run."""
+    with metrics.timer('parse_content', source_type), profiling.phase('count words'):
+        rows = [(link, count_words(text), len(text), revision)
+                for link, text, revision in diary_db.iter_stale_content(conn, source_type)]
+        changed = diary_db.upsert_stats(conn, source_type, rows)
+    metrics.add_rows('parse_content', source_type, len(rows))
+    print(f"Statistics for {source_type}: {changed} rows updated")
+
 def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(os.path.dirname(script_dir), "data")
@@ -67,8 +84,18 @@ def main():
         sources_data = json.load(f)
 
     sources = list(set(s['type'] for s in sources_data))
-    for source in sources:
-        process_statistics(source, data_dir)
+    profiling.setup('parse_content', sys.argv[1:], data_dir)
+    db_path = diary_db.path_from_args(sys.argv[1:], data_dir)
+    if db_path:
+        conn = diary_db.connect(db_path)
+        for source in sources:
+            process_statistics_db(source, conn)
+        conn.close()
+    else:
+        use_store = '--store' in sys.argv[1:]
+        for source in sources:
+            process_statistics(source, data_dir, use_store)
+    metrics.write_report('parse_content', data_dir)
 
 if __name__ == "__main__":
     main()
@@ -1,28 +1,40 @@
-import json
+import heapq
 import re
 from datetime import datetime, date, timedelta
 import math
 import os
 import xml.sax.saxutils as saxutils
-import csv
 import sys
 
+import diary_data
+import diary_db
+import metrics
+import profiling
+import term_stats
+
+try:
+    import heatmap_cube
+    import rollups
+except ImportError:
+    heatmap_cube = None
+    rollups = None
+
 sys.stdout.reconfigure(encoding='utf-8')
 
-def generate_svg(year, data_by_date, source_config):
-    start_date = date(year, 1, 1)
-    end_date = date(year, 12, 31)
-    first_sunday = start_date - timedelta(days=(start_date.weekday() + 1) % 7)
+def render_calendar(start_date, end_date, cell, source_config):
+    """Render the days `start_date`..`end_date` as an SVG calendar, one column per week.
 
-    # Calculate max count for the year for intensity reset
-    max_count = 0
-    for d, entries in data_by_date.items():
-        if d.startswith(str(year)):
-            max_count = max(max_count, len(entries))
+    `cell(day)` returns (entries, level, source_type, mixed_str) for a
+    `datetime.date`: the Entry records listed in the tooltip (the first one
+    is linked), the intensity level 1-4, the source whose colours are used
+    and an optional per-source breakdown for the tooltip.
+    """
+    first_sunday = start_date - timedelta(days=(start_date.weekday() + 1) % 7)
+    weeks = (end_date - first_sunday).days // 7 + 1
 
     square_size = 10
     square_margin = 2
-    width = 53 * (square_size + square_margin) + 40
+    width = weeks * (square_size + square_margin) + 40
     height = 7 * (square_size + square_margin) + 40
 
     svg_parts = [f'<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg" style="background-color: white;">']
@@ -35,8 +47,8 @@ def generate_svg(year, data_by_date, source_config):
     months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
     last_month = -1
     curr = first_sunday
-    for week in range(53):
-        if curr.year == year and curr.month != last_month:
+    for week in range(weeks):
+        if curr >= start_date and curr.month != last_month:
             x = week * (square_size + square_margin) + 30
             svg_parts.append(f'<text x="{x}" y="12" font-family="sans-serif" font-size="8" fill="#767676">{months[curr.month-1]}</text>')
             last_month = curr.month
@@ -45,26 +57,22 @@ def generate_svg(year, data_by_date, source_config):
             if curr > end_date: break
             if curr >= start_date:
                 date_str = curr.strftime('%Y-%m-%d')
-                entries = data_by_date.get(date_str, [])
+                entries, level, source_type, mixed_str = cell(curr)
                 count = len(entries)
                 color = "#ebedf0"
-                if count > 0:
-                    # Intensity level relative to max_count
-                    level = math.ceil((count / max_count) * 4) if max_count > 0 else 1
-                    source_type = entries[0].get('source_type', 'wordpress')
-
-                    if source_type in source_config:
-                        colors = source_config[source_type]['colors']
-                        color = colors[min(level - 1, len(colors) - 1)]
+                if count > 0 and source_type in source_config:
+                    colors = source_config[source_type]['colors']
+                    color = colors[min(level - 1, len(colors) - 1)]
                 x = week * (square_size + square_margin) + 30
                 y = day * (square_size + square_margin) + 18
                 tooltip = f"{date_str}: {count} entry" if count == 1 else f"{date_str}: {count} entries"
+                tooltip += mixed_str
                 if count > 0:
-                    tooltip += "\n" + "\n".join([e['title'] for e in entries])
+                    tooltip += "\n" + "\n".join([e.title for e in entries])
                 tooltip = saxutils.escape(tooltip).replace('{', '&#123;').replace('}', '&#125;')
                 rect = f'<rect x="{x}" y="{y}" width="{square_size}" height="{square_size}" fill="{color}" rx="2" ry="2"><title>{tooltip}</title></rect>'
                 if count > 0:
-                    link = saxutils.quoteattr(entries[0]["link"])
+                    link = saxutils.quoteattr(entries[0].link)
                     svg_parts.append(f'<a href={link}>{rect}</a>')
                 else:
                     svg_parts.append(rect)
@@ -85,77 +93,110 @@ def generate_svg(year, data_by_date, source_config):
     svg_parts.append('</svg>')
     return "\n".join(svg_parts)
 
-def main():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(os.path.dirname(script_dir), "data")
-
-    sources_file = os.path.join(script_dir, "sources.json")
-    with open(sources_file, 'r', encoding='utf-8') as f:
-        sources_data_json = json.load(f)
+def generate_svg(year, data_by_date, source_config, cube=None, levels=None):
+    """Render one calendar year as an SVG heatmap.
 
-    source_config = {}
-    for s in sources_data_json:
-        source_config[s['type']] = {
-            'name': s.get('name', s['type']),
-            'colors': s.get('colors', ["#9be9a8", "#40c463", "#30a14e", "#216e39"])
-        }
+    `data_by_date` maps day ordinals to lists of Entry records. With a `cube`
+    (and its precomputed `levels`) the colour of each cell is a lookup of the
+    day's level and dominant source; without one the level is derived from
+    `data_by_date` and the first entry's source.
+    """
+    start_date = date(year, 1, 1)
+    end_date = date(year, 12, 31)
 
-    all_data = []
+    max_count = 0
+    if cube is None:
+        # Calculate max count for the year for intensity reset
+        first, last = start_date.toordinal(), end_date.toordinal()
+        for d, entries in data_by_date.items():
+            if first <= d <= last:
+                max_count = max(max_count, len(entries))
+
+    def cell(day):
+        entries = data_by_date.get(day.toordinal(), [])
+        count = len(entries)
+        if count == 0:
+            return entries, 0, None, ""
+        mixed_str = ""
+        if cube is not None:
+            row = cube.index(day)
+            level = int(levels[row])
+            source_type = cube.source_types[cube.dominant[row]]
+            if cube.mixed[row]:
+                per_source = [f"{n} {source_config.get(st, {}).get('name', st)}"
+                              for st, n in zip(cube.source_types, cube.counts[row]) if n]
+                mixed_str = f" ({', '.join(per_source)})"
+            entries = sorted(entries, key=lambda e: e.source_type != source_type)
+        else:
+            # Intensity level relative to max_count
+            level = math.ceil((count / max_count) * 4) if max_count > 0 else 1
+            source_type = entries[0].source_type
+        return entries, level, source_type, mixed_str
+
+    return render_calendar(start_date, end_date, cell, source_config)
+
+def _markdown_bold_to_html(text):
+    return re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', saxutils.escape(text))
+
+def generate_reports(all_data, source_config, docs_dir, weight='entries', scale='linear', year_counts=None,
+                     years=None, terms=None):
+    """Write the yearly SVGs, docs/index.html and the stats section of docs/README.md.
+
+    `all_data` is a list of Entry records. `year_counts` optionally supplies
+    per-year source counts that were already aggregated (e.g. in SQL).
+    With `years`, only the SVGs of those years are rendered again; the
+    other years reuse their file in docs/assets if it exists (intensity
+    levels are relative to each year, so they cannot have changed as long
+    as `weight` and `scale` are those the file was rendered with).
+    `terms` is the terms.json document of term_stats.py; with it, each
+    year lists its most frequent terms.
+    """
+    profiling.switch('index')
     sources = list(source_config.keys())
-
-    for st in sources:
-        stats_file = os.path.join(data_dir, f"statistics_{st}.csv")
-        if not os.path.exists(stats_file):
-            continue
-        with open(stats_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                all_data.append({
-                    'link': row['Link'],
-                    'date': row['Date'],
-                    'title': row['Title'],
-                    'word_count': int(row['Word Count']),
-                    'character_count': int(row['Character Count']),
-                    'source_type': st
-                })
-
-    # Deduplicate by link (though they should already be mostly unique)
-    unique_data = []
-    seen_links = set()
-    for item in all_data:
-        if item['link'] not in seen_links:
-            seen_links.add(item['link'])
-            unique_data.append(item)
-    all_data = unique_data
-
     data_by_date = {}
     total_words = 0
     for item in all_data:
-        d = item['date']
+        d = item.day
         if d not in data_by_date: data_by_date[d] = []
         data_by_date[d].append(item)
-        total_words += item['word_count']
+        total_words += item.word_count
 
     total_articles = len(all_data)
     days_covered = len(data_by_date)
     reading_time_total_minutes = math.ceil(total_words / 200)
     reading_time_str = f"{reading_time_total_minutes // 60}h {reading_time_total_minutes % 60}m"
 
-    dates = sorted(data_by_date.keys())
+    cube = None
+    levels = None
+    rollup = None
+    if heatmap_cube is not None:
+        cube = heatmap_cube.build_cube(
+            [item.day for item in all_data],
+            [item.word_count for item in all_data],
+            [item.source_type for item in all_data],
+            sources)
+        levels = cube.levels(weight=weight, scale=scale)
+        rollup = rollups.Rollups(cube, all_data)
+    elif weight != 'entries' or scale != 'linear':
+        print("NumPy not available; ignoring --words/--quantile.")
+
     start_year = 2006
-    if dates:
-        valid_years = [int(d.split('-')[0]) for d in dates if 1970 <= int(d.split('-')[0]) <= 2026]
-        if valid_years:
-            start_year = min(start_year, min(valid_years))
+    if cube is not None:
+        valid_years = cube.valid_years(1970, 2026)
+    else:
+        data_years = {date.fromordinal(d).year for d in data_by_date if d}
+        valid_years = [y for y in data_years if 1970 <= y <= 2026]
+    if valid_years:
+        start_year = min(start_year, min(valid_years))
     end_year = 2026
 
-    assets_dir = os.path.join(os.path.dirname(script_dir), "docs", "assets")
+    assets_dir = os.path.join(docs_dir, "assets")
     os.makedirs(assets_dir, exist_ok=True)
 
     # Source breakdown for whole period
     sources_data = {}
     for item in all_data:
-        st = item['source_type']
+        st = item.source_type
         if st not in sources_data: sources_data[st] = []
         sources_data[st].append(item)
 
@@ -181,21 +222,32 @@ def main():
 
     source_names = {st: config['name'] for st, config in source_config.items()}
 
+    profiling.switch('render SVG')
     for year in range(end_year, start_year - 1, -1):
-        year_data = [item for d, entries in data_by_date.items() if d.startswith(str(year)) for item in entries]
-        year_entries = len(year_data)
+        if year_counts is not None:
+            year_breakdown = year_counts.get(year, {})
+            year_entries = sum(year_breakdown.values())
+        elif cube is not None:
+            year_entries = cube.year_total(year)
+            year_breakdown = cube.year_counts_by_source(year)
+        else:
+            year_data = [item for d, entries in data_by_date.items() if d and date.fromordinal(d).year == year for item in entries]
+            year_entries = len(year_data)
+            year_breakdown = {}
+            for item in year_data:
+                st = item.source_type
+                year_breakdown[st] = year_breakdown.get(st, 0) + 1
         if year_entries == 0: continue
 
-        svg_content = generate_svg(year, data_by_date, source_config)
         svg_filename = f"activity_{year}.svg"
         svg_path = os.path.join(assets_dir, svg_filename)
-        with open(svg_path, "w", encoding="utf-8") as f:
-            f.write(svg_content)
-
-        year_breakdown = {}
-        for item in year_data:
-            st = item['source_type']
-            year_breakdown[st] = year_breakdown.get(st, 0) + 1
+        if years is not None and year not in years and os.path.exists(svg_path):
+            with open(svg_path, "r", encoding="utf-8") as f:
+                svg_content = f.read()
+        else:
+            svg_content = generate_svg(year, data_by_date, source_config, cube, levels)
+            with open(svg_path, "w", encoding="utf-8") as f:
+                f.write(svg_content)
 
         breakdown_parts = []
         for st in sorted(year_breakdown.keys()):
@@ -207,13 +259,20 @@ def main():
         output.append(svg_content)
         year_summary = f"{year_entries} article{'s' if year_entries != 1 else ''} in {year}{breakdown_str}"
         output.append(f"\n{year_summary}\n")
+        top_terms = (terms or {}).get('years', {}).get(str(year), {}).get('all', {}).get('top')
+        if top_terms:
+            top_terms_str = ", ".join(f"{term} ({count})" for term, count in top_terms)
+            output.append(f"Top terms: {top_terms_str}\n")
 
         html_output.append(f'    <div class="year-section">')
         html_output.append(f"        <h3>{year}</h3>")
         html_output.append(f"        {svg_content}")
         html_output.append(f"        <p>{year_summary}</p>")
+        if top_terms:
+            html_output.append(f'        <p class="top-terms">Top terms: {saxutils.escape(top_terms_str)}</p>')
         html_output.append(f'    </div>')
 
+    profiling.switch('statistics')
     output.append("## Statistics")
     html_output.append('    <div class="stats-section">')
     html_output.append("        <h2>Statistics</h2>")
@@ -238,7 +297,7 @@ def main():
     for st, items in sorted(sources_data.items()):
         name = source_names.get(st, st)
         count = len(items)
-        words = sum(item['word_count'] for item in items)
+        words = sum(item.word_count for item in items)
         rt_total_min = math.ceil(words / 200)
         rt_str = f"{rt_total_min // 60}h {rt_total_min % 60}m"
         output.append(f"- **{name}:** {count} entries, {words} words, {rt_str} reading time")
@@ -254,11 +313,14 @@ def main():
 
     for st, items in sorted(sources_data.items()):
         name = source_names.get(st, st)
-        top_3 = sorted(items, key=lambda x: x['word_count'], reverse=True)[:3]
+        if rollup is not None:
+            top_3 = rollup.top_entries(3, source=st)
+        else:
+            top_3 = heapq.nlargest(3, items, key=lambda x: x.word_count)
         for i, item in enumerate(top_3):
-            title = item['title']
-            link = item['link']
-            wc = item['word_count']
+            title = item.title
+            link = item.link
+            wc = item.word_count
             rt_total_min = math.ceil(wc / 200)
             rt_str = f"{rt_total_min // 60}h {rt_total_min % 60}m"
             output.append(f"- {name} #{i+1}: [{title}]({link}) ({wc} words, {rt_str} reading time)")
@@ -266,16 +328,43 @@ def main():
 
     html_output.append("            </ul>")
     html_output.append("        </div>")
+
+    if rollup is not None:
+        pattern_lines = rollups.pattern_lines(rollup, source_config)
+        output.append("\n### Writing patterns")
+        output.extend(pattern_lines)
+        html_output.append('        <div class="writing-patterns">')
+        html_output.append("            <h3>Writing patterns</h3>")
+        html_output.append("            <ul>")
+        for line in pattern_lines:
+            html_output.append(f"                <li>{_markdown_bold_to_html(line[2:])}</li>")
+        html_output.append("            </ul>")
+        html_output.append("        </div>")
+
+        active_years = [y for y in range(end_year, start_year - 1, -1) if cube.year_total(y)]
+        weekday_lines = rollups.weekday_by_year_lines(rollup, active_years)
+        output.append("\n### Busiest weekday per year")
+        output.extend(weekday_lines)
+        html_output.append('        <div class="weekday-by-year">')
+        html_output.append("            <h3>Busiest weekday per year</h3>")
+        html_output.append("            <ul>")
+        for line in weekday_lines:
+            html_output.append(f"                <li>{saxutils.escape(line[2:])}</li>")
+        html_output.append("            </ul>")
+        html_output.append("        </div>")
+
     html_output.append("    </div>")
     html_output.append("</body>")
     html_output.append("</html>")
 
-    index_path = os.path.join(os.path.dirname(script_dir), "docs", "index.html")
+    profiling.switch('write index.html')
+    index_path = os.path.join(docs_dir, "index.html")
     with open(index_path, "w", encoding="utf-8") as f:
         f.write("\n".join(html_output))
     print(f"{index_path} generated.")
 
-    readme_path = os.path.join(os.path.dirname(script_dir), "docs", "README.md")
+    profiling.switch('write README')
+    readme_path = os.path.join(docs_dir, "README.md")
     if not os.path.exists(readme_path):
         os.makedirs(os.path.dirname(readme_path), exist_ok=True)
         with open(readme_path, "w", encoding="utf-8") as f:
@@ -295,6 +384,41 @@ def main():
     with open(readme_path, "w", encoding="utf-8") as f:
         f.write(new_readme)
     print(f"{readme_path} updated.")
+    profiling.switch(None)
+
+def main(argv=None, data_dir=None, docs_dir=None):
+    argv = sys.argv[1:] if argv is None else argv
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = data_dir or os.path.join(os.path.dirname(script_dir), "data")
+    profiling.setup('generate_heatmaps', argv, data_dir)
+
+    # Intensity options (cube only): '--words' weights days by word count,
+    # '--quantile' uses per-year quartiles instead of the share of the maximum
+    args = [a.lower() for a in argv]
+    weight = 'words' if '--words' in args else 'entries'
+    scale = 'quantile' if '--quantile' in args else 'linear'
+
+    sources_file = os.path.join(script_dir, "sources.json")
+    source_config = diary_data.load_source_config(sources_file)
+    sources = list(source_config.keys())
+    db_path = diary_db.path_from_args(argv, data_dir)
+    year_counts = None
+    with metrics.timer('load_statistics'), profiling.phase('load CSVs'):
+        if db_path:
+            conn = diary_db.connect(db_path)
+            all_data = diary_db.load_statistics(conn, sources)
+            year_counts = diary_db.year_source_counts(conn, sources)
+            conn.close()
+        else:
+            all_data = diary_data.load_statistics(data_dir, sources)
+    metrics.add_rows('load_statistics', '', len(all_data))
+
+    docs_dir = docs_dir or os.path.join(os.path.dirname(script_dir), "docs")
+    with metrics.timer('generate_heatmaps'):
+        generate_reports(all_data, source_config, docs_dir, weight, scale, year_counts,
+                         terms=term_stats.load(data_dir))
+    metrics.add_rows('generate_heatmaps', '', len(all_data))
+    metrics.write_report('generate_heatmaps', data_dir)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Run stages 1-4 for several diaries in one process, fetching shared content once.
+
+A diary is a directory with its own sources.json; its CSVs are written to
+<diary>/data/ and its pages to <diary>/docs/, as run_pipeline.py does for
+this repository. The diaries of a batch share their work:
+
+- a source that several diaries configure the same way (same type, URL
+  and options; name, colours and refresh interval may differ) is fetched
+  once in stage 1, and each diary gets a copy of its entries;
+- the content of a link is extracted once in stage 2, by one pool of
+  worker threads for all diaries, and each thread keeps its connections
+  to the hosts open (http_pool.py) from one diary's pages to the next;
+- all requests go through one response cache (response_cache.py), so an
+  API page or sitemap that two different sources ask for is fetched once,
+  and one rate-limit governor (`resilience.govern`), which caps the
+  requests in flight per host over all diaries and stops sending to a
+  host whose rate limit is exhausted until it resets.
+
+A source that fails keeps the previous CSVs of its type in every diary
+that uses it. Stages 3 and 4 and the top terms (term_stats.py) run per
+diary; they only read local files.
+
+Usage:
+    python scripts/batch_diaries.py DIARY [DIARY ...] [--workers N] [--per-host N]
+                                    [--cache-mb M] [--words] [--quantile]
+"""
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from run_pipeline import ROOT_DIR, load_stage
+
+import diary_data
+import metrics
+import resilience
+import response_cache
+import scheduler
+import side_texts
+import term_stats
+
+# Keys of a source that do not change what is fetched
+PRESENTATION_KEYS = ('name', 'colors', 'refresh', 'concurrency')
+DEFAULT_WORKERS = 16
+DEFAULT_PER_HOST = 4
+DEFAULT_CACHE_MB = 256
+
+
+class Diary:
+    """One diary directory: its sources and where its outputs go."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.name = os.path.basename(self.root.rstrip(os.sep))
+        self.sources_file = os.path.join(self.root, "sources.json")
+        with open(self.sources_file, 'r', encoding='utf-8') as f:
+            self.sources = json.load(f)
+        self.source_config = diary_data.load_source_config(self.sources_file)
+        self.data_dir = os.path.join(self.root, "data")
+        self.docs_dir = os.path.join(self.root, "docs")
+        self.types = list(dict.fromkeys(s['type'] for s in self.sources))
+
+
+def source_key(source):
+    """What a source fetches: equal for the same source configured in different diaries."""
+    return json.dumps({k: v for k, v in source.items() if k not in PRESENTATION_KEYS}, sort_keys=True)
+
+
+def fetch_sources(diaries):
+    """Fetch every distinct source at once.
+
+    Returns {source key: entries, or None if the fetch failed} and
+    {source key: the diary whose data directory the source used}.
+    """
+    stage1 = load_stage(1)
+    unique = {}
+    for diary in diaries:
+        for source in diary.sources:
+            # Side files of local sources go to the first diary that has the source
+            unique.setdefault(source_key(source), (source, diary))
+    print(f"Stage 1: {len(unique)} distinct sources for {len(diaries)} diaries")
+
+    def job(source, diary, label):
+        def run(progress):
+            items = []
+            try:
+                with metrics.timer('create_sources', label):
+                    for item in stage1.iter_source(source, diary.data_dir):
+                        items.append(item)
+                        progress.add(label)
+            except Exception as e:
+                print(f"Error fetching {label}: {e}")
+                metrics.count_error(type(e).__name__)
+                return None
+            metrics.add_rows('create_sources', label, len(items))
+            return items
+        return run
+
+    jobs = {}
+    labels = {}
+    for key, (source, diary) in unique.items():
+        label = f"{diary.name}/{source.get('name', source['type'])}"
+        if label in jobs:
+            label = f"{label} ({len(jobs) + 1})"
+        labels[key] = label
+        jobs[label] = job(source, diary, label)
+    results = scheduler.run_all(jobs)
+    return {key: results.get(label) for key, label in labels.items()}, {k: d for k, (_, d) in unique.items()}
+
+
+def write_sources(diary, fetched):
+    """Write the sources CSV of each type whose sources were all fetched; returns {type: entries}."""
+    stage1 = load_stage(1)
+    written = {}
+    for type_name in diary.types:
+        parts = [fetched[source_key(s)] for s in diary.sources if s['type'] == type_name]
+        if any(part is None for part in parts):
+            print(f"[{diary.name}] keeping the previous {type_name} files: a source failed")
+            continue
+        entries = [item for part in parts for item in part]
+        stage1.save_to_csv_with_dir(entries, f"sources_{type_name}.csv", diary.data_dir)
+        written[type_name] = entries
+    return written
+
+
+def extract_contents(jobs, workers):
+    """{(type, link): content} of the distinct (type, link, row type, title, data dir) jobs."""
+    stage2 = load_stage(2)
+    label = 'Content'
+    progress = scheduler.Progress([label])
+    progress.set_total(label, len(jobs))
+    progress.start_source(label)
+    progress.start()
+    texts = side_texts.SideTexts()
+
+    def extract(job):
+        source_type, link, row_type, title, data_dir = job
+        content = stage2.extract_content(link, row_type, title, source_type, data_dir, texts)
+        progress.add(label)
+        return content
+
+    try:
+        with metrics.timer('parse_sources', 'batch'), ThreadPoolExecutor(max_workers=workers) as pool:
+            contents = dict(zip(((j[0], j[1]) for j in jobs), pool.map(extract, jobs)))
+    finally:
+        progress.finish_source(label)
+        progress.stop()
+    metrics.add_rows('parse_sources', 'batch', len(jobs))
+    return contents
+
+
+def write_content(diary, type_name, entries, contents):
+    path = os.path.join(diary.data_dir, f"content_{type_name}.csv")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Link', 'Content'])
+        for item in entries:
+            writer.writerow([item['link'], contents[(type_name, item['link'])]])
+    print(f"Saved to {path}")
+
+
+def run_batch(diaries, workers=DEFAULT_WORKERS, weight='entries', scale='linear'):
+    """Bring the data/ and docs/ trees of all `diaries` up to date."""
+    fetched, homes = fetch_sources(diaries)
+    written = {diary.root: write_sources(diary, fetched) for diary in diaries}
+
+    # Stage 2: every link once, with the side files of the diary that fetched its source
+    home_of = {}
+    for key, items in fetched.items():
+        source_type = json.loads(key)['type']
+        for item in items or ():
+            home_of.setdefault((source_type, item['link']), homes[key].data_dir)
+    jobs = {}
+    for diary in diaries:
+        for type_name, entries in written[diary.root].items():
+            for item in entries:
+                key = (type_name, item['link'])
+                jobs.setdefault(key, (type_name, item['link'], item['type'], item['title'], home_of[key]))
+    total = sum(len(e) for w in written.values() for e in w.values())
+    print(f"Stage 2: {len(jobs)} distinct links for {total} entries")
+    contents = extract_contents(list(jobs.values()), workers)
+
+    stage3, stage4 = load_stage(3), load_stage(4)
+    for diary in diaries:
+        for type_name, entries in written[diary.root].items():
+            write_content(diary, type_name, entries, contents)
+            stage3.process_statistics(type_name, diary.data_dir)
+        term_stats.build(diary.data_dir, diary.types)
+        all_data = diary_data.load_statistics(diary.data_dir, list(diary.source_config))
+        with metrics.timer('generate_heatmaps', diary.name):
+            stage4.generate_reports(all_data, diary.source_config, diary.docs_dir, weight, scale,
+                                    terms=term_stats.load(diary.data_dir))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the diary pipeline for several diaries at once.")
+    parser.add_argument('diaries', nargs='+', help="diary directories, each with a sources.json")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="pages extracted at once over all diaries")
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST, help="requests in flight per host")
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_MB, help="size of the shared response cache")
+    parser.add_argument('--words', action='store_true', help="weight heatmap days by word count")
+    parser.add_argument('--quantile', action='store_true', help="per-year quartiles for the heatmap levels")
+    args = parser.parse_args(argv)
+
+    diaries = []
+    for path in args.diaries:
+        if not os.path.exists(os.path.join(path, "sources.json")):
+            parser.error(f"{path} has no sources.json")
+        diaries.append(Diary(path))
+
+    resilience.govern(max(1, args.per_host))
+    response_cache.enable(args.cache_mb * 1024 * 1024)
+    try:
+        run_batch(diaries, max(1, args.workers), 'words' if args.words else 'entries',
+                  'quantile' if args.quantile else 'linear')
+    finally:
+        metrics.write_report('batch_diaries', os.path.join(ROOT_DIR, "data"))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,6 @@
+"""Synthetic corpora, stand-in upstream servers and throughput benchmarks.
+
+    python scripts/benchmark/corpus.py --entries 100000 --out /tmp/corpus
+    python scripts/benchmark/bench.py [--entries N] [--compare | --save]
+    python scripts/benchmark/standin.py [--entries N | --replay DIR] [--latency S]
+"""
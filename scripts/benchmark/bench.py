@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Throughput and peak-memory benchmarks for the pipeline stages.
+
+Generates a synthetic corpus (see corpus.py) in a temporary directory and
+times `strip_html`, `count_words`, `process_statistics`, `generate_svg` and
+the full stage 4 `main` on it. Each benchmark reports the best of
+`--repeat` runs and, from one extra run under tracemalloc, the peak of
+Python allocations.
+
+`--save` writes the results to baseline.json next to this file. `--compare`
+checks them against that baseline and exits with 1 when a throughput
+dropped or a peak grew by more than `--tolerance` (default 25%). A baseline
+only means something on the machine and corpus size it was recorded with.
+
+Usage:
+    python scripts/benchmark/bench.py [--entries 10000] [--repeat 3] [--only name ...]
+                                      [--save | --compare] [--tolerance 0.25]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import corpus  # noqa: E402
+import diary_data  # noqa: E402
+from run_pipeline import load_stage  # noqa: E402
+
+csv.field_size_limit(sys.maxsize)
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+SOURCES_FILE = os.path.join(SCRIPTS_DIR, "sources.json")
+
+
+class Context:
+    """The corpus and scratch directories shared by the benchmarks."""
+
+    def __init__(self, work_dir, entries, seed):
+        self.data_dir = os.path.join(work_dir, "data")
+        self.docs_dir = os.path.join(work_dir, "docs")
+        self.entries = entries
+        self.seed = seed
+        self.counts = corpus.generate(self.data_dir, entries, seed)
+        self.source_config = diary_data.load_source_config(SOURCES_FILE)
+
+
+def bench_strip_html(ctx):
+    rng = random.Random(ctx.seed)
+    texts = corpus.TextSource(rng)
+    profile = corpus.PROFILES['wordpress']
+    pages = [corpus.html_page(rng, texts, corpus.page_words(rng, profile))
+             for _ in range(max(50, min(2000, ctx.entries // 10)))]
+    size = sum(len(p) for p in pages) / 1e6
+    strip_html = load_stage(2).strip_html
+
+    def run():
+        for page in pages:
+            strip_html(page)
+        return size
+    return run, 'MB'
+
+
+def bench_count_words(ctx):
+    texts = []
+    for source_type in ctx.counts:
+        with open(os.path.join(ctx.data_dir, f"content_{source_type}.csv"), 'r', encoding='utf-8') as f:
+            texts.extend(row[1] for row in csv.reader(f))
+    size = sum(len(t) for t in texts) / 1e6
+    count_words = load_stage(3).count_words
+
+    def run():
+        for text in texts:
+            count_words(text)
+        return size
+    return run, 'MB'
+
+
+def bench_process_statistics(ctx):
+    stage3 = load_stage(3)
+
+    def run():
+        for source_type in ctx.counts:
+            stage3.process_statistics(source_type, ctx.data_dir)
+        return ctx.entries
+    return run, 'rows'
+
+
+def bench_generate_svg(ctx):
+    stage4 = load_stage(4)
+    all_data = diary_data.load_statistics(ctx.data_dir, list(ctx.source_config))
+    data_by_date = {}
+    for item in all_data:
+        data_by_date.setdefault(item.day, []).append(item)
+    cube = levels = None
+    if stage4.heatmap_cube is not None:
+        cube = stage4.heatmap_cube.build_cube(
+            [item.day for item in all_data], [item.word_count for item in all_data],
+            [item.source_type for item in all_data], list(ctx.source_config))
+        levels = cube.levels()
+    years = sorted({date.fromordinal(d).year for d in data_by_date if d})
+
+    def run():
+        for year in years:
+            stage4.generate_svg(year, data_by_date, ctx.source_config, cube, levels)
+        return len(all_data)
+    return run, 'rows'
+
+
+def bench_stage4_main(ctx):
+    stage4 = load_stage(4)
+
+    def run():
+        stage4.main([], data_dir=ctx.data_dir, docs_dir=ctx.docs_dir)
+        return ctx.entries
+    return run, 'rows'
+
+
+BENCHMARKS = {
+    'strip_html': bench_strip_html,
+    'count_words': bench_count_words,
+    'process_statistics': bench_process_statistics,
+    'generate_svg': bench_generate_svg,
+    'stage4_main': bench_stage4_main,
+}
+
+
+def measure(run, repeat):
+    """Best wall time of `repeat` runs, then one traced run for the peak."""
+    best = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            amount = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return amount, best, peak
+
+
+def run_benchmarks(entries, repeat, only=None, seed=0):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="diary-bench-") as work_dir:
+        print(f"Generating a corpus of {entries} entries...")
+        ctx = Context(work_dir, entries, seed)
+        for n in (2, 3, 4):
+            load_stage(n)  # import outside the stdout redirection below
+        for name, setup in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):
+                run, unit = setup(ctx)
+            amount, seconds, peak = measure(run, repeat)
+            results[name] = {'seconds': round(seconds, 4), 'throughput': round(amount / seconds, 2),
+                             'unit': f"{unit}/s", 'peak_bytes': peak}
+            print(f"  {name:<20} {seconds:>8.3f}s {amount / seconds:>12.1f} {unit}/s "
+                  f"{peak / 1e6:>9.1f} MB peak")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing each regression against `baseline`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']} {result['unit']} "
+                               f"vs {base['throughput']} in the baseline")
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {result['peak_bytes']} bytes "
+                               f"vs {base['peak_bytes']} in the baseline")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on a synthetic corpus.")
+    parser.add_argument('--entries', type=int, help="corpus size (default: the baseline's, else 10000)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="run only these benchmarks")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    mode.add_argument('--compare', action='store_true', help="fail on regressions against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative change")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    entries = args.entries or (baseline or {}).get('entries', 10000)
+    if args.compare and baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save first.")
+        return 1
+
+    results = run_benchmarks(entries, args.repeat, args.only, args.seed)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'entries': entries, 'seed': args.seed, 'python': platform.python_version(),
+                       'machine': platform.machine(), 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f"Saved to {args.baseline}")
+    elif args.compare:
+        if baseline.get('entries') != entries:
+            print(f"Warning: baseline was recorded with {baseline.get('entries')} entries, not {entries}")
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
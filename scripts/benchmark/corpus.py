@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Generate a synthetic diary corpus in the stage 1-3 CSV formats.
+
+Writes `sources_<type>.csv`, `content_<type>.csv` and `statistics_<type>.csv`
+for the four types in `sources.json`, shaped like the real data:
+
+- GitHub commits make up most entries and arrive in bursts on one repo,
+  with one README entry per repo;
+- each type covers its own range of years, weekends are quieter, and
+  page lengths follow a log-normal distribution per type;
+- text is drawn from a Zipf-weighted vocabulary, so the word and
+  character counts in the statistics match what stage 3 computes.
+
+Rows are written as they are generated, so 10M entries need little memory
+(use `--no-content` to skip the large content files).
+
+Usage:
+    python scripts/benchmark/corpus.py --entries 100000 --out /tmp/corpus [--seed 1] [--no-content]
+"""
+import argparse
+import csv
+import itertools
+import math
+import os
+import random
+from datetime import date
+
+# share of entries, years covered, median and spread of the words per page
+PROFILES = {
+    'wordpress': {'share': 0.04, 'years': (2012, 2021), 'words': 800, 'sigma': 0.6},
+    'quartz': {'share': 0.03, 'years': (2021, 2026), 'words': 400, 'sigma': 1.0},
+    'legacy_html': {'share': 0.03, 'years': (2003, 2012), 'words': 600, 'sigma': 0.8},
+    'github': {'share': 0.90, 'years': (2014, 2026), 'words': 300, 'sigma': 1.0},
+}
+# Relative activity Monday..Sunday
+WEEKDAY_WEIGHTS = (1.0, 1.0, 0.95, 0.9, 0.85, 0.55, 0.6)
+MEAN_BURST = 6
+COMMITS_PER_REPO = 120
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'bel', 'dor', 'fen', 'gar', 'hul', 'jin',
+             'kor', 'lim', 'mor', 'nix', 'par', 'quo', 'ras', 'sel', 'tor', 'ul', 'ven', 'wil', 'xen', 'yor']
+COMMON = ('the of and to a in is it that for on was with as at be this from by not are or have '
+          'but had they you which one we all were there when an been has more if will would can '
+          'new time day work first some make after project update fix add code data page note').split()
+
+
+def vocabulary(size=5000):
+    """Common words first, then generated ones; weights follow Zipf's law."""
+    words = list(COMMON)
+    for n in itertools.count(2):
+        for combo in itertools.product(SYLLABLES, repeat=n):
+            words.append(''.join(combo))
+            if len(words) >= size:
+                cum, total = [], 0.0
+                for i in range(size):
+                    total += 1.0 / (i + 1)
+                    cum.append(total)
+                return words, cum
+
+
+class TextSource:
+    def __init__(self, rng):
+        self.rng = rng
+        self.words, self.cum_weights = vocabulary()
+
+    def text(self, n_words):
+        return ' '.join(self.rng.choices(self.words, cum_weights=self.cum_weights, k=n_words))
+
+    def title(self, lo=2, hi=8):
+        return self.text(self.rng.randint(lo, hi)).capitalize()
+
+
+def page_words(rng, profile):
+    return max(5, int(rng.lognormvariate(math.log(profile['words']), profile['sigma'])))
+
+
+def html_page(rng, texts, n_words):
+    """A blog-like HTML page around `n_words` words of text, for stage 2 benchmarks."""
+    paragraphs = []
+    left = n_words
+    while left > 0:
+        k = min(left, rng.randint(20, 120))
+        left -= k
+        words = texts.text(k).split()
+        if len(words) > 3:
+            i = rng.randrange(len(words))
+            words[i] = f'<a href="/notes/{words[i]}.html">{words[i]}</a>'
+            words[-1] += rng.choice(['.', ' &amp; more.', ' &ndash; done.', '&nbsp;!'])
+        paragraphs.append('<p>' + ' '.join(words) + '</p>')
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+            f'<title>{texts.title()}</title>'
+            '<style>body{font-family:sans-serif;max-width:40em}nav a{margin:0 .5em}</style>'
+            '<script>window.dataLayer=window.dataLayer||[];function gtag(){dataLayer.push(arguments)}</script>'
+            '</head><body><nav><a href="/">Home</a><a href="/archive/">Archive</a><a href="/about/">About</a></nav>'
+            '<article>' + '\n'.join(paragraphs) + '</article>'
+            '<footer><form action="/comment" method="post"><textarea name="c"></textarea>'
+            '<input type="submit" value="Post Comment"></form></footer></body></html>')
+
+
+class DaySampler:
+    """Random days in a range of years, quieter at weekends and in slow years."""
+
+    def __init__(self, rng, years):
+        self.rng = rng
+        self.first = date(years[0], 1, 1).toordinal()
+        self.last = date(years[1], 12, 31).toordinal()
+        self.year_activity = {y: rng.uniform(0.3, 1.0) for y in range(years[0], years[1] + 1)}
+
+    def __call__(self):
+        while True:
+            day = self.rng.randint(self.first, self.last)
+            d = date.fromordinal(day)
+            if self.rng.random() < WEEKDAY_WEIGHTS[d.weekday()] * self.year_activity[d.year]:
+                return d.isoformat()
+
+
+def iter_entries(source_type, n, rng, texts, user='synth'):
+    """Yield (link, date, title, type, content) rows for one source type."""
+    profile = PROFILES[source_type]
+    sample_day = DaySampler(rng, profile['years'])
+    if source_type != 'github':
+        hosts = {'wordpress': 'https://blog.example.org/{y}/{m:02d}/{slug}/',
+                 'quartz': 'https://notes.example.org/{y}/{m:02d}/{slug}',
+                 'legacy_html': 'https://legacy.example.org/diary/{y}/{slug}.html'}
+        for i in range(n):
+            day = sample_day()
+            title = texts.title()
+            slug = f"{'-'.join(title.lower().split()[:4])}-{i}"
+            link = hosts[source_type].format(y=day[:4], m=int(day[5:7]), slug=slug)
+            yield link, day, title, source_type, texts.text(page_words(rng, profile))
+        return
+
+    # Commits come in bursts on one repo; each new repo also gets a README entry
+    repos = []
+    emitted = 0
+    while emitted < n:
+        if not repos or rng.random() < MEAN_BURST / COMMITS_PER_REPO:
+            repo = f"{user}/{rng.choice(texts.words)}-{len(repos)}"
+            repos.append(repo)
+            yield (f"https://github.com/{repo}/blob/main/README.md", sample_day(), f"[{repo}] README.md",
+                   'github readme', texts.text(page_words(rng, profile)))
+            emitted += 1
+        else:
+            repo = rng.choice(repos)
+        day = sample_day()
+        for _ in range(min(n - emitted, 1 + int(rng.expovariate(1 / (MEAN_BURST - 1))))):
+            msg = texts.title(2, 12)
+            yield (f"https://github.com/{repo}/commit/{rng.getrandbits(160):040x}", day, f"[{repo}] {msg}",
+                   'github commit', msg)
+            emitted += 1
+
+
+def split_counts(entries):
+    counts = {st: int(entries * p['share']) for st, p in PROFILES.items()}
+    counts['github'] += entries - sum(counts.values())
+    return counts
+
+
+def generate(out_dir, entries, seed=0, content=True):
+    """Write the corpus to `out_dir`; returns the number of entries per type."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    texts = TextSource(rng)
+    counts = split_counts(entries)
+    for source_type, n in counts.items():
+        files = {kind: open(os.path.join(out_dir, f"{kind}_{source_type}.csv"), 'w', newline='', encoding='utf-8')
+                 for kind in (('sources', 'content', 'statistics') if content else ('sources', 'statistics'))}
+        try:
+            writers = {kind: csv.writer(f) for kind, f in files.items()}
+            writers['sources'].writerow(['Link', 'Date', 'Title', 'Type'])
+            writers['statistics'].writerow(['Link', 'Date', 'Title', 'Word Count', 'Character Count'])
+            if content:
+                writers['content'].writerow(['Link', 'Content'])
+            for link, day, title, row_type, text in iter_entries(source_type, n, rng, texts):
+                writers['sources'].writerow([link, day, title, row_type])
+                writers['statistics'].writerow([link, day, title, text.count(' ') + 1, len(text)])
+                if content:
+                    writers['content'].writerow([link, text])
+        finally:
+            for f in files.values():
+                f.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic diary corpus.")
+    parser.add_argument('--entries', type=int, default=10000, help="total number of entries")
+    parser.add_argument('--out', required=True, help="output directory (a `data/`-like folder)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-content', action='store_true', help="skip the content CSVs")
+    args = parser.parse_args(argv)
+
+    counts = generate(args.out, args.entries, args.seed, not args.no_content)
+    for source_type, n in counts.items():
+        print(f"{source_type}: {n} entries")
+    print(f"Saved to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""Local stand-in for the WordPress, Quartz, legacy HTML and GitHub upstreams.
+
+Point the pipeline at it with DIARY_HTTP_REPLAY (see http_cassette.py):
+
+    python scripts/benchmark/standin.py --entries 20000 --latency 0.05 &
+    DIARY_HTTP_REPLAY=http://127.0.0.1:8700 python scripts/run_pipeline.py --force
+
+The server either replays a cassette recorded with DIARY_HTTP_RECORD
+(`--replay DIR`) or synthesizes the four sites from a synthetic corpus
+(corpus.py) under the URLs in sources.json:
+
+- WordPress `/wp-json/wp/v2/posts` with `page`/`per_page` pagination,
+  X-WP-Total headers and HTTP 400 past the last page;
+- Quartz `/static/contentIndex.json` and `/index.xml`;
+- a crawlable legacy site: root -> year indexes -> dated pages, with
+  `--legacy-sitemap` also a sitemap.xml announced in robots.txt;
+- GitHub `/users/<user>/repos`, `/repos/<repo>/commits` (list and single),
+  `/search/commits`, `/rate_limit` and raw.githubusercontent.com READMEs.
+
+Every page is generated on request from a seed derived from its URL, so
+large corpora cost little memory. `--latency`/`--jitter` delay each
+response and `--error-rate P` answers that share of requests with 503.
+`--rate-limit N --rate-window S` gives api.github.com a budget of
+N requests per S seconds with X-RateLimit-* headers and answers 403 once it
+is spent, like the real API.
+
+Usage:
+    python scripts/benchmark/standin.py [--port 8700] [--replay DIR | --entries N] [--seed 0]
+                                        [--legacy-sitemap] [--latency S] [--jitter S] [--error-rate P]
+                                        [--rate-limit N] [--rate-window S] [--verbose]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import corpus  # noqa: E402
+import http_cassette  # noqa: E402
+
+
+class RateLimiter:
+    """Fixed-window request budget reported like GitHub's X-RateLimit-* headers."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.reset = time.time() + window
+        self.used = 0
+
+    def take(self):
+        """(allowed, headers) for one request."""
+        with self.lock:
+            now = time.time()
+            if now >= self.reset:
+                self.reset = now + self.window
+                self.used = 0
+            allowed = self.used < self.limit
+            if allowed:
+                self.used += 1
+            headers = {'X-RateLimit-Limit': str(self.limit),
+                       'X-RateLimit-Remaining': str(self.limit - self.used),
+                       'X-RateLimit-Reset': str(int(self.reset) + 1),
+                       'X-RateLimit-Used': str(self.used),
+                       'X-RateLimit-Resource': 'core'}
+            return allowed, headers
+
+    def status(self):
+        """The budget as a `GET /rate_limit` resource."""
+        with self.lock:
+            return {'limit': self.limit, 'remaining': max(0, self.limit - self.used),
+                    'reset': int(self.reset) + 1, 'used': self.used}
+
+
+def _seeded(url, seed):
+    return random.Random(int(hashlib.sha1(f"{seed}:{url}".encode('utf-8')).hexdigest()[:16], 16))
+
+
+class SyntheticSites:
+    """The four upstreams, built from a synthetic corpus placed under the sources.json URLs."""
+
+    def __init__(self, sources, entries, seed=0, sitemap=False):
+        self.seed = seed
+        self.sitemap = sitemap
+        rng = random.Random(seed)
+        self.texts = corpus.TextSource(rng)
+        base = {}
+        for source in sources:
+            base.setdefault(source['type'], source['url'].rstrip('/'))
+        self.wordpress_base = base.get('wordpress')
+        self.quartz_base = base.get('quartz')
+        self.legacy_base = base.get('legacy_html')
+        self.github_user = base.get('github', 'synth')
+
+        self.pages = {}          # url -> (title, day, words)
+        self.wordpress = []      # posts for the REST API
+        self.quartz = {}         # slug -> contentIndex item
+        self.legacy_years = {}   # year -> [page url]
+        self.repos = {}          # full name -> {'commits': [...], 'readme_words', 'pushed_at'}
+        self.commits = {}        # (repo, sha) -> message
+
+        for source_type, n in corpus.split_counts(entries).items():
+            for link, day, title, row_type, text in corpus.iter_entries(source_type, n, rng, self.texts,
+                                                                        self.github_user):
+                words = text.count(' ') + 1
+                path = urllib.parse.urlsplit(link).path
+                if source_type == 'wordpress' and self.wordpress_base:
+                    url = self.wordpress_base + path
+                    self.pages[url] = (title, day, words)
+                    self.wordpress.append({'link': url, 'date': f"{day}T12:00:00", 'title': {'rendered': title}})
+                elif source_type == 'quartz' and self.quartz_base:
+                    slug = path.strip('/')
+                    self.pages[f"{self.quartz_base}/{slug}"] = (title, day, words)
+                    self.quartz[slug] = {'title': title, 'date': day, 'links': [], 'tags': []}
+                elif source_type == 'legacy_html' and self.legacy_base:
+                    url = self.legacy_base + path
+                    self.pages[url] = (title, day, words)
+                    self.legacy_years.setdefault(day[:4], []).append(url)
+                elif source_type == 'github':
+                    repo = title[1:title.index(']')]
+                    info = self.repos.setdefault(repo, {'commits': [], 'readme_words': 0, 'pushed_at': day})
+                    if row_type == 'github readme':
+                        info['readme_words'] = words
+                    else:
+                        sha = link.rsplit('/', 1)[1]
+                        info['commits'].append((day, sha))
+                        info['pushed_at'] = max(info['pushed_at'], day)
+                        self.commits[(repo, sha)] = text
+        self.wordpress.sort(key=lambda p: p['date'], reverse=True)
+        for info in self.repos.values():
+            info['commits'].sort(reverse=True)
+
+    def page_texts(self, url):
+        """The vocabulary with a generator seeded by `url`, so pages do not depend on request order."""
+        texts = copy.copy(self.texts)
+        texts.rng = _seeded(url, self.seed)
+        return texts
+
+    # Responses are (status, headers, body)
+
+    def html(self, url):
+        if url in self.pages:
+            title, day, words = self.pages[url]
+            page = corpus.html_page(_seeded(url, self.seed), self.page_texts(url), words)
+            page = page.replace('<article>', f'<article><p class="date">{day}</p>', 1)
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, page
+        if self.legacy_base and url.rstrip('/') == self.legacy_base:
+            links = ''.join(f'<li><a href="diary/{y}/index.html">{y}</a></li>' for y in sorted(self.legacy_years))
+            return 200, {'Content-Type': 'text/html'}, f"<html><title>Diary</title><ul>{links}</ul></html>"
+        if self.legacy_base and url.startswith(self.legacy_base + '/diary/') and url.endswith('/index.html'):
+            year = url.rsplit('/', 2)[1]
+            if year in self.legacy_years:
+                links = ''.join(f'<li><a href="{u.rsplit("/", 1)[1]}">{self.pages[u][0]}</a></li>'
+                                for u in self.legacy_years[year])
+                return 200, {'Content-Type': 'text/html'}, f"<html><title>{year}</title><ul>{links}</ul></html>"
+        return 404, {'Content-Type': 'text/html'}, "<html><title>Not found</title></html>"
+
+    def legacy_sitemap(self):
+        urls = ''.join(f"<url><loc>{url}</loc><lastmod>{self.pages[url][1]}</lastmod></url>"
+                       for year in sorted(self.legacy_years) for url in self.legacy_years[year])
+        return 200, {'Content-Type': 'application/xml'}, (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>')
+
+    def wordpress_posts(self, query):
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['10'])[0])
+        pages = max(1, -(-len(self.wordpress) // per_page))
+        headers = {'Content-Type': 'application/json', 'X-WP-Total': str(len(self.wordpress)),
+                   'X-WP-TotalPages': str(pages)}
+        if page > pages:
+            return 400, headers, json.dumps({'code': 'rest_post_invalid_page_number'})
+        return 200, headers, json.dumps(self.wordpress[(page - 1) * per_page:page * per_page])
+
+    def quartz_rss(self):
+        latest = sorted(self.quartz.items(), key=lambda kv: kv[1]['date'], reverse=True)[:20]
+        items = []
+        for slug, item in latest:
+            pub = format_datetime(datetime.fromisoformat(item['date']).replace(tzinfo=timezone.utc))
+            items.append(f"<item><title>{item['title']}</title><link>{self.quartz_base}/{slug}</link>"
+                         f"<pubDate>{pub}</pubDate></item>")
+        return 200, {'Content-Type': 'application/xml'}, f"<rss><channel>{''.join(items)}</channel></rss>"
+
+    def github_api(self, path, query):
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        parts = path.strip('/').split('/')
+        json_type = {'Content-Type': 'application/json; charset=utf-8'}
+        if parts[:1] == ['users'] and parts[2:] == ['repos'] and parts[1] == self.github_user:
+            repos = [{'name': name.split('/', 1)[1], 'full_name': name, 'fork': False,
+                      'default_branch': 'main', 'size': 25 * len(info['commits']),
+                      'created_at': f"{info['commits'][-1][0] if info['commits'] else info['pushed_at']}T12:00:00Z",
+                      'pushed_at': f"{info['pushed_at']}T12:00:00Z"}
+                     for name, info in sorted(self.repos.items())]
+            return 200, json_type, json.dumps(repos[(page - 1) * per_page:page * per_page])
+        if parts[:1] == ['repos'] and len(parts) >= 4 and parts[3] == 'commits':
+            repo = f"{parts[1]}/{parts[2]}"
+            if repo not in self.repos:
+                return 404, json_type, json.dumps({'message': 'Not Found'})
+            if len(parts) == 5:
+                message = self.commits.get((repo, parts[4]))
+                if message is None:
+                    return 404, json_type, json.dumps({'message': 'Not Found'})
+                return 200, json_type, json.dumps({'sha': parts[4], 'commit': {'message': message}})
+            commits = [{'sha': sha, 'html_url': f"https://github.com/{repo}/commit/{sha}",
+                        'commit': {'author': {'date': f"{day}T12:00:00Z"}, 'message': self.commits[(repo, sha)]}}
+                       for day, sha in self.repos[repo]['commits'][(page - 1) * per_page:page * per_page]]
+            return 200, json_type, json.dumps(commits)
+        if parts == ['search', 'commits']:
+            return self.github_search(query, per_page, page)
+        if parts == ['rate_limit']:
+            unlimited = {'limit': 5000, 'remaining': 5000, 'reset': int(time.time()) + 3600, 'used': 0}
+            return 200, json_type, json.dumps({'resources': {'core': unlimited, 'search': dict(unlimited, limit=30,
+                                                                                               remaining=30)}})
+        return 404, json_type, json.dumps({'message': 'Not Found'})
+
+    def github_search(self, query, per_page, page):
+        """`/search/commits` for `author:`, `user:`, `-repo:` and `committer-date:a..b`."""
+        json_type = {'Content-Type': 'application/json; charset=utf-8'}
+        terms = query.get('q', [''])[0].split()
+        excluded = {t[6:] for t in terms if t.startswith('-repo:')}
+        users = {t[5:] for t in terms if t.startswith('user:')}
+        first, last = '0000-00-00', '9999-99-99'
+        for t in terms:
+            if t.startswith('committer-date:') and '..' in t:
+                first, last = t[15:].split('..')
+        if page * per_page > 1000:
+            return 422, json_type, json.dumps({'message': 'Only the first 1000 search results are available'})
+        found = [(day, repo, sha) for repo, info in self.repos.items()
+                 if repo not in excluded and (not users or repo.split('/')[0] in users)
+                 for day, sha in info['commits'] if first <= day <= last]
+        found.sort(reverse=True)
+        items = [{'sha': sha, 'html_url': f"https://github.com/{repo}/commit/{sha}", 'repository': {'full_name': repo},
+                  'commit': {'author': {'date': f"{day}T12:00:00Z"}, 'message': self.commits[(repo, sha)]}}
+                 for day, repo, sha in found[(page - 1) * per_page:page * per_page]]
+        return 200, json_type, json.dumps({'total_count': len(found), 'incomplete_results': False, 'items': items})
+
+    def github_readme(self, path):
+        # /<owner>/<repo>/<branch>/README.md
+        parts = path.strip('/').split('/')
+        repo = '/'.join(parts[:2])
+        if repo not in self.repos:
+            return 404, {'Content-Type': 'text/plain'}, '404: Not Found'
+        words = self.repos[repo]['readme_words'] or 50
+        text = f"# {parts[1]}\n\n" + self.page_texts(path).text(words)
+        return 200, {'Content-Type': 'text/plain; charset=utf-8'}, text
+
+    def respond(self, url):
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qs(parts.query)
+        if parts.hostname == 'api.github.com':
+            return self.github_api(parts.path, query)
+        if parts.hostname == 'raw.githubusercontent.com':
+            return self.github_readme(parts.path)
+        if parts.path.endswith('/wp-json/wp/v2/posts'):
+            return self.wordpress_posts(query)
+        if self.quartz_base and url == self.quartz_base + '/static/contentIndex.json':
+            return 200, {'Content-Type': 'application/json'}, json.dumps(self.quartz)
+        if self.quartz_base and url == self.quartz_base + '/index.xml':
+            return self.quartz_rss()
+        if self.sitemap and self.legacy_base:
+            if url == self.legacy_base + '/sitemap.xml':
+                return self.legacy_sitemap()
+            legacy = urllib.parse.urlsplit(self.legacy_base)
+            if url == f"{legacy.scheme}://{legacy.netloc}/robots.txt":
+                return 200, {'Content-Type': 'text/plain'}, f"User-agent: *\nSitemap: {self.legacy_base}/sitemap.xml\n"
+        return self.html(url.split('?')[0])
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'DiaryStandIn/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        options = self.server.options
+        delay = options.latency + (random.uniform(0, options.jitter) if options.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if options.error_rate and random.random() < options.error_rate:
+            return self.send(503, {'Content-Type': 'text/plain'}, "Service unavailable (stand-in)")
+        url = http_cassette.original_url(self.path)
+        headers = {}
+        if self.server.limiter and url.startswith('https://api.github.com/rate_limit'):
+            status = self.server.limiter.status()
+            body = json.dumps({'resources': {'core': status, 'search': status}})
+            return self.send(200, {'Content-Type': 'application/json'}, body)
+        if self.server.limiter and urllib.parse.urlsplit(url).hostname == 'api.github.com':
+            allowed, headers = self.server.limiter.take()
+            if not allowed:
+                body = json.dumps({'message': 'API rate limit exceeded (stand-in).'})
+                return self.send(403, {**headers, 'Content-Type': 'application/json'}, body)
+
+        if options.replay:
+            recorded = http_cassette.load(options.replay, url)
+            if recorded is None:
+                return self.send(404, {'Content-Type': 'text/plain'}, f"Not in cassette: {url}")
+            status, recorded_headers, body = recorded
+            # The limiter's headers replace the recorded ones
+            recorded_headers = [(k, v) for k, v in recorded_headers if k not in headers]
+            return self.send(status, dict(recorded_headers, **headers), body)
+        status, page_headers, body = self.server.sites.respond(url)
+        self.send(status, {**page_headers, **headers}, body)
+
+    def send(self, status, headers, body):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(options, sources):
+    server = ThreadingHTTPServer((options.host, options.port), Handler)
+    server.daemon_threads = True
+    server.options = options
+    server.limiter = RateLimiter(options.rate_limit, options.rate_window) if options.rate_limit else None
+    server.sites = None if options.replay else SyntheticSites(sources, options.entries, options.seed,
+                                                                   options.legacy_sitemap)
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve stand-ins for the diary upstreams.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--replay', metavar='DIR', help="serve a cassette recorded with DIARY_HTTP_RECORD")
+    parser.add_argument('--entries', type=int, default=10000, help="size of the synthetic sites")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--legacy-sitemap', action='store_true', help="publish a sitemap.xml for the legacy site")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random delay up to this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with HTTP 503")
+    parser.add_argument('--rate-limit', type=int, default=0, help="GitHub API requests per window (0: unlimited)")
+    parser.add_argument('--rate-window', type=float, default=3600.0, help="length of the rate-limit window")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    with open(os.path.join(SCRIPTS_DIR, "sources.json"), 'r', encoding='utf-8') as f:
+        sources = json.load(f)
+    server = make_server(options, sources)
+    what = f"cassette {options.replay}" if options.replay else f"{options.entries} synthetic entries"
+    print(f"Serving {what} on http://{options.host}:{options.port}")
+    print(f"  export {http_cassette.REPLAY_ENV}=http://{options.host}:{options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
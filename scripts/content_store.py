@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Compressed content store with random access by link.
+
+Stage 2 output is highly repetitive (every Quartz page repeats the explorer
+text, every WordPress page the comment form). Entries are grouped into
+blocks of about 256 KiB and each block is compressed with LZMA2, which
+finds that boilerplate across all entries of the block. A compressed index
+at the end of the file maps each link to its block and position, so
+reading one entry decompresses a single block instead of scanning the
+whole file.
+
+Layout of `content_<type>.dcs`:
+
+    b'DCS1' | blocks ... | zlib(JSON index) | u64 index offset
+
+Usage:
+    python scripts/content_store.py pack [type ...]     content_*.csv -> .dcs
+    python scripts/content_store.py unpack [type ...]   .dcs -> content_*.csv
+    python scripts/content_store.py get <type> <link>
+"""
+import csv
+import functools
+import json
+import lzma
+import os
+import struct
+import sys
+import zlib
+
+import metrics
+
+csv.field_size_limit(sys.maxsize)
+
+MAGIC = b'DCS1'
+BLOCK_SIZE = 256 * 1024
+FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 9}]
+
+
+def store_path(data_dir, source_type):
+    return os.path.join(data_dir, f"content_{source_type}.dcs")
+
+
+def write_store(path, rows, block_size=BLOCK_SIZE):
+    """Write (link, content) pairs; returns (entries, raw bytes, stored bytes)."""
+    blocks = []   # [offset, length] of each compressed block
+    entries = []  # [link, block, start, length] within the decompressed block
+    raw_size = 0
+    pending = []
+    pending_size = 0
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        def flush():
+            blob = lzma.compress(b''.join(pending), format=lzma.FORMAT_RAW, filters=FILTERS)
+            blocks.append([f.tell(), len(blob)])
+            f.write(blob)
+
+        f.write(MAGIC)
+        for link, text in rows:
+            data = (text or '').encode('utf-8')
+            raw_size += len(data)
+            if pending and pending_size + len(data) > block_size:
+                flush()
+                pending, pending_size = [], 0
+            entries.append([link, len(blocks), pending_size, len(data)])
+            pending.append(data)
+            pending_size += len(data)
+        if pending:
+            flush()
+        index_offset = f.tell()
+        index = json.dumps({'blocks': blocks, 'entries': entries}, ensure_ascii=False)
+        f.write(zlib.compress(index.encode('utf-8'), 9))
+        f.write(struct.pack('<Q', index_offset))
+        stored_size = f.tell()
+    os.replace(tmp_path, path)
+    return len(entries), raw_size, stored_size
+
+
+class ContentStore:
+    """Read-only view of a `.dcs` file; `store[link]` decompresses one block."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, 'rb')
+        if self._f.read(4) != MAGIC:
+            self._f.close()
+            raise ValueError(f"{path} is not a content store")
+        self._f.seek(-8, os.SEEK_END)
+        (index_offset,) = struct.unpack('<Q', self._f.read(8))
+        end = self._f.tell() - 8
+        self._f.seek(index_offset)
+        index = json.loads(zlib.decompress(self._f.read(end - index_offset)).decode('utf-8'))
+        self._blocks = index['blocks']
+        self._index = {link: (block, start, length) for link, block, start, length in index['entries']}
+        self._block = functools.lru_cache(maxsize=8)(self._read_block)
+
+    def _read_block(self, i):
+        offset, length = self._blocks[i]
+        self._f.seek(offset)
+        return lzma.decompress(self._f.read(length), format=lzma.FORMAT_RAW, filters=FILTERS)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, link):
+        return link in self._index
+
+    def __getitem__(self, link):
+        block, start, length = self._index[link]
+        return self._block(block)[start:start + length].decode('utf-8')
+
+    def get(self, link, default=None):
+        return self[link] if link in self._index else default
+
+    def links(self):
+        return list(self._index)
+
+    def items(self):
+        """(link, content) pairs in the order they were written."""
+        for link in self._index:
+            yield link, self[link]
+
+    def close(self):
+        hits = self._block.cache_info().hits
+        if hits:
+            metrics.cache_hit('content_store_block', hits)
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def pack(source_type, data_dir):
+    csv_path = os.path.join(data_dir, f"content_{source_type}.csv")
+    if not os.path.exists(csv_path):
+        print(f"Input file {csv_path} not found.")
+        return
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        rows = ((r['Link'], r['Content']) for r in csv.DictReader(f))
+        n, raw, stored = write_store(store_path(data_dir, source_type), rows)
+    print(f"Packed {n} {source_type} entries: {raw} -> {stored} bytes "
+          f"({os.path.getsize(csv_path)} bytes as CSV)")
+
+
+def unpack(source_type, data_dir):
+    with ContentStore(store_path(data_dir, source_type)) as store:
+        csv_path = os.path.join(data_dir, f"content_{source_type}.csv")
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Link', 'Content'])
+            writer.writerows(store.items())
+    print(f"Saved to {csv_path}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), "data")
+    if not argv or argv[0] not in ('pack', 'unpack', 'get'):
+        print(__doc__)
+        return 1
+
+    if argv[0] == 'get':
+        if len(argv) != 3:
+            print("Usage: python scripts/content_store.py get <type> <link>")
+            return 1
+        with ContentStore(store_path(data_dir, argv[1])) as store:
+            content = store.get(argv[2])
+        if content is None:
+            print(f"{argv[2]} not found.")
+            return 1
+        print(content)
+        return 0
+
+    source_types = argv[1:]
+    if not source_types:
+        with open(os.path.join(script_dir, "sources.json"), 'r') as f:
+            source_types = list(dict.fromkeys(s['type'] for s in json.load(f)))
+    for st in source_types:
+        if argv[0] == 'pack':
+            pack(st, data_dir)
+        else:
+            unpack(st, data_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
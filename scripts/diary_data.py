@@ -0,0 +1,94 @@
+"""Shared entry record and loaders for `sources.json` and the stage CSVs."""
+import csv
+import functools
+import json
+import os
+import sys
+from datetime import date
+
+DEFAULT_COLORS = ["#9be9a8", "#40c463", "#30a14e", "#216e39"]
+
+
+class Entry:
+    """One diary entry.
+
+    `day` is the proleptic Gregorian ordinal of the entry date (0 when the
+    date is unknown) and `source_type` is interned, so the thousands of
+    entries per source share one string.
+    """
+    __slots__ = ('link', 'day', 'title', 'word_count', 'character_count', 'source_type')
+
+    def __init__(self, link, day, title, word_count=0, character_count=0, source_type=''):
+        self.link = link
+        self.day = day
+        self.title = title
+        self.word_count = word_count
+        self.character_count = character_count
+        self.source_type = sys.intern(source_type)
+
+    @property
+    def date(self):
+        """The entry date as 'YYYY-MM-DD', or '' if unknown."""
+        return date.fromordinal(self.day).isoformat() if self.day else ''
+
+    def __repr__(self):
+        return f"Entry({self.link!r}, {self.date!r}, {self.title!r})"
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_day(value):
+    """Ordinal of a 'YYYY-MM-DD[...]' string, 0 if it cannot be parsed."""
+    try:
+        return date.fromisoformat(value[:10]).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+def read_entries(csv_path, source_type):
+    """Yield an Entry per row of a `sources_*` or `statistics_*` CSV."""
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        col = {name: i for i, name in enumerate(header)}
+        i_link, i_date, i_title = col['Link'], col['Date'], col['Title']
+        i_words, i_chars = col.get('Word Count'), col.get('Character Count')
+        for row in reader:
+            yield Entry(
+                row[i_link],
+                parse_day(row[i_date]),
+                row[i_title],
+                int(row[i_words]) if i_words is not None else 0,
+                int(row[i_chars]) if i_chars is not None else 0,
+                source_type)
+
+
+def load_source_config(sources_file):
+    """Map each source type to its display name and colour ramp."""
+    with open(sources_file, 'r', encoding='utf-8') as f:
+        sources_data_json = json.load(f)
+
+    source_config = {}
+    for s in sources_data_json:
+        source_config[s['type']] = {
+            'name': s.get('name', s['type']),
+            'colors': s.get('colors', DEFAULT_COLORS)
+        }
+    return source_config
+
+
+def load_statistics(data_dir, source_types):
+    """Read `statistics_<type>.csv` for each type as Entry records, deduplicated by link."""
+    all_data = []
+    seen_links = set()
+    for st in source_types:
+        stats_file = os.path.join(data_dir, f"statistics_{st}.csv")
+        if not os.path.exists(stats_file):
+            continue
+        # Deduplicate by link (though they should already be mostly unique)
+        for item in read_entries(stats_file, st):
+            if item.link not in seen_links:
+                seen_links.add(item.link)
+                all_data.append(item)
+    return all_data
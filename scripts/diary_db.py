@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Optional SQLite storage for the pipeline stages.
+
+One database in WAL mode replaces the sources/content/statistics CSV
+triples: stage 1 upserts `entries`, stage 2 upserts `content`, stage 3
+upserts `stats` and stage 4 reads everything back with SQL. Upserts only
+touch rows whose values changed, so refreshes are row-level: every row
+carries a revision, and stage 2 and 3 only redo the entries whose input
+row moved past the revision their output was made from.
+
+Rows are keyed by (link, source_type), like the CSVs, which are per type;
+stage 4 keeps the first type listing a link. Databases of the first
+version (link alone as key) are migrated on `connect`.
+
+The stages switch to the database with `--db` (default `data/diary.sqlite`)
+or `--db=<path>`. The CSVs remain available as an export:
+
+    python scripts/diary_db.py export [--db=<path>] [type ...]
+    python scripts/diary_db.py import [--db=<path>] [type ...]
+"""
+import csv
+import os
+import sqlite3
+import sys
+
+import diary_data
+
+csv.field_size_limit(sys.maxsize)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    link TEXT NOT NULL,
+    source_type TEXT NOT NULL,
+    date TEXT NOT NULL,
+    title TEXT NOT NULL,
+    type TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (link, source_type)
+);
+CREATE INDEX IF NOT EXISTS entries_date ON entries(date);
+CREATE INDEX IF NOT EXISTS entries_source ON entries(source_type, date);
+CREATE TABLE IF NOT EXISTS content (
+    link TEXT NOT NULL,
+    source_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 1,
+    entry_revision INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (link, source_type)
+);
+CREATE INDEX IF NOT EXISTS content_source ON content(source_type);
+CREATE TABLE IF NOT EXISTS stats (
+    link TEXT NOT NULL,
+    source_type TEXT NOT NULL,
+    word_count INTEGER NOT NULL,
+    character_count INTEGER NOT NULL,
+    content_revision INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (link, source_type)
+);
+CREATE INDEX IF NOT EXISTS stats_source ON stats(source_type);
+"""
+SCHEMA_VERSION = 2
+
+# Version 1 keyed every table by link alone; its rows are copied over as
+# they are, with the content marked as made from the current entry rows.
+MIGRATE_V1 = """
+BEGIN;
+DROP INDEX IF EXISTS entries_date;
+DROP INDEX IF EXISTS entries_source;
+DROP INDEX IF EXISTS content_source;
+DROP INDEX IF EXISTS stats_source;
+ALTER TABLE entries RENAME TO entries_v1;
+ALTER TABLE content RENAME TO content_v1;
+ALTER TABLE stats RENAME TO stats_v1;
+""" + SCHEMA + """
+INSERT INTO entries (link, source_type, date, title, type)
+    SELECT link, source_type, date, title, type FROM entries_v1 ORDER BY rowid;
+INSERT INTO content (link, source_type, content, revision, entry_revision)
+    SELECT link, source_type, content, revision, 1 FROM content_v1 ORDER BY rowid;
+INSERT INTO stats (link, source_type, word_count, character_count, content_revision)
+    SELECT link, source_type, word_count, character_count, content_revision FROM stats_v1 ORDER BY rowid;
+DROP TABLE entries_v1;
+DROP TABLE content_v1;
+DROP TABLE stats_v1;
+COMMIT;
+"""
+
+
+def default_path(data_dir):
+    return os.path.join(data_dir, "diary.sqlite")
+
+
+def path_from_args(argv, data_dir):
+    """Database path from a `--db` / `--db=<path>` argument, or None."""
+    for arg in argv:
+        if arg == '--db':
+            return default_path(data_dir)
+        if arg.startswith('--db='):
+            return arg.split('=', 1)[1]
+    return None
+
+
+def connect(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries'").fetchone():
+            conn.executescript(MIGRATE_V1)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def upsert_entries(conn, source_type, data, prune=True):
+    """Store stage 1 results for `source_type`; returns the number of changed rows.
+
+    With `prune` links of that type which are no longer listed are removed.
+    """
+    before = conn.total_changes
+    with conn:
+        conn.executemany(
+            "INSERT INTO entries (link, source_type, date, title, type) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(link, source_type) DO UPDATE SET date=excluded.date, title=excluded.title, "
+            "type=excluded.type, revision=entries.revision + 1 "
+            "WHERE (date, title, type) IS NOT (excluded.date, excluded.title, excluded.type)",
+            [(item['link'], source_type, item['date'], item['title'], item['type']) for item in data])
+        if prune:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS current_links (link TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM current_links")
+            conn.executemany("INSERT OR IGNORE INTO current_links VALUES (?)", [(item['link'],) for item in data])
+            for table in ('entries', 'content', 'stats'):
+                conn.execute(f"DELETE FROM {table} WHERE source_type = ? AND link NOT IN (SELECT link FROM current_links)",
+                             (source_type,))
+    return conn.total_changes - before
+
+
+def iter_entries(conn, source_type):
+    """Yield (link, type, title) rows of stage 1 for `source_type`."""
+    yield from conn.execute("SELECT link, type, title FROM entries WHERE source_type = ? ORDER BY rowid", (source_type,))
+
+
+def iter_stale_entries(conn, source_type):
+    """Yield (link, type, title) for entries whose content is missing or outdated."""
+    yield from conn.execute(
+        "SELECT e.link, e.type, e.title FROM entries e "
+        "LEFT JOIN content c ON c.link = e.link AND c.source_type = e.source_type "
+        "WHERE e.source_type = ? AND (c.link IS NULL OR c.entry_revision != e.revision) ORDER BY e.rowid",
+        (source_type,))
+
+
+def upsert_content(conn, source_type, rows):
+    """Store (link, content) pairs; unchanged content is not rewritten.
+
+    The content is marked as made from the current entry row, so
+    `iter_stale_entries` skips it until that row changes.
+    """
+    before = conn.total_changes
+    with conn:
+        conn.executemany(
+            "INSERT INTO content (link, source_type, content, entry_revision) VALUES (?, ?, ?, "
+            "COALESCE((SELECT revision FROM entries WHERE link = ? AND source_type = ?), 0)) "
+            "ON CONFLICT(link, source_type) DO UPDATE SET content=excluded.content, "
+            "entry_revision=excluded.entry_revision, "
+            "revision=CASE WHEN content.content IS excluded.content THEN content.revision ELSE content.revision + 1 END "
+            "WHERE (content.content, content.entry_revision) IS NOT (excluded.content, excluded.entry_revision)",
+            [(link, source_type, text, link, source_type) for link, text in rows])
+    return conn.total_changes - before
+
+
+def iter_stale_content(conn, source_type):
+    """Yield (link, content, revision) for entries whose stats are missing or outdated."""
+    yield from conn.execute(
+        "SELECT e.link, COALESCE(c.content, ''), COALESCE(c.revision, 0) FROM entries e "
+        "LEFT JOIN content c ON c.link = e.link AND c.source_type = e.source_type "
+        "LEFT JOIN stats s ON s.link = e.link AND s.source_type = e.source_type "
+        "WHERE e.source_type = ? AND (s.link IS NULL OR s.content_revision != COALESCE(c.revision, 0))",
+        (source_type,))
+
+
+def upsert_stats(conn, source_type, rows):
+    """Store (link, word_count, character_count, content_revision) tuples."""
+    before = conn.total_changes
+    with conn:
+        conn.executemany(
+            "INSERT INTO stats (link, source_type, word_count, character_count, content_revision) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(link, source_type) DO UPDATE SET word_count=excluded.word_count, "
+            "character_count=excluded.character_count, content_revision=excluded.content_revision",
+            [(link, source_type, words, chars, rev) for link, words, chars, rev in rows])
+    return conn.total_changes - before
+
+
+def load_statistics(conn, source_types):
+    """Entry records for `source_types`, in the same order as the CSV loader."""
+    all_data = []
+    seen_links = set()
+    for st in source_types:
+        rows = conn.execute(
+            "SELECT e.link, e.date, e.title, COALESCE(s.word_count, 0), COALESCE(s.character_count, 0) "
+            "FROM entries e LEFT JOIN stats s ON s.link = e.link AND s.source_type = e.source_type "
+            "WHERE e.source_type = ? ORDER BY e.rowid", (st,))
+        for link, day, title, words, chars in rows:
+            if link not in seen_links:
+                seen_links.add(link)
+                all_data.append(diary_data.Entry(link, diary_data.parse_day(day), title, words, chars, st))
+    return all_data
+
+
+def year_source_counts(conn, source_types):
+    """{year: {source_type: entries}} aggregated in SQL.
+
+    Counts the entries `load_statistics` returns: only `source_types`, each
+    link under the first of them that lists it, and only valid dates.
+    """
+    counts = {}
+    if not source_types:
+        return counts
+    ranks = ", ".join("(?, ?)" for _ in source_types)
+    rows = conn.execute(
+        f"WITH ranks(source_type, rank) AS (VALUES {ranks}), "
+        "firsts AS (SELECT e.link, MIN(r.rank) AS rank FROM entries e JOIN ranks r USING (source_type) GROUP BY e.link) "
+        "SELECT CAST(substr(e.date, 1, 4) AS INTEGER) AS year, e.source_type, COUNT(*) FROM entries e "
+        "JOIN ranks r USING (source_type) JOIN firsts f ON f.link = e.link AND f.rank = r.rank "
+        "WHERE date(substr(e.date, 1, 10)) IS NOT NULL GROUP BY year, e.source_type",
+        [value for rank, st in enumerate(source_types) for value in (st, rank)])
+    for year, st, n in rows:
+        counts.setdefault(year, {})[st] = n
+    return counts
+
+
+def export_csv(conn, source_type, data_dir):
+    """Write sources_/content_/statistics_<type>.csv from the database."""
+    os.makedirs(data_dir, exist_ok=True)
+    exports = [
+        (f"sources_{source_type}.csv", ['Link', 'Date', 'Title', 'Type'],
+         "SELECT link, date, title, type FROM entries WHERE source_type = ? ORDER BY rowid"),
+        (f"content_{source_type}.csv", ['Link', 'Content'],
+         "SELECT e.link, c.content FROM entries e JOIN content c ON c.link = e.link AND c.source_type = e.source_type "
+         "WHERE e.source_type = ? ORDER BY e.rowid"),
+        (f"statistics_{source_type}.csv", ['Link', 'Date', 'Title', 'Word Count', 'Character Count'],
+         "SELECT e.link, e.date, e.title, COALESCE(s.word_count, 0), COALESCE(s.character_count, 0) "
+         "FROM entries e LEFT JOIN stats s ON s.link = e.link AND s.source_type = e.source_type "
+         "WHERE e.source_type = ? ORDER BY e.rowid"),
+    ]
+    for filename, header, query in exports:
+        filepath = os.path.join(data_dir, filename)
+        with open(filepath, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(conn.execute(query, (source_type,)))
+        print(f"Exported {filepath}")
+
+
+def import_csv(conn, source_type, data_dir):
+    """Load existing CSVs of `source_type` into the database."""
+    sources_file = os.path.join(data_dir, f"sources_{source_type}.csv")
+    if not os.path.exists(sources_file):
+        print(f"Input file {sources_file} not found.")
+        return
+    with open(sources_file, 'r', encoding='utf-8') as f:
+        data = [{'link': r['Link'], 'date': r['Date'], 'title': r['Title'], 'type': r['Type']} for r in csv.DictReader(f)]
+    upsert_entries(conn, source_type, data)
+
+    content_file = os.path.join(data_dir, f"content_{source_type}.csv")
+    if os.path.exists(content_file):
+        with open(content_file, 'r', encoding='utf-8') as f:
+            upsert_content(conn, source_type, ((r['Link'], r['Content']) for r in csv.DictReader(f)))
+
+    stats_file = os.path.join(data_dir, f"statistics_{source_type}.csv")
+    if os.path.exists(stats_file):
+        revisions = dict(conn.execute("SELECT link, revision FROM content WHERE source_type = ?", (source_type,)))
+        with open(stats_file, 'r', encoding='utf-8') as f:
+            upsert_stats(conn, source_type, (
+                (r['Link'], int(r['Word Count']), int(r['Character Count']), revisions.get(r['Link'], 0))
+                for r in csv.DictReader(f)))
+    print(f"Imported {source_type}: {len(data)} entries")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), "data")
+    db_path = path_from_args(argv, data_dir) or default_path(data_dir)
+    args = [a for a in argv if not a.startswith('--db')]
+    if not args or args[0] not in ('export', 'import'):
+        print("Usage: python scripts/diary_db.py export|import [--db=<path>] [type ...]")
+        return 1
+
+    source_types = args[1:] or list(diary_data.load_source_config(os.path.join(script_dir, "sources.json")))
+    conn = connect(db_path)
+    for st in source_types:
+        if args[0] == 'export':
+            export_csv(conn, st, data_dir)
+        else:
+            import_csv(conn, st, data_dir)
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+"""GitHub commits read from local clones with `git log` instead of the REST API.
+
+A `github` source in sources.json with a "clones" directory takes its
+entries from the clones and bare mirrors below that directory instead of
+api.github.com:
+
+    {"type": "github", "url": "kreier", "name": "GitHub", "clones": "~/src/github",
+     "authors": ["kreier", "mail@example.com"], "exclude": ["force-curves"]}
+
+Every repository whose `origin` is a GitHub repository of the user gets one
+`git log` of its default branch (HEAD), filtered to the "authors" (name or
+e-mail patterns as for `git log --author`; the user name by default). The
+logs of several repositories are read at once ("concurrency", default
+DEFAULT_WORKERS) and parsed as they stream in, so a run takes about as
+long as reading the commit graphs from disk and costs no API requests.
+
+The entries are the ones `iter_github` yields for the same commits:
+the commit URL, the UTC date of the author date and "[owner/repo] first
+line of the message", repo by repo in the order GitHub lists them, then
+one README entry per repo. Only the subject (%s) of each message is
+read; a subject wrapped over several lines is joined with spaces, where
+the API shows its first line. Forks cannot be told from other
+repositories offline; leave them out with "exclude" (or by not cloning
+them). The clones are not fetched, so the entries are as recent as the
+last `git fetch`.
+"""
+import concurrent.futures
+import os
+import re
+import subprocess
+from datetime import datetime, timezone
+
+import sharding
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# How deep below the clones directory to look for repositories
+MAX_DEPTH = 3
+READ_SIZE = 1 << 16
+GITHUB_REMOTE = re.compile(r'github\.com[:/]+([^/\s]+)/([^/\s]+?)(?:\.git)?/?$')
+
+
+def git(path, *args):
+    """Output of a git command in the repository at `path`, stripped; '' if it fails."""
+    result = subprocess.run(['git', '-C', path, *args], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else ''
+
+
+def is_repo(path):
+    """True for a working tree with a .git entry or a bare repository."""
+    if os.path.exists(os.path.join(path, '.git')):
+        return True
+    return all(os.path.exists(os.path.join(path, p)) for p in ('HEAD', 'objects', 'refs'))
+
+
+def find_repos(root, max_depth=MAX_DEPTH):
+    """Paths of the repositories below `root`, without descending into them."""
+    found = []
+    stack = [(root, 0)]
+    while stack:
+        path, depth = stack.pop()
+        if is_repo(path):
+            found.append(path)
+            continue
+        if depth >= max_depth:
+            continue
+        try:
+            with os.scandir(path) as it:
+                stack.extend((entry.path, depth + 1) for entry in it
+                             if entry.is_dir() and not entry.name.startswith('.'))
+        except OSError:
+            continue
+    return sorted(found)
+
+
+def full_name(path):
+    """'owner/repo' of the GitHub repository the clone at `path` was made from, or None."""
+    m = GITHUB_REMOTE.search(git(path, 'config', '--get', 'remote.origin.url'))
+    return f"{m.group(1)}/{m.group(2)}" if m else None
+
+
+def _commit(record):
+    sha, timestamp, subject = record.decode('utf-8', errors='replace').split('\x1f', 2)
+    return sha, int(timestamp), subject
+
+
+def read_log(path, authors):
+    """(sha, author timestamp, subject) of the commits on HEAD by `authors`, newest first."""
+    cmd = ['git', '-C', path, 'log', '-z', '--format=%H%x1f%at%x1f%s']
+    cmd += [f'--author={a}' for a in authors]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    commits = []
+    rest = b''
+    try:
+        # Commits are separated by NUL; parse them as the chunks arrive
+        for chunk in iter(lambda: proc.stdout.read(READ_SIZE), b''):
+            records = (rest + chunk).split(b'\0')
+            rest = records.pop()
+            commits.extend(_commit(record) for record in records)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    # The last commit has no separator after it; an empty repository has no log
+    if rest.strip():
+        commits.append(_commit(rest))
+    return commits
+
+
+def read_repo(path, name, authors):
+    """Commit entries, date of the latest one and README entry of one repository."""
+    commits = []
+    for sha, timestamp, subject in read_log(path, authors):
+        commits.append({
+            'link': f"https://github.com/{name}/commit/{sha}",
+            'date': datetime.fromtimestamp(timestamp, timezone.utc).date().isoformat(),
+            'title': f"[{name}] {subject}",
+            'type': 'github commit'
+        })
+    last_date = max((c['date'] for c in commits), default='')
+    if not last_date:
+        # No commits by the user: the date of the last commit, like GitHub's pushed_at
+        timestamp = git(path, 'log', '-1', '--format=%ct')
+        last_date = datetime.fromtimestamp(int(timestamp), timezone.utc).date().isoformat() if timestamp else ''
+    branch = git(path, 'symbolic-ref', '--short', 'HEAD') or 'main'
+    readme = {
+        'link': f"https://github.com/{name}/blob/{branch}/README.md",
+        'date': last_date,
+        'title': f"[{name}] README.md",
+        'type': 'github readme'
+    }
+    return commits, readme
+
+
+def scan(clones_dir, username, authors=None, exclude_repos=None, workers=DEFAULT_WORKERS, shard=None):
+    """Yield the commits of the user's repositories in `clones_dir`, then their README entries.
+
+    With a `shard` (see sharding.py) only the repositories of that shard are read.
+    """
+    root = os.path.abspath(os.path.expanduser(clones_dir))
+    exclude = set(exclude_repos or ())
+    repos = {}
+    other = 0
+    for path in find_repos(root):
+        name = full_name(path)
+        if not name or name.split('/')[0].lower() != username.lower():
+            other += 1
+        elif (name not in repos and name not in exclude and name.split('/')[1] not in exclude
+              and sharding.owns(shard, name)):
+            repos[name] = path
+    names = sorted(repos, key=str.lower)
+    print(f"Found {len(names)} repos of {username} in {root} ({other} other repositories skipped)")
+
+    readmes = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(read_repo, repos[name], name, authors or [username]) for name in names]
+        for name, future in zip(names, futures):
+            commits, readme = future.result()
+            print(f"  {name}: {len(commits)} commits")
+            yield from commits
+            readmes.append(readme)
+    yield from readmes
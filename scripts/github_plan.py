@@ -0,0 +1,287 @@
+"""Request-cost planner for fetching a user's GitHub commits in stage 1.
+
+There are two ways to get the commits:
+
+- listing per repo, `GET /repos/<repo>/commits?author=<user>`: one request
+  per 100 commits and at least one per repo, from the core quota
+  (5000/hour with a token, 60 without);
+- the commit search, `GET /search/commits?q=author:<user> user:<user>
+  committer-date:<range>`: one request per 100 commits over all repos, at
+  most 1000 results per query, from the search quota (30/minute with a
+  token, 10 without). Forks are not indexed and have to be listed.
+
+`plan()` estimates the commits of every repo from the last run
+(sources_github.csv) or, for repos without history, from `size` and the
+`created_at`..`pushed_at` span, and prices listing everything, searching
+everything and every mix in between: the busiest repos are listed and
+left out of the search with `-repo:` qualifiers, the long tail of small
+repos is searched. The cost of a plan is its estimated wall time at the
+remaining quotas, so a plan that would wait for a quota reset loses
+against one that needs a few more requests.
+"""
+import csv
+import os
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+PER_PAGE = 100
+SEARCH_MAX_RESULTS = 1000
+# Estimated commits per search date range; below the cap so that a low
+# estimate rarely forces a split at fetch time
+SEARCH_RANGE_TARGET = 800
+MAX_QUERY_LENGTH = 256
+# Nominal latency of one API request, used to compare plans in seconds
+REQUEST_SECONDS = 0.4
+# Estimates for repos without history
+KB_PER_COMMIT = 25
+COMMITS_PER_ACTIVE_WEEK = 3
+
+PLAN_MODES = ('auto', 'repos', 'search', 'mixed')
+
+
+class Quota:
+    """Remaining requests of one rate-limit resource."""
+
+    def __init__(self, limit, remaining, reset, window):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.window = window
+
+    def wait_seconds(self, requests, now=None):
+        """Time spent waiting for resets to make `requests` requests."""
+        if requests <= self.remaining:
+            return 0.0
+        now = time.time() if now is None else now
+        over = requests - self.remaining
+        return max(0.0, self.reset - now) + ((over - 1) // max(1, self.limit)) * self.window
+
+
+def default_quotas(authenticated):
+    now = time.time()
+    core = 5000 if authenticated else 60
+    search = 30 if authenticated else 10
+    return {'core': Quota(core, core, now + 3600, 3600),
+            'search': Quota(search, search, now + 60, 60)}
+
+
+def fetch_quotas(request_json, authenticated):
+    """Quotas from `GET /rate_limit` (which is free), or the documented defaults."""
+    quotas = default_quotas(authenticated)
+    try:
+        data, _ = request_json("https://api.github.com/rate_limit")
+        for name, window in (('core', 3600), ('search', 60)):
+            r = data['resources'][name]
+            quotas[name] = Quota(int(r['limit']), int(r['remaining']), int(r['reset']), window)
+    except Exception as e:
+        print(f"Could not read the GitHub rate limit ({e}); assuming full quotas")
+    return quotas
+
+
+def load_history(data_dir):
+    """{repo: {'count', 'first', 'latest', 'fetched', 'months'}} from the last sources_github.csv.
+
+    `fetched` is the day the file was written: no commits of the repo are
+    missing from it unless it was pushed later.
+    """
+    history = {}
+    path = os.path.join(data_dir, "sources_github.csv")
+    if not os.path.exists(path):
+        return history
+    fetched = date.fromtimestamp(os.path.getmtime(path)).isoformat()
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            title, day = row.get('Title', ''), row.get('Date', '')
+            if row.get('Type') != 'github commit' or not title.startswith('[') or ']' not in title or len(day) < 10:
+                continue
+            repo = title[1:title.index(']')]
+            h = history.setdefault(repo, {'count': 0, 'first': day, 'latest': day, 'fetched': fetched,
+                                           'months': Counter()})
+            h['count'] += 1
+            h['first'] = min(h['first'], day)
+            h['latest'] = max(h['latest'], day)
+            h['months'][day[:7]] += 1
+    return history
+
+
+def _day(value, default):
+    try:
+        return date.fromisoformat((value or '')[:10])
+    except ValueError:
+        return default
+
+
+def _months(first, last):
+    months = []
+    y, m = first.year, first.month
+    while (y, m) <= (last.year, last.month):
+        months.append(f"{y:04d}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return months
+
+
+def _spread(count, first, last):
+    months = _months(first, last)
+    share = count / len(months)
+    return Counter({m: share for m in months})
+
+
+def estimate_repo(repo, history, today):
+    """(estimated commits by the user, Counter of commits per 'YYYY-MM')."""
+    pushed = _day(repo.get('pushed_at'), today)
+    created = min(_day(repo.get('created_at'), pushed), pushed)
+    past = history.get(repo.get('full_name'))
+    if past:
+        months = Counter(past['months'])
+        latest = date.fromisoformat(past['latest'])
+        fetched = max(latest, date.fromisoformat(past['fetched']))
+        if pushed > fetched:
+            # Pushed since the last run: extrapolate the repo's own pace
+            span_weeks = max(1, (latest - date.fromisoformat(past['first'])).days / 7)
+            new = max(1, round(past['count'] / span_weeks * (pushed - fetched).days / 7))
+            months.update(_spread(new, fetched, pushed))
+        return sum(months.values()), months
+    if repo.get('fork'):
+        count = 1
+    else:
+        weeks = max(1, (pushed - created).days / 7)
+        count = max(1, min(int(repo.get('size') or 0) // KB_PER_COMMIT, round(weeks * COMMITS_PER_ACTIVE_WEEK)))
+    return count, _spread(count, created, pushed)
+
+
+def pages(n):
+    """Requests to page through `n` results (the last, short page ends the loop)."""
+    return int(n) // PER_PAGE + 1
+
+
+def search_ranges(months, first, last):
+    """Split first..last into committer-date ranges of about SEARCH_RANGE_TARGET commits.
+
+    Returns [(start, end, estimated commits)] with dates as `date`.
+    """
+    ranges = []
+    start, total = first, 0.0
+    for month in _months(first, last):
+        y, m = map(int, month.split('-'))
+        month_start = max(first, date(y, m, 1))
+        month_end = min(last, date(y + (m == 12), m % 12 + 1, 1) - timedelta(days=1))
+        n = months.get(month, 0)
+        if start < month_start and (n > SEARCH_RANGE_TARGET or total + n > SEARCH_RANGE_TARGET):
+            ranges.append((start, month_start - timedelta(days=1), total))
+            start, total = month_start, 0.0
+        if n > SEARCH_RANGE_TARGET:
+            # One busy month: cut it into equal day slices
+            slices = int(n // SEARCH_RANGE_TARGET) + 1
+            days = (month_end - month_start).days + 1
+            for i in range(slices):
+                a = month_start + timedelta(days=days * i // slices)
+                b = month_start + timedelta(days=days * (i + 1) // slices - 1)
+                if a <= b:
+                    ranges.append((a, b, n / slices))
+            start, total = month_end + timedelta(days=1), 0.0
+            continue
+        total += n
+    if start <= last:
+        ranges.append((start, last, total))
+    return ranges
+
+
+def search_query(username, exclusions, start, end):
+    terms = [f"author:{username}", f"user:{username}"] + [f"-repo:{r}" for r in exclusions]
+    return ' '.join(terms + [f"committer-date:{start.isoformat()}..{end.isoformat()}"])
+
+
+class Plan:
+    def __init__(self, name, listed, searched, exclusions, ranges, core, search, seconds):
+        self.name = name
+        self.listed = listed          # repo full names fetched per repo
+        self.searched = searched      # repo full names taken from the search
+        self.exclusions = exclusions  # -repo: qualifiers of the search query
+        self.ranges = ranges          # [(start, end, estimated commits)]
+        self.core = core              # estimated core requests
+        self.search = search          # estimated search requests
+        self.seconds = seconds
+
+    def describe(self):
+        return (f"GitHub plan '{self.name}': {len(self.listed)} repos listed, {len(self.searched)} searched "
+                f"in {len(self.ranges)} date ranges; estimated {self.core + self.search} requests "
+                f"({self.core} core, {self.search} search), ~{self.seconds:.0f}s")
+
+
+def _price(name, username, listed, searched, unwanted, base, estimates, spans, quotas, today, now):
+    """Build and price the plan that lists `listed` and searches `searched`.
+
+    `unwanted` are the searchable repos whose commits the search should
+    skip; the busiest of them are excluded as far as the query length
+    allows, the rest are filtered after fetching (and paid for). `base`
+    is the commit volume of all searchable repos per month.
+    """
+    core = sum(pages(estimates[r][0]) for r in listed)
+    exclusions, ranges = [], []
+    if searched:
+        longest = len(search_query(username, [], today, today))
+        for repo in sorted(unwanted, key=lambda r: -estimates[r][0]):
+            if longest + len(repo) + 7 <= MAX_QUERY_LENGTH:
+                exclusions.append(repo)
+                longest += len(repo) + 7
+        volume = Counter(base)
+        for repo in exclusions:
+            volume.subtract(estimates[repo][1])
+        first = min(spans[r][0] for r in searched)
+        last = max([today] + [spans[r][1] for r in searched])
+        ranges = search_ranges(volume, first, last)
+    search = sum(pages(n) for _, _, n in ranges)
+    seconds = ((core + search) * REQUEST_SECONDS + quotas['core'].wait_seconds(core, now)
+               + quotas['search'].wait_seconds(search, now))
+    return Plan(name, listed, searched, exclusions, ranges, core, search, seconds)
+
+
+def plan(username, repos, all_repos, history, quotas, mode='auto', today=None):
+    """The cheapest way to fetch the commits of `repos` (the repos kept after exclusions).
+
+    `all_repos` is the unfiltered listing; excluded repos are kept out of
+    the search where the query allows. `mode` forces 'repos', 'search' or
+    'mixed'; 'auto' takes the cheapest of all.
+    """
+    today = today or date.today()
+    now = time.time()
+    estimates = {r['full_name']: estimate_repo(r, history, today) for r in all_repos if r.get('full_name')}
+    # (created, pushed) span of every repo; the search covers the spans of the searched repos
+    spans = {}
+    for r in all_repos:
+        if r.get('full_name'):
+            pushed = _day(r.get('pushed_at'), today)
+            spans[r['full_name']] = (min(_day(r.get('created_at'), pushed), pushed), pushed)
+    kept = [r['full_name'] for r in repos if r.get('full_name')]
+    kept_set = set(kept)
+    forks = [r['full_name'] for r in repos if r.get('full_name') and r.get('fork')]
+    # Searchable repos, busiest first: listing these is closest to free
+    ranked = sorted((name for name in kept if name not in forks), key=lambda r: -estimates[r][0])
+    skipped = [r['full_name'] for r in all_repos
+               if r.get('full_name') and r['full_name'] not in kept_set and not r.get('fork')]
+
+    base = Counter()
+    for repo in ranked + skipped:
+        base.update(estimates[repo][1])
+
+    if mode == 'repos':
+        choices = [len(ranked)]
+    elif mode == 'search':
+        choices = [0]
+    elif mode == 'mixed' and len(ranked) > 1:
+        choices = range(1, len(ranked))
+    else:
+        choices = range(len(ranked) + 1)
+
+    best = None
+    for k in choices:
+        listed_set = set(forks) | set(ranked[:k])
+        listed = [r for r in kept if r in listed_set]
+        searched = ranked[k:]
+        name = 'repos' if not searched else 'search' if k == 0 else 'mixed'
+        candidate = _price(name, username, listed, searched, ranked[:k] + skipped,
+                           base, estimates, spans, quotas, today, now)
+        if best is None or (candidate.seconds, candidate.core + candidate.search) < (best.seconds, best.core + best.search):
+            best = candidate
+    return best
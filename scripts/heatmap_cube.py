@@ -0,0 +1,147 @@
+"""Dense day x source aggregates for the heatmap stage.
+
+The cube holds entry counts and word sums in NumPy arrays indexed by
+[day ordinal, source]. Levels, per-year maxima and the dominant source of a
+day are computed once for the whole period, so rendering an SVG cell is a
+plain array lookup. Only the years the reports render (FIRST_YEAR to
+LAST_YEAR) are kept: a single mistyped date such as 6100-01-01 would
+otherwise stretch the cube over millions of empty days.
+"""
+from datetime import date
+
+import numpy as np
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+FIRST_YEAR = 1970
+LAST_YEAR = 2026
+
+
+def ordinals_to_days(ordinals):
+    """Convert `date.toordinal()` values into datetime64[D]; 0 becomes NaT."""
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    days = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+    days[ordinals <= 0] = np.datetime64('NaT')
+    return days
+
+
+def parse_dates(dates):
+    """Parse 'YYYY-MM-DD' strings into datetime64[D]; unparsable values become NaT."""
+    values = [d[:10] if d else 'NaT' for d in dates]
+    try:
+        return np.array(values, dtype='datetime64[D]')
+    except ValueError:
+        parsed = np.empty(len(values), dtype='datetime64[D]')
+        for i, value in enumerate(values):
+            try:
+                parsed[i] = np.datetime64(value, 'D')
+            except ValueError:
+                parsed[i] = np.datetime64('NaT')
+        return parsed
+
+
+class DayCube:
+    def __init__(self, first_day, counts, words, source_types):
+        self.first_day = first_day
+        self.counts = counts
+        self.words = words
+        self.source_types = list(source_types)
+        self.source_index = {st: i for i, st in enumerate(self.source_types)}
+
+        days = first_day + np.arange(counts.shape[0])
+        self.years = days.astype('datetime64[Y]').astype(int) + 1970
+        self.totals = counts.sum(axis=1)
+        self.word_totals = words.sum(axis=1)
+        self.dominant = counts.argmax(axis=1)
+        self.mixed = (counts > 0).sum(axis=1) > 1
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    def index(self, day):
+        """Row of a `datetime.date` in the cube, or None if it lies outside."""
+        i = (np.datetime64(day, 'D') - self.first_day).astype(int)
+        return int(i) if 0 <= i < len(self) else None
+
+    def year_slice(self, year):
+        lo = int((np.datetime64(f'{year:04d}-01-01', 'D') - self.first_day).astype(int))
+        hi = int((np.datetime64(f'{year + 1:04d}-01-01', 'D') - self.first_day).astype(int))
+        return slice(max(lo, 0), max(min(hi, len(self)), 0))
+
+    def year_counts_by_source(self, year):
+        """Number of entries per source type in `year`."""
+        totals = self.counts[self.year_slice(year)].sum(axis=0)
+        return {st: int(totals[i]) for i, st in enumerate(self.source_types) if totals[i]}
+
+    def year_total(self, year):
+        return int(self.totals[self.year_slice(year)].sum())
+
+    def valid_years(self, lo=FIRST_YEAR, hi=LAST_YEAR):
+        active = self.years[self.totals > 0]
+        return sorted(int(y) for y in np.unique(active) if lo <= y <= hi)
+
+    def levels(self, weight='entries', scale='linear', steps=4):
+        """Intensity level (0..steps) of every day, relative to its own year.
+
+        `weight` is 'entries' or 'words'. `scale` is 'linear' (ceil of the
+        share of the year's busiest day) or 'quantile' (quartiles of the
+        year's active days).
+        """
+        values = self.totals if weight == 'entries' else self.word_totals
+        active = self.totals > 0
+        levels = np.zeros(len(self), dtype=np.int8)
+        if not active.any():
+            return levels
+
+        year_ids = self.years - self.years.min()
+        if scale == 'quantile':
+            for y in np.unique(year_ids[active]):
+                mask = active & (year_ids == y)
+                qs = np.quantile(values[mask], np.linspace(0, 1, steps + 1)[1:-1])
+                levels[mask] = 1 + np.searchsorted(qs, values[mask], side='left')
+        else:
+            year_max = np.zeros(year_ids.max() + 1, dtype=np.int64)
+            np.maximum.at(year_max, year_ids, values)
+            maxima = year_max[year_ids]
+            # integer ceil(value / max * steps); words may be 0 on active days
+            scaled = -(-values * steps // np.maximum(maxima, 1))
+            levels[active] = np.clip(scaled[active], 1, steps)
+        return levels
+
+
+def build_cube(dates, word_counts, source_types, known_sources, first_year=FIRST_YEAR, last_year=LAST_YEAR):
+    """Aggregate entry columns into a DayCube.
+
+    `dates`, `word_counts` and `source_types` are parallel sequences, one item
+    per entry; dates are either 'YYYY-MM-DD' strings or day ordinals. `known_sources` fixes the source axis order; unknown types are
+    appended after it. Entries dated outside `first_year`..`last_year` are
+    left out.
+    """
+    order = list(known_sources)
+    for st in sorted(set(source_types) - set(order)):
+        order.append(st)
+    src_index = {st: i for i, st in enumerate(order)}
+
+    if len(dates) and isinstance(dates[0], int):
+        days = ordinals_to_days(dates)
+    else:
+        days = parse_dates(dates)
+    lo = np.datetime64(f'{first_year:04d}-01-01', 'D')
+    hi = np.datetime64(f'{last_year + 1:04d}-01-01', 'D')
+    valid = ~np.isnat(days) & (days >= lo) & (days < hi)
+    days = days[valid]
+    src = np.fromiter((src_index[st] for st in source_types), dtype=np.intp, count=len(source_types))[valid]
+    words = np.asarray(word_counts, dtype=np.int64)[valid]
+
+    if days.size == 0:
+        first_day = EPOCH
+        ndays = 0
+    else:
+        first_day = days.min()
+        ndays = int((days.max() - first_day).astype(int)) + 1
+    # One flat bin per (day, source) cell; bincount is much faster than np.add.at
+    cells = (days - first_day).astype(np.intp) * len(order) + src
+    size = ndays * len(order)
+    counts = np.bincount(cells, minlength=size).astype(np.int32).reshape(ndays, len(order))
+    word_sums = np.bincount(cells, weights=words, minlength=size).astype(np.int64).reshape(ndays, len(order))
+    return DayCube(first_day, counts, word_sums, order)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""Local HTTP service rendering heatmaps of arbitrary date ranges.
+
+    GET /heatmap.svg                          the last 365 days, like a GitHub profile
+    GET /heatmap.svg?days=90                  the last 90 days
+    GET /heatmap.svg?start=2023-06-01&end=2024-05-31
+    GET /heatmap.svg?year=2019&source=github,quartz&weight=words&scale=quantile
+
+`source` takes source types or names, `weight` is 'entries' or 'words'
+and `scale` 'linear' or 'quantile'; intensity levels are relative to the
+rendered range and sources, as stage 4 makes them relative to the year.
+
+The statistics are loaded into memory once. Rendered SVGs are kept in an
+LRU cache keyed by the resolved range, sources and options, and are
+served with an ETag and `Cache-Control: max-age`; a request whose
+If-None-Match matches gets a 304. Every `--watch` seconds the statistics
+CSVs (or the database) are checked: when they changed, the data is
+reloaded, and only the cached SVGs whose range and sources cover a day
+whose entries changed are dropped. Every reload starts a new generation
+of the data; an SVG rendered from an older generation than the cache has
+seen invalidated is not cached.
+
+Usage:
+    python scripts/heatmap_server.py [--host 127.0.0.1] [--port 8800] [--cache-size N]
+                                     [--max-age S] [--watch S] [--db[=PATH]] [--verbose]
+"""
+import argparse
+import bisect
+import hashlib
+import os
+import statistics
+import threading
+import urllib.parse
+from collections import OrderedDict
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from run_pipeline import ROOT_DIR, SCRIPT_DIR, load_stage
+
+import diary_data
+import diary_db
+import metrics
+
+CACHE_SIZE = 256
+MAX_AGE = 300
+WATCH_INTERVAL = 10.0
+DEFAULT_DAYS = 365
+MAX_DAYS = 30 * 366
+STEPS = 4
+
+
+class LRUCache:
+    """Thread-safe LRU of rendered SVGs: key -> (body, etag)."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.generation = 0     # data generation of the last invalidate()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation=None):
+        """Cache `value` unless it was rendered from data older than the last invalidate()."""
+        with self.lock:
+            if generation is not None and generation < self.generation:
+                return
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def invalidate(self, changed, generation=None):
+        """Drop the entries that show a changed (day ordinal, source type); returns how many.
+
+        `changed` None drops everything. From now on only values of data
+        `generation` or later are cached.
+        """
+        with self.lock:
+            if generation is not None:
+                self.generation = max(self.generation, generation)
+            stale = [key for key in self.items
+                     if changed is None or any(key[0] <= day <= key[1] and source in key[2] for day, source in changed)]
+            for key in stale:
+                del self.items[key]
+        return len(stale)
+
+
+class Statistics:
+    """The entries of all sources by day, reloaded when their files change."""
+
+    def __init__(self, data_dir, sources_file, db_path=None):
+        self.data_dir = data_dir
+        self.sources_file = sources_file
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.source_config = {}
+        self.by_day = {}        # day ordinal -> [Entry], in stage 4's order
+        self.generation = 0     # loads so far
+        self.signature = None
+        self.load()
+
+    def files(self):
+        if self.db_path:
+            return [self.db_path, self.db_path + '-wal', self.sources_file]
+        return [os.path.join(self.data_dir, f"statistics_{st}.csv") for st in self.source_config] + [self.sources_file]
+
+    def _signature(self):
+        return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in self.files())
+
+    def load(self):
+        """Read everything; returns the changed (day ordinal, source type) pairs."""
+        source_config = diary_data.load_source_config(self.sources_file)
+        sources = list(source_config)
+        with metrics.timer('load_statistics'):
+            if self.db_path:
+                conn = diary_db.connect(self.db_path)
+                all_data = diary_db.load_statistics(conn, sources)
+                conn.close()
+            else:
+                all_data = diary_data.load_statistics(self.data_dir, sources)
+        metrics.add_rows('load_statistics', '', len(all_data))
+        by_day = {}
+        for item in all_data:
+            if item.day:
+                by_day.setdefault(item.day, []).append(item)
+
+        with self.lock:
+            old_config, old = self.source_config, self.by_day
+            self.source_config, self.by_day = source_config, by_day
+            self.generation += 1
+            self.signature = self._signature()
+
+        if old_config != source_config:
+            # Names and colours appear in every SVG
+            return None
+        changed = set()
+        key = lambda e: (e.link, e.title, e.word_count, e.source_type)
+        for day in old.keys() | by_day.keys():
+            before, after = old.get(day, []), by_day.get(day, [])
+            if list(map(key, before)) != list(map(key, after)):
+                changed.update((day, e.source_type) for e in before + after)
+        return changed
+
+    def changed_on_disk(self):
+        return self._signature() != self.signature
+
+    def snapshot(self):
+        with self.lock:
+            return self.source_config, self.by_day
+
+
+def range_levels(values, scale):
+    """Level 1..STEPS of every {day: value}, relative to the largest value or the quartiles."""
+    if not values:
+        return {}
+    if scale == 'quantile':
+        active = sorted(values.values())
+        if len(active) < 2:
+            return {day: 1 for day in values}
+        qs = statistics.quantiles(active, n=STEPS, method='inclusive')
+        return {day: 1 + bisect.bisect_left(qs, v) for day, v in values.items()}
+    top = max(max(values.values()), 1)
+    return {day: min(STEPS, max(1, -(-v * STEPS // top))) for day, v in values.items()}
+
+
+def render(stats, start, end, sources, weight='entries', scale='linear'):
+    """SVG heatmap of `start`..`end` for the source types `sources`."""
+    source_config, by_day = stats.snapshot()
+    config = {st: c for st, c in source_config.items() if st in sources}
+    order = list(config)
+
+    days = {}
+    values = {}
+    for d in range(start.toordinal(), end.toordinal() + 1):
+        entries = [e for e in by_day.get(d, ()) if e.source_type in sources]
+        if entries:
+            days[d] = entries
+            values[d] = len(entries) if weight == 'entries' else sum(e.word_count for e in entries)
+    levels = range_levels(values, scale)
+
+    def cell(day):
+        d = day.toordinal()
+        entries = days.get(d, [])
+        if not entries:
+            return entries, 0, None, ""
+        counts = {st: 0 for st in order}
+        for e in entries:
+            counts[e.source_type] += 1
+        # Most entries wins; ties go to the first source, as in the stage 4 cube
+        source_type = max(order, key=lambda st: (counts[st], -order.index(st)))
+        mixed_str = ""
+        if sum(1 for n in counts.values() if n) > 1:
+            per_source = [f"{n} {config.get(st, {}).get('name', st)}" for st, n in counts.items() if n]
+            mixed_str = f" ({', '.join(per_source)})"
+        entries = sorted(entries, key=lambda e: e.source_type != source_type)
+        return entries, levels[d], source_type, mixed_str
+
+    return load_stage(4).render_calendar(start, end, cell, config)
+
+
+class RequestError(ValueError):
+    pass
+
+
+def _date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise RequestError(f"{name} must be YYYY-MM-DD, not {value!r}")
+
+
+def parse_query(query, source_config, today=None):
+    """(start, end, source types, weight, scale) of a /heatmap.svg query string."""
+    params = {k: v[-1] for k, v in urllib.parse.parse_qs(query).items()}
+    today = today or date.today()
+    try:
+        if 'year' in params:
+            year = int(params['year'])
+            start, end = date(year, 1, 1), date(year, 12, 31)
+        else:
+            end = _date(params['end'], 'end') if 'end' in params else today
+            if 'start' in params:
+                start = _date(params['start'], 'start')
+            else:
+                start = end - timedelta(days=int(params.get('days', DEFAULT_DAYS)) - 1)
+    except RequestError:
+        raise
+    except (ValueError, OverflowError) as e:
+        raise RequestError(f"invalid range: {e}")
+    if start > end:
+        raise RequestError("start is after end")
+    if (end - start).days >= MAX_DAYS:
+        raise RequestError(f"ranges are limited to {MAX_DAYS} days")
+
+    sources = list(source_config)
+    if params.get('source'):
+        names = {config['name'].lower(): st for st, config in source_config.items()}
+        sources = []
+        for value in params['source'].split(','):
+            st = names.get(value.strip().lower(), value.strip())
+            if st not in source_config:
+                raise RequestError(f"unknown source {value!r}")
+            sources.append(st)
+
+    weight = params.get('weight', 'entries')
+    scale = params.get('scale', 'linear')
+    if weight not in ('entries', 'words') or scale not in ('linear', 'quantile'):
+        raise RequestError("weight is 'entries' or 'words', scale is 'linear' or 'quantile'")
+    return start, end, frozenset(sources), weight, scale
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'DiaryHeatmap/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/heatmap.svg':
+            return self.send(404, {'Content-Type': 'text/plain'}, "Try /heatmap.svg?days=365")
+        stats, cache = self.server.stats, self.server.cache
+        try:
+            start, end, sources, weight, scale = parse_query(url.query, stats.snapshot()[0])
+        except RequestError as e:
+            return self.send(400, {'Content-Type': 'text/plain'}, f"{e}\n")
+
+        key = (start.toordinal(), end.toordinal(), sources, weight, scale)
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.cache_hit('heatmap_svg')
+        else:
+            # Read before rendering: the data may be reloaded while it renders
+            generation = stats.generation
+            with metrics.timer('render_svg'):
+                body = render(stats, start, end, sources, weight, scale).encode('utf-8')
+            metrics.add_rows('render_svg', '', 1)
+            cached = (body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+            cache.put(key, cached, generation)
+        body, etag = cached
+
+        headers = {'ETag': etag, 'Cache-Control': f"public, max-age={self.server.max_age}"}
+        if etag in (t.strip() for t in self.headers.get('If-None-Match', '').split(',')):
+            return self.send(304, headers, b'')
+        self.send(200, {**headers, 'Content-Type': 'image/svg+xml; charset=utf-8'}, body)
+
+    def send(self, status, headers, body):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def watch(server, interval):
+    """Reload the statistics when their files change and drop the affected SVGs."""
+    while not server.stopped.wait(interval):
+        if not server.stats.changed_on_disk():
+            continue
+        try:
+            changed = server.stats.load()
+        except Exception as e:
+            # A file caught mid-write; the next check retries
+            print(f"Could not reload the statistics: {e}")
+            metrics.count_error(type(e).__name__)
+            continue
+        dropped = server.cache.invalidate(changed, server.stats.generation)
+        print(f"Statistics reloaded: {len({d for d, _ in changed or ()})} days changed, "
+              f"{dropped} cached SVGs dropped")
+
+
+def make_server(options, data_dir):
+    server = ThreadingHTTPServer((options.host, options.port), Handler)
+    server.daemon_threads = True
+    server.stats = Statistics(data_dir, os.path.join(SCRIPT_DIR, "sources.json"),
+                              diary_db.path_from_args(options.db, data_dir))
+    server.cache = LRUCache(options.cache_size)
+    server.max_age = options.max_age
+    server.verbose = options.verbose
+    server.stopped = threading.Event()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve heatmaps of arbitrary date ranges.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="rendered SVGs kept in memory")
+    parser.add_argument('--max-age', type=int, default=MAX_AGE, help="Cache-Control max-age in seconds")
+    parser.add_argument('--watch', type=float, default=WATCH_INTERVAL,
+                        help="seconds between checks for new statistics (0: never)")
+    parser.add_argument('--db', nargs='?', const='', default=None, metavar='PATH',
+                        help="read the statistics from the SQLite store")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    options = parser.parse_args(argv)
+    # diary_db.path_from_args takes the stage-style argument list
+    options.db = [] if options.db is None else ['--db' if not options.db else f"--db={options.db}"]
+
+    data_dir = os.path.join(ROOT_DIR, "data")
+    server = make_server(options, data_dir)
+    entries = sum(len(v) for v in server.stats.by_day.values())
+    print(f"Serving heatmaps of {entries} entries on http://{options.host}:{options.port}/heatmap.svg")
+    if options.watch > 0:
+        threading.Thread(target=watch, args=(server, options.watch), name='watch', daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stopped.set()
+        server.server_close()
+        metrics.write_report('heatmap_server', data_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
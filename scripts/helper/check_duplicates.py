@@ -11,19 +11,25 @@ import collections
 import os
 import sys
 
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+import profiling  # noqa: E402
+
 
 def find_duplicates(csv_path):
     if not os.path.exists(csv_path):
         print(f"File not found: {csv_path}")
         return 2
 
-    with open(csv_path, encoding='utf-8') as f:
+    with profiling.phase('load CSV'), open(csv_path, encoding='utf-8') as f:
         reader = csv.DictReader(f)
         rows = list(reader)
 
-    links = [row.get('Link','').strip() for row in rows]
-    counter = collections.Counter(links)
-    dup_links = [ln for ln,cnt in counter.items() if cnt > 1]
+    with profiling.phase('count links'):
+        links = [row.get('Link','').strip() for row in rows]
+        counter = collections.Counter(links)
+        dup_links = [ln for ln,cnt in counter.items() if cnt > 1]
 
     print(f"Scanning: {csv_path}")
     print(f"Total rows: {len(rows)}")
@@ -41,7 +47,7 @@ def find_duplicates(csv_path):
 
     # Save all duplicate rows to a CSV for inspection
     out_path = os.path.splitext(csv_path)[0] + '_duplicates.csv'
-    with open(out_path, 'w', newline='', encoding='utf-8') as out:
+    with profiling.phase('write duplicates'), open(out_path, 'w', newline='', encoding='utf-8') as out:
         writer = None
         written = 0
         for row in rows:
@@ -58,6 +64,8 @@ def find_duplicates(csv_path):
 
 def main(argv=None):
     argv = argv or sys.argv[1:]
+    profiling.setup('check_duplicates', argv, os.path.join(os.path.dirname(SCRIPTS_DIR), 'data'))
+    argv = [a for a in argv if a != '--profile']
     csv_path = argv[0] if argv else os.path.join('data', 'sources_legacy_html.csv')
     return find_duplicates(csv_path)
 
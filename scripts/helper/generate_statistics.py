@@ -5,9 +5,15 @@ import re
 from datetime import datetime, date, timedelta
 import math
 import os
+import sys
 import xml.sax.saxutils as saxutils
 import html
 
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+import profiling  # noqa: E402
+
 def fetch_url(url):
     try:
         # User-Agent to avoid some blocks
@@ -359,7 +365,9 @@ def main():
     sources_file = os.path.join(script_dir, "sources.json")
     with open(sources_file, "r") as f:
         sources = json.load(f)
+    profiling.setup('generate_statistics', sys.argv[1:], os.path.join(os.path.dirname(SCRIPTS_DIR), "data"))
 
+    profiling.switch('fetch')
     all_data = []
     for source in sources:
         if source['type'] == 'wordpress': all_data.extend(fetch_wordpress(source['url']))
@@ -368,6 +376,7 @@ def main():
         elif source['type'] == 'github': all_data.extend(fetch_github(source['url']))
 
     # Deduplicate by link
+    profiling.switch('dedupe')
     unique_data = []
     seen_links = set()
     for item in all_data:
@@ -376,6 +385,7 @@ def main():
             unique_data.append(item)
     all_data = unique_data
 
+    profiling.switch('index')
     data_by_date = {}
     total_words = 0
     for item in all_data:
@@ -403,6 +413,7 @@ def main():
     os.makedirs(assets_dir, exist_ok=True)
 
     # Generate CSV files for each source
+    profiling.switch('write CSVs')
     sources_data = {}
     for item in all_data:
         st = item.get('source_type', 'unknown')
@@ -448,6 +459,7 @@ def main():
         'github': 'GitHub'
     }
 
+    profiling.switch('render SVG')
     for year in range(end_year, start_year - 1, -1):
         year_data = [item for d, entries in data_by_date.items() if d.startswith(str(year)) for item in entries]
         year_entries = len(year_data)
@@ -539,11 +551,13 @@ def main():
     html_output.append("</html>")
 
     # Save index.html
+    profiling.switch('write index.html')
     index_path = os.path.join(os.path.dirname(script_dir), "docs", "index.html")
     with open(index_path, "w") as f:
         f.write("\n".join(html_output))
     print(f"{index_path} generated.")
 
+    profiling.switch('write README')
     readme_path = os.path.join(os.path.dirname(script_dir), "docs", "README.md")
     if not os.path.exists(readme_path):
         os.makedirs(os.path.dirname(readme_path), exist_ok=True)
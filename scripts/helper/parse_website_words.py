@@ -1,14 +1,45 @@
+"""Word, character and image counts of web pages.
+
+Usage:
+    python scripts/helper/parse_website_words.py <URL> [--profile]
+    python scripts/helper/parse_website_words.py --batch FILE [FILE ...] [--format csv|json]
+                                                 [--output PATH] [--workers N] [--profile]
+
+A batch FILE is a `sources_*.csv` (its Link column) or a text file with
+one URL per line; `-` reads the URLs from stdin. The pages are fetched
+by `--workers` threads, each of which keeps its connection to a host
+open for the next page, and one row per URL is written in input order:
+CSV, or one JSON object per line with `--format json`. Pages that could
+not be fetched get an `error` instead of counts.
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
 import sys
 import urllib.request
 import re
 import html
 import math
 
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+import metrics  # noqa: E402
+import profiling  # noqa: E402
+import resilience  # noqa: E402
+
+FIELDS = ['url', 'words', 'characters', 'images', 'reading_time_minutes', 'error']
+
+def fetch(url):
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    with resilience.urlopen(req, timeout=10) as response:
+        return response.read().decode('utf-8', errors='ignore')
+
 def fetch_url(url):
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=10) as response:
-            return response.read().decode('utf-8', errors='ignore')
+        return fetch(url)
     except Exception as e:
         print(f"Error fetching {url}: {e}")
         return None
@@ -29,32 +60,100 @@ def count_images(html_content):
         return 0
     return len(re.findall(r'<img\s+[^>]*src="([^"]+)"', html_content, re.IGNORECASE))
 
+def page_stats(raw_html):
+    """Words, characters, images and reading time of one page."""
+    image_count = count_images(raw_html)
+    cleaned_text = strip_html(raw_html)
+    word_count = len(re.findall(r'\w+', cleaned_text))
+    return {'words': word_count, 'characters': len(cleaned_text), 'images': image_count,
+            'reading_time_minutes': math.ceil(word_count / 200)}
+
+def read_urls(path):
+    """URLs of a sources CSV (Link column) or of a text file with one URL per line."""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', newline='')
+    try:
+        first = f.readline()
+        if first.startswith('Link,') or first.strip() == 'Link':
+            return [row['Link'] for row in csv.DictReader([first] + list(f)) if row.get('Link')]
+        lines = [first] + list(f)
+        return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith('#')]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def audit(url):
+    try:
+        raw_html = fetch(url)
+    except Exception as e:
+        metrics.count_error(type(e).__name__)
+        return {'url': url, 'error': str(e)}
+    return {'url': url, **page_stats(raw_html)}
+
+def run_batch(urls, out, fmt='csv', workers=8):
+    """Write one row per URL to `out`, in order; returns the number of failed pages."""
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+    failed = 0
+    with metrics.timer('parse_website_words'), concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, row in enumerate(pool.map(audit, urls), 1):
+            failed += 'error' in row
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(row, ensure_ascii=False) + '\n')
+            if i % 100 == 0:
+                print(f"  {i}/{len(urls)} pages", file=sys.stderr)
+    metrics.add_rows('parse_website_words', '', len(urls))
+    return failed
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 scripts/parse_website_words.py <URL>")
+    parser = argparse.ArgumentParser(description="Count the words, characters and images of web pages.")
+    parser.add_argument('url', nargs='?', help="page to analyze")
+    parser.add_argument('--batch', nargs='+', metavar='FILE', help="sources CSVs or URL lists ('-' for stdin)")
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv', help="batch output format")
+    parser.add_argument('--output', help="batch output file (default: stdout)")
+    parser.add_argument('--workers', type=int, default=8, help="pages fetched at once in batch mode")
+    parser.add_argument('--profile', action='store_true', help="write a cProfile/tracemalloc report")
+    args = parser.parse_args()
+    if not args.url and not args.batch:
+        print("Usage: python3 scripts/helper/parse_website_words.py <URL> [--profile]")
+        print("       python3 scripts/helper/parse_website_words.py --batch FILE [FILE ...] [--format csv|json]")
         sys.exit(1)
+    data_dir = os.path.join(os.path.dirname(SCRIPTS_DIR), "data")
+    profiling.setup('parse_website_words', sys.argv[1:], data_dir)
 
-    url = sys.argv[1]
+    if args.batch:
+        urls = list(dict.fromkeys(url for path in args.batch for url in read_urls(path)))
+        print(f"Auditing {len(urls)} pages with {args.workers} workers...", file=sys.stderr)
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            with profiling.phase('fetch and count'):
+                failed = run_batch(urls, out, args.format, max(1, args.workers))
+        finally:
+            if args.output:
+                out.close()
+        metrics.write_report('parse_website_words', data_dir)
+        print(f"Done: {len(urls) - failed} pages counted, {failed} failed", file=sys.stderr)
+        sys.exit(1 if failed == len(urls) and urls else 0)
+
+    url = args.url
     print(f"Fetching content from: {url}")
 
-    raw_html = fetch_url(url)
+    with profiling.phase('fetch'):
+        raw_html = fetch_url(url)
     if raw_html is None:
         sys.exit(1)
 
-    image_count = count_images(raw_html)
-    cleaned_text = strip_html(raw_html)
-
-    words = re.findall(r'\w+', cleaned_text)
-    word_count = len(words)
-    char_count = len(cleaned_text)
-
-    reading_time_minutes = math.ceil(word_count / 200)
+    with profiling.phase('strip html'):
+        stats = page_stats(raw_html)
 
     print("\n--- Statistics ---")
-    print(f"Words: {word_count}")
-    print(f"Characters: {char_count}")
-    print(f"Images: {image_count}")
-    print(f"Estimated reading time: {reading_time_minutes} min")
+    print(f"Words: {stats['words']}")
+    print(f"Characters: {stats['characters']}")
+    print(f"Images: {stats['images']}")
+    print(f"Estimated reading time: {stats['reading_time_minutes']} min")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Query writing patterns from the precomputed rollups.
+
+Usage:
+    python scripts/helper/query_stats.py streak [--source quartz] [--year 2024]
+    python scripts/helper/query_stats.py weekday [--year 2024] [--source github]
+    python scripts/helper/query_stats.py monthly --year 2024 [--source quartz] [--words]
+    python scripts/helper/query_stats.py top [-k 5] [--source wordpress]
+    python scripts/helper/query_stats.py days [-k 5] [--year 2024]
+    python scripts/helper/query_stats.py weeks [-k 5] [--source github] [--words]
+
+Sources can be given by type (`legacy_html`) or by name (`Legacy HTML`).
+The statistics are loaded once and rolled up; each query is then a lookup.
+"""
+import argparse
+import os
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+
+import diary_data  # noqa: E402
+import heatmap_cube  # noqa: E402
+import profiling  # noqa: E402
+import rollups  # noqa: E402
+
+
+def resolve_source(name, source_config):
+    if name is None:
+        return None
+    wanted = name.lower()
+    for st, config in source_config.items():
+        if wanted in (st.lower(), config['name'].lower()):
+            return st
+    raise SystemExit(f"Unknown source: {name}")
+
+
+def load_rollups(data_dir, source_config):
+    sources = list(source_config.keys())
+    with profiling.phase('load CSVs'):
+        all_data = diary_data.load_statistics(data_dir, sources)
+    with profiling.phase('index'):
+        cube = heatmap_cube.build_cube(
+            [item.day for item in all_data],
+            [item.word_count for item in all_data],
+            [item.source_type for item in all_data],
+            sources)
+    with profiling.phase('rollups'):
+        return rollups.Rollups(cube, all_data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query diary writing patterns.")
+    parser.add_argument('query', choices=['streak', 'weekday', 'monthly', 'top', 'days', 'weeks'])
+    parser.add_argument('--source', help="source type or name")
+    parser.add_argument('--year', type=int)
+    parser.add_argument('--words', action='store_true', help="sum words instead of entries")
+    parser.add_argument('-k', type=int, default=3, help="length of top-k lists")
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(SCRIPTS_DIR), 'data'))
+    parser.add_argument('--profile', action='store_true', help="write a cProfile/tracemalloc report")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.setup('query_stats', ['--profile'], args.data_dir)
+
+    source_config = diary_data.load_source_config(os.path.join(SCRIPTS_DIR, 'sources.json'))
+    source = resolve_source(args.source, source_config)
+    r = load_rollups(args.data_dir, source_config)
+    unit = 'words' if args.words else 'entries'
+
+    profiling.switch('query')
+    if args.query == 'streak':
+        streak = r.longest_streak(source=source, year=args.year)
+        if streak is None:
+            print("No activity.")
+            return 1
+        first, last, length = streak
+        print(f"Longest streak: {length} days ({first} to {last})")
+    elif args.query == 'weekday':
+        if args.year is None:
+            for year in r.cube.valid_years():
+                weekday, n = r.busiest_weekday(year, source, args.words)
+                if n:
+                    print(f"{year}: {weekday} ({n} {unit})")
+        else:
+            try:
+                weekday, n = r.busiest_weekday(args.year, source, args.words)
+            except KeyError as e:
+                parser.error(e.args[0])
+            if not n:
+                parser.error(f"No data for {args.year}")
+            print(f"{args.year}: {weekday} ({n} {unit})")
+    elif args.query == 'monthly':
+        if args.year is None:
+            parser.error("monthly requires --year")
+        try:
+            months = r.monthly(args.year, source, args.words)
+        except KeyError as e:
+            parser.error(e.args[0])
+        for month, n in zip(rollups.MONTHS, months):
+            print(f"{month} {args.year}: {n} {unit}")
+    elif args.query == 'top':
+        for i, item in enumerate(r.top_entries(args.k, source), 1):
+            print(f"#{i}: {item.title} ({item.word_count} words, {item.date}) {item.link}")
+    elif args.query == 'days':
+        for i, (d, n) in enumerate(r.top_days(args.k, args.year), 1):
+            print(f"#{i}: {d} ({n} entries)")
+    elif args.query == 'weeks':
+        for i, (d, n) in enumerate(r.top_weeks(args.k, source, args.words), 1):
+            print(f"#{i}: week of {d} ({n} {unit})")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
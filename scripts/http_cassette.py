@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Record HTTP responses to a cassette directory, or send requests to a stand-in server.
+
+All fetches of stages 1 and 2 go through `resilience.urlopen` and
+`metrics.urlopen`, which opens requests with `urlopen` from this module
+over persistent connections (http_pool.py). Two environment variables
+change what that does:
+
+    DIARY_HTTP_RECORD=<dir>    fetch normally and save every response
+                               (including 403/404 errors) under <dir>/<host>/,
+                               with as much of the body as the caller read
+    DIARY_HTTP_REPLAY=<url>    send every request to the local server at <url>
+                               (scripts/benchmark/standin.py) instead of the
+                               real host
+
+Recording leaves the responses to their callers as they are: a response
+closed unread (a non-text page) is saved without a body, and a page cut
+off at its byte cap with the bytes read up to there, so a replay sees the
+same cases.
+
+The stand-in server sees `https://api.github.com/users/x/repos?page=2` as
+`<url>/https/api.github.com/users/x/repos?page=2` and can look it up in a
+cassette with `load(root, url)`.
+
+Usage:
+    python scripts/http_cassette.py list <dir>     recorded requests
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+import urllib.response
+
+import http_pool
+
+RECORD_ENV = 'DIARY_HTTP_RECORD'
+REPLAY_ENV = 'DIARY_HTTP_REPLAY'
+
+# Headers that describe the transfer rather than the response
+SKIP_HEADERS = {'connection', 'content-length', 'transfer-encoding', 'keep-alive'}
+
+
+class Response(urllib.response.addinfourl):
+    """In-memory response with the `getheader` method of http.client responses."""
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class _RecordingResponse:
+    """Proxy for an urlopen response that saves what was read of it when closed."""
+
+    def __init__(self, response, root, url, method):
+        self._response = response
+        self._root = root
+        self._url = url
+        self._method = method
+        self._chunks = []
+        self._saved = False
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._chunks.append(data)
+        return data
+
+    def close(self):
+        if not self._saved:
+            self._saved = True
+            save(self._root, self._url, self._response.status, self._response.headers,
+                 b''.join(self._chunks), self._method)
+        self._response.close()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cassette_path(root, url, method='GET'):
+    host = urllib.parse.urlsplit(url).hostname or 'unknown'
+    key = hashlib.sha1(f"{method} {url}".encode('utf-8')).hexdigest()[:20]
+    return os.path.join(root, host, f"{key}.json")
+
+
+def save(root, url, status, headers, body, method='GET'):
+    path = cassette_path(root, url, method)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    record = {'method': method, 'url': url, 'status': status,
+              'headers': [[k, v] for k, v in headers.items() if k.lower() not in SKIP_HEADERS]}
+    try:
+        record['body'] = body.decode('utf-8')
+    except UnicodeDecodeError:
+        record['body_base64'] = base64.b64encode(body).decode('ascii')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+
+
+def load(root, url, method='GET'):
+    """The recorded (status, [(header, value)], body bytes) for a request, or None."""
+    path = cassette_path(root, url, method)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        record = json.load(f)
+    if 'body_base64' in record:
+        body = base64.b64decode(record['body_base64'])
+    else:
+        body = record['body'].encode('utf-8')
+    return record['status'], [tuple(h) for h in record['headers']], body
+
+
+def local_url(base, url):
+    """`url` as a path on the stand-in server at `base`."""
+    parts = urllib.parse.urlsplit(url)
+    local = f"{base.rstrip('/')}/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+    return f"{local}?{parts.query}" if parts.query else local
+
+
+def original_url(path):
+    """Inverse of `local_url` for the path (and query) the stand-in server received."""
+    scheme, _, rest = path.lstrip('/').partition('/')
+    return f"{scheme}://{rest}"
+
+
+def urlopen(req, timeout=None):
+    if isinstance(req, str):
+        req = urllib.request.Request(req)
+    replay = os.environ.get(REPLAY_ENV)
+    if replay:
+        req = urllib.request.Request(local_url(replay, req.full_url), data=req.data,
+                                     headers=dict(req.header_items()), method=req.get_method())
+        return http_pool.urlopen(req, timeout=timeout)
+    root = os.environ.get(RECORD_ENV)
+    if not root:
+        return http_pool.urlopen(req, timeout=timeout)
+
+    url, method = req.full_url, req.get_method()
+    try:
+        response = http_pool.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        save(root, url, e.code, e.headers, body, method)
+        raise urllib.error.HTTPError(e.url, e.code, e.msg, e.headers, io.BytesIO(body))
+    return _RecordingResponse(response, root, url, method)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] != 'list':
+        print(__doc__)
+        return 1
+    for host in sorted(os.listdir(argv[1])):
+        for name in sorted(os.listdir(os.path.join(argv[1], host))):
+            with open(os.path.join(argv[1], host, name), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            size = len(record.get('body', record.get('body_base64', '')))
+            print(f"{record['status']} {record['method']} {record['url']} ({size} bytes)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
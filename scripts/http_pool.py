@@ -0,0 +1,130 @@
+"""Persistent HTTP connections for urllib requests.
+
+urllib.request opens a new connection for every request and asks the
+server to close it afterwards, so each fetch pays a TCP (and TLS)
+handshake. `urlopen` from this module sends the same requests through
+handlers that keep the connection of each thread to each host open and
+reuse it for that thread's next request to the host.
+
+A connection is reused only when its last response was read to the end
+and the server did not ask to close it; a response closed early (a body
+over a size cap, an unread error page) costs its connection. When a
+reused connection turns out to have been closed by the server in the
+meantime, an idempotent request is sent once more on a new one. Requests
+through a proxy tunnel are not pooled.
+"""
+import http.client
+import threading
+import urllib.error
+import urllib.request
+
+IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+_local = threading.local()
+
+
+class _Response(http.client.HTTPResponse):
+    """Response that remembers whether it was closed before the end of its body."""
+
+    cut_short = False
+
+    def close(self):
+        if self.fp is not None:
+            self.cut_short = True
+        super().close()
+
+    def reusable(self):
+        return self.isclosed() and not self.cut_short and not self.will_close
+
+
+def _idle():
+    """Idle connections of this thread: (connection class, host) -> (connection, last response)."""
+    if not hasattr(_local, 'idle'):
+        _local.idle = {}
+    return _local.idle
+
+
+def _checkout(key):
+    entry = _idle().pop(key, None)
+    if entry is None:
+        return None
+    conn, response = entry
+    if conn.sock is not None and response.reusable():
+        return conn
+    conn.close()
+    return None
+
+
+def _server_closed(e):
+    reason = getattr(e, 'reason', e)
+    return isinstance(reason, (ConnectionResetError, ConnectionAbortedError, BrokenPipeError,
+                               http.client.RemoteDisconnected))
+
+
+def close_idle():
+    """Close this thread's idle connections."""
+    idle = _idle()
+    for conn, _ in idle.values():
+        conn.close()
+    idle.clear()
+
+
+class _PooledHandlerMixin:
+    def do_open(self, http_class, req, **http_conn_args):
+        if req._tunnel_host:
+            return super().do_open(http_class, req, **http_conn_args)
+        host = req.host
+        if not host:
+            raise urllib.error.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+        headers['Connection'] = 'keep-alive'
+
+        key = (http_class, host)
+        conn = _checkout(key)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = http_class(host, timeout=req.timeout, **http_conn_args)
+                conn.set_debuglevel(self._debuglevel)
+                conn.response_class = _Response
+            else:
+                conn.timeout = req.timeout
+                conn.sock.settimeout(req.timeout)
+            try:
+                try:
+                    conn.request(req.get_method(), req.selector, req.data, headers,
+                                 encode_chunked=req.has_header('Transfer-encoding'))
+                except OSError as err:
+                    raise urllib.error.URLError(err)
+                r = conn.getresponse()
+            except Exception as e:
+                conn.close()
+                if reused and _server_closed(e) and req.get_method() in IDEMPOTENT:
+                    conn, reused = None, False
+                    continue
+                raise
+            break
+
+        _idle()[key] = (conn, r)
+        r.url = req.get_full_url()
+        r.msg = r.reason
+        return r
+
+
+class HTTPHandler(_PooledHandlerMixin, urllib.request.HTTPHandler):
+    pass
+
+
+class HTTPSHandler(_PooledHandlerMixin, urllib.request.HTTPSHandler):
+    pass
+
+
+_opener = urllib.request.build_opener(HTTPHandler, HTTPSHandler)
+
+
+def urlopen(req, timeout=None):
+    """urllib.request.urlopen over this thread's persistent connections."""
+    return _opener.open(req, timeout=timeout)
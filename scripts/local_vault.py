@@ -0,0 +1,168 @@
+"""Notes of a local Obsidian vault or Quartz content directory, read from disk.
+
+A `local_markdown` source in sources.json names the vault directory as
+its "url"; "publish_url" is the site the notes are published at, and
+"exclude" lists folders (relative to the vault) to leave out:
+
+    {"type": "local_markdown", "url": "~/Notes", "name": "Vault",
+     "publish_url": "https://kreier.github.io/quartz", "exclude": ["templates/"]}
+
+`scan()` walks the vault for Markdown notes and yields the same entries as
+the Quartz source: the link under the published site (or a file:// URL
+when there is none), the date and the title. Dates and titles come from
+the YAML frontmatter (`date`, `created`, `published`; `title`), else from
+a date in the file path and the file name, else from the file's mtime.
+Notes with `draft: true` or `publish: false` are skipped, as Quartz does,
+and so are hidden folders such as .obsidian and .trash.
+
+Every scan saves a manifest (data/vault_<name>.json) with the mtime and
+size of each note next to its entry and plain text. A note whose mtime
+and size are unchanged is not opened again, so a rescan of thousands of
+notes is a walk of the directory tree. Stage 2 takes the text of a note
+from the manifest (see side_texts.py) instead of reading it again.
+"""
+import json
+import os
+import re
+import urllib.parse
+import urllib.request
+from datetime import date
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "data")
+MANIFEST_VERSION = 1
+NOTE_SUFFIXES = ('.md', '.markdown')
+DATE_KEYS = ('date', 'created', 'published')
+
+
+def manifest_path(data_dir, name):
+    slug = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') or 'vault'
+    return os.path.join(data_dir or DATA_DIR, f"vault_{slug}.json")
+
+
+def slugify(rel_path):
+    """Quartz's slug of a note path: no suffix, '/' separators, no spaces."""
+    slug = os.path.splitext(rel_path)[0].replace(os.sep, '/')
+    slug = slug.replace(' ', '-').replace('&', '-and-').replace('%', '-percent')
+    return re.sub(r'[?#]', '', slug)
+
+
+def parse_frontmatter(text):
+    """({key: value}, body) for a note; only the flat `key: value` lines of the YAML are read."""
+    if not text.startswith('---'):
+        return {}, text
+    end = re.search(r'^(---|\.\.\.)\s*$', text[3:], re.MULTILINE)
+    if not end:
+        return {}, text
+    meta = {}
+    for line in text[3:3 + end.start()].splitlines():
+        m = re.match(r'^([A-Za-z_][\w-]*)\s*:\s*(.*?)\s*$', line)
+        if m:
+            meta[m.group(1).lower()] = m.group(2).strip('\'"')
+    return meta, text[3 + end.end():]
+
+
+def markdown_text(body):
+    """Readable text of a Markdown body, roughly what the rendered page shows."""
+    text = re.sub(r'^```.*?^```', '', body, flags=re.MULTILINE | re.DOTALL)
+    text = re.sub(r'!\[\[[^\]]*\]\]|!\[[^\]]*\]\([^)]*\)', '', text)         # embeds and images
+    text = re.sub(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]', r'\1', text)             # [[note|alias]]
+    text = re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', text)                      # [text](url)
+    text = re.sub(r'<[^<]+?>', '', text)
+    text = re.sub(r'^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+', '', text, flags=re.MULTILINE)
+    return re.sub(r'[*_~=`]+', '', text).strip()
+
+
+def _date_from(meta, rel_path, mtime):
+    for key in DATE_KEYS:
+        m = re.match(r'\d{4}-\d{2}-\d{2}', meta.get(key, ''))
+        if m:
+            return m.group(0)
+    m = re.search(r'(\d{4})[/-](\d{2})[/-](\d{2})', rel_path)
+    if m:
+        return '-'.join(m.groups())
+    return date.fromtimestamp(mtime).isoformat()
+
+
+def read_note(path, rel_path, base_url, mtime):
+    """Manifest record of one note; `skip` is set for drafts."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        meta, body = parse_frontmatter(f.read())
+    if base_url:
+        link = f"{base_url.rstrip('/')}/{slugify(rel_path)}"
+    else:
+        link = urllib.parse.urljoin('file:', urllib.request.pathname2url(path))
+    return {
+        'link': link,
+        'date': _date_from(meta, rel_path, mtime),
+        'title': meta.get('title') or os.path.splitext(os.path.basename(rel_path))[0],
+        'text': markdown_text(body),
+        'skip': meta.get('draft', '').lower() == 'true' or meta.get('publish', '').lower() == 'false',
+    }
+
+
+def load_manifest(path, root, base_url):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Links depend on the vault location and the published URL
+    if (manifest.get('version'), manifest.get('root'), manifest.get('base_url')) != (MANIFEST_VERSION, root, base_url):
+        return {}
+    return manifest.get('notes', {})
+
+
+def walk(root, exclude=()):
+    """(relative path, os.stat_result) of every note below `root`, skipping hidden folders."""
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.name.startswith('.') or any(rel.replace(os.sep, '/').startswith(p) for p in exclude):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                elif entry.name.lower().endswith(NOTE_SUFFIXES):
+                    yield rel, entry.stat()
+
+
+def scan(vault_dir, base_url=None, exclude_paths=None, manifest=None):
+    """Yield the entries of the notes in `vault_dir`, in path order, and update the manifest."""
+    root = os.path.abspath(os.path.expanduser(vault_dir))
+    exclude = tuple(p.strip('/') for p in exclude_paths or ())
+    previous = load_manifest(manifest, root, base_url) if manifest else {}
+    notes = {}
+    read = 0
+    for rel, st in sorted(walk(root, exclude)):
+        record = previous.get(rel)
+        if record is None or record['mtime_ns'] != st.st_mtime_ns or record['size'] != st.st_size:
+            record = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size,
+                      **read_note(os.path.join(root, rel), rel, base_url, st.st_mtime)}
+            read += 1
+        notes[rel] = record
+    print(f"Scanned {len(notes)} notes in {root}: {read} read, {len(notes) - read} unchanged")
+
+    if manifest:
+        os.makedirs(os.path.dirname(manifest), exist_ok=True)
+        with open(manifest + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'root': root, 'base_url': base_url, 'notes': notes},
+                      f, ensure_ascii=False)
+        os.replace(manifest + '.tmp', manifest)
+
+    for rel, record in notes.items():
+        if not record['skip']:
+            # `revision` tells a long-running refresh that the text changed
+            yield {'link': record['link'], 'date': record['date'], 'title': record['title'],
+                   'type': 'local_markdown', 'revision': record['mtime_ns']}
+
+
+def read_texts(path):
+    """Yield (link, plain text) of the notes in a manifest."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for record in json.load(f).get('notes', {}).values():
+            yield record['link'], record['text']
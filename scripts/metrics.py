@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""Run metrics for the pipeline scripts.
+
+Collects wall time per stage and source, HTTP request counts, bytes and
+latency histograms per host, cache hits, time slept on rate limits, error
+counts by type, skipped or truncated responses, retries and circuit
+breaker trips per host, and row throughput. Everything lives in one process-wide,
+thread-safe registry; `write_report(job, data_dir)` saves it as
+
+    data/metrics/<job>.json       the run report
+    data/metrics/<job>.prom       Prometheus textfile (node_exporter format)
+    data/metrics/history.jsonl    one line per run, to compare runs over time
+
+Set DIARY_METRICS_DIR to write somewhere else, e.g. the node_exporter
+textfile directory. Every file holds the values of one run, which start
+from zero again in the next, so the counts are exported as gauges.
+
+Usage:
+    python scripts/metrics.py [job]     summary of the last report
+"""
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+
+import http_cassette
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_started = time.time()
+_stages = {}     # (stage, source) -> {'seconds', 'rows'}
+_hosts = {}      # host -> {'requests', 'bytes', 'errors', 'seconds', 'buckets'}
+_counters = {}   # (name, label) -> value
+
+
+def reset():
+    """Start a new run (used by long-running processes between runs)."""
+    global _started
+    with _lock:
+        _started = time.time()
+        _stages.clear()
+        _hosts.clear()
+        _counters.clear()
+
+
+def _add(name, label, value):
+    with _lock:
+        _counters[(name, label)] = _counters.get((name, label), 0) + value
+
+
+def count_error(kind):
+    _add('errors', kind, 1)
+
+
+def cache_hit(cache, n=1):
+    _add('cache_hits', cache, n)
+
+
+def count_retry(host):
+    _add('retries', host, 1)
+
+
+def circuit_open(host):
+    _add('circuit_open', host, 1)
+
+
+def count_skip(reason):
+    """A response that was not read in full (non-text, binary, over the size cap)."""
+    _add('skipped', reason, 1)
+
+
+def add_rows(stage, source, n):
+    with _lock:
+        _stages.setdefault((stage, source), {'seconds': 0.0, 'rows': 0})['rows'] += n
+
+
+@contextmanager
+def timer(stage, source=''):
+    """Add the wall time of the block to `stage`/`source`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _stages.setdefault((stage, source), {'seconds': 0.0, 'rows': 0})['seconds'] += elapsed
+
+
+def rate_limit_sleep(seconds, host='api.github.com'):
+    """time.sleep() that is accounted as rate-limit wait for `host`."""
+    _add('rate_limit_sleep_seconds', host, seconds)
+    time.sleep(seconds)
+
+
+def record_request(host, seconds, nbytes, error=None):
+    with _lock:
+        h = _hosts.setdefault(host, {'requests': 0, 'bytes': 0, 'errors': 0, 'seconds': 0.0,
+                                     'buckets': [0] * (len(LATENCY_BUCKETS) + 1)})
+        h['requests'] += 1
+        h['bytes'] += nbytes
+        h['seconds'] += seconds
+        h['errors'] += error is not None
+        i = 0
+        while i < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[i]:
+            i += 1
+        h['buckets'][i] += 1
+    if error is not None:
+        count_error(error)
+
+
+def _error_kind(e):
+    if isinstance(e, urllib.error.HTTPError):
+        return f"http_{e.code}"
+    if isinstance(e, urllib.error.URLError) and isinstance(e.reason, Exception):
+        return type(e.reason).__name__
+    return type(e).__name__
+
+
+class _TimedResponse:
+    """Proxy for an urlopen response that records the request when closed."""
+
+    def __init__(self, response, host, start):
+        self._response = response
+        self._host = host
+        self._start = start
+        self._bytes = 0
+        self._done = False
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._bytes += len(data)
+        return data
+
+    def close(self):
+        if not self._done:
+            self._done = True
+            record_request(self._host, time.perf_counter() - self._start, self._bytes)
+        self._response.close()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def urlopen(req, timeout=None):
+    """urllib.request.urlopen that records latency, bytes and errors per host.
+
+    Requests are opened by http_cassette, so they can be recorded or sent to
+    a local stand-in server.
+    """
+    url = req.full_url if isinstance(req, urllib.request.Request) else req
+    host = urllib.parse.urlsplit(url).hostname or ''
+    start = time.perf_counter()
+    try:
+        response = http_cassette.urlopen(req, timeout=timeout)
+    except Exception as e:
+        record_request(host, time.perf_counter() - start, 0, _error_kind(e))
+        raise
+    return _TimedResponse(response, host, start)
+
+
+def snapshot():
+    """The current run as a JSON-serialisable dict."""
+    with _lock:
+        stages = []
+        for (stage, source), s in sorted(_stages.items()):
+            rate = s['rows'] / s['seconds'] if s['rows'] and s['seconds'] else None
+            stages.append({'stage': stage, 'source': source, 'seconds': round(s['seconds'], 4),
+                           'rows': s['rows'], 'rows_per_second': round(rate, 1) if rate else None})
+        hosts = {host: {'requests': h['requests'], 'bytes': h['bytes'], 'errors': h['errors'],
+                        'seconds': round(h['seconds'], 4),
+                        'latency_buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], h['buckets']))}
+                 for host, h in sorted(_hosts.items())}
+        counters = {}
+        for (name, label), value in sorted(_counters.items()):
+            counters.setdefault(name, {})[label] = round(value, 3) if isinstance(value, float) else value
+        return {'started': _started, 'duration': round(time.time() - _started, 3),
+                'stages': stages, 'hosts': hosts, **counters}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(report, job):
+    """Render a report in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        if not samples:
+            return
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            labels = {'job': job, **labels}
+            label_text = ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    metric('diary_run_start_timestamp_seconds', 'gauge', 'Start of the run.', [({}, report['started'])])
+    metric('diary_run_duration_seconds', 'gauge', 'Wall time of the run.', [({}, report['duration'])])
+    stages = report['stages']
+    metric('diary_stage_seconds', 'gauge', 'Wall time per stage and source.',
+           [({'stage': s['stage'], 'source': s['source']}, s['seconds']) for s in stages])
+    metric('diary_stage_rows', 'gauge', 'Rows processed per stage and source.',
+           [({'stage': s['stage'], 'source': s['source']}, s['rows']) for s in stages if s['rows']])
+    metric('diary_stage_rows_per_second', 'gauge', 'Throughput per stage and source.',
+           [({'stage': s['stage'], 'source': s['source']}, s['rows_per_second'])
+            for s in stages if s['rows_per_second']])
+
+    hosts = report['hosts']
+    metric('diary_http_requests', 'gauge', 'HTTP requests per host in the run.',
+           [({'host': host}, h['requests']) for host, h in hosts.items()])
+    metric('diary_http_errors', 'gauge', 'Failed HTTP requests per host in the run.',
+           [({'host': host}, h['errors']) for host, h in hosts.items()])
+    metric('diary_http_response_bytes', 'gauge', 'Response bytes per host in the run.',
+           [({'host': host}, h['bytes']) for host, h in hosts.items()])
+    histogram = []
+    for host, h in hosts.items():
+        cumulative = 0
+        for le, n in h['latency_buckets'].items():
+            cumulative += n
+            histogram.append(({'host': host, 'le': le}, cumulative))
+    if histogram:
+        name = 'diary_http_request_duration_seconds'
+        lines.append(f"# HELP {name} HTTP request latency per host.")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, value in histogram:
+            lines.append(f'{name}_bucket{{job="{_label(job)}",host="{_label(labels["host"])}",le="{labels["le"]}"}} {value}')
+        for host, h in hosts.items():
+            lines.append(f'{name}_sum{{job="{_label(job)}",host="{_label(host)}"}} {h["seconds"]}')
+            lines.append(f'{name}_count{{job="{_label(job)}",host="{_label(host)}"}} {h["requests"]}')
+
+    metric('diary_cache_hits', 'gauge', 'Cache hits per cache in the run.',
+           [({'cache': k}, v) for k, v in report.get('cache_hits', {}).items()])
+    metric('diary_rate_limit_sleep_seconds', 'gauge', 'Time slept waiting for rate limits in the run.',
+           [({'host': k}, v) for k, v in report.get('rate_limit_sleep_seconds', {}).items()])
+    metric('diary_errors', 'gauge', 'Errors in the run, by type.',
+           [({'type': k}, v) for k, v in report.get('errors', {}).items()])
+    metric('diary_http_retries', 'gauge', 'Retried HTTP requests per host in the run.',
+           [({'host': k}, v) for k, v in report.get('retries', {}).items()])
+    metric('diary_circuit_opens', 'gauge', 'Times the circuit breaker of a host opened in the run.',
+           [({'host': k}, v) for k, v in report.get('circuit_open', {}).items()])
+    metric('diary_skipped_responses', 'gauge', 'Responses not read in full in the run, by reason.',
+           [({'reason': k}, v) for k, v in report.get('skipped', {}).items()])
+    return '\n'.join(lines) + '\n'
+
+
+def report_dir(data_dir):
+    return os.environ.get('DIARY_METRICS_DIR') or os.path.join(data_dir, 'metrics')
+
+
+def write_report(job, data_dir):
+    """Write the JSON report and Prometheus textfile for `job`; returns the report."""
+    report = {'job': job, **snapshot()}
+    out_dir = report_dir(data_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, f"{job}.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    # Write-then-rename so node_exporter never reads a partial file
+    prom_path = os.path.join(out_dir, f"{job}.prom")
+    with open(prom_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(report, job))
+    os.replace(prom_path + '.tmp', prom_path)
+    with open(os.path.join(out_dir, 'history.jsonl'), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(report) + '\n')
+    return report
+
+
+def summary_lines(report):
+    lines = [f"{report.get('job', 'run')}: {report['duration']:.1f}s"]
+    for s in report['stages']:
+        rate = f", {s['rows_per_second']} rows/s" if s['rows_per_second'] else ''
+        lines.append(f"  {s['stage']:<18} {s['source'] or '-':<14} {s['seconds']:>9.2f}s {s['rows']:>7} rows{rate}")
+    for host, h in report['hosts'].items():
+        mean = h['seconds'] / h['requests'] if h['requests'] else 0
+        lines.append(f"  {host:<33} {h['requests']:>6} requests {h['bytes']:>11} bytes "
+                     f"{mean:.3f}s mean, {h['errors']} errors")
+    for name in ('cache_hits', 'rate_limit_sleep_seconds', 'errors', 'skipped', 'retries', 'circuit_open'):
+        for label, value in report.get(name, {}).items():
+            lines.append(f"  {name} {label}: {value}")
+    return lines
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    out_dir = report_dir(os.path.join(os.path.dirname(script_dir), "data"))
+    jobs = argv
+    if not jobs and os.path.isdir(out_dir):
+        jobs = sorted(n[:-5] for n in os.listdir(out_dir) if n.endswith('.json'))
+    if not jobs:
+        print(f"No reports in {out_dir}")
+        return 1
+    for job in jobs:
+        with open(os.path.join(out_dir, f"{job}.json"), 'r', encoding='utf-8') as f:
+            print('\n'.join(summary_lines(json.load(f))))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""`--profile` support for the stage scripts and helpers.
+
+With `--profile` on the command line, `setup()` starts tracemalloc and the
+script's named phases are profiled separately:
+
+    with profiling.phase('load CSVs'):
+        ...
+    profiling.switch('render SVG')   # ends the previous switch() phase
+
+Each phase gets its own cProfile profile (time spent in a nested phase is
+only counted there), its wall time, its tracemalloc peak and the source
+lines that allocated the most memory during it. At exit the script writes
+
+    data/profile/<job>.txt      phases sorted by wall time, each with its
+                                top allocations and hottest functions
+    data/profile/<job>.pstats   all phases combined, for pstats/snakeviz
+
+Without `--profile` the phase markers cost a function call and nothing
+else. Only the main thread is profiled; phases entered from worker threads
+are ignored, which is why `scheduler.run_all` runs the sources of a stage
+sequentially while profiling.
+"""
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+TOP_ALLOCATIONS = 10
+TOP_FUNCTIONS = 25
+
+_enabled = False
+_job = None
+_out_dir = None
+_started = None
+_stack = []    # active phases, innermost last
+_phases = {}   # name -> totals over all entries of the phase
+
+
+class _Active:
+    def __init__(self, name, switched):
+        self.name = name
+        self.switched = switched
+        self.start = time.perf_counter()
+        self.snapshot = _snapshot()
+        self.peak = 0
+
+
+def enabled():
+    return _enabled
+
+
+def setup(job, argv, data_dir):
+    """Enable profiling if `--profile` is in `argv`; the report is written at exit."""
+    if '--profile' not in argv:
+        return False
+    enable(job, os.path.join(data_dir, "profile"))
+    atexit.register(finish)
+    return True
+
+
+def enable(job, out_dir):
+    global _enabled, _job, _out_dir, _started
+    if _enabled:
+        return
+    _enabled = True
+    _job = job
+    _out_dir = out_dir
+    _started = time.perf_counter()
+    tracemalloc.start()
+    _push('(main)', switched=False)
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ))
+
+
+def _record(name):
+    if name not in _phases:
+        _phases[name] = {'calls': 0, 'seconds': 0.0, 'peak': 0, 'profile': cProfile.Profile(), 'allocations': {}}
+    return _phases[name]
+
+
+def _push(name, switched):
+    if _stack:
+        outer = _stack[-1]
+        _phases[outer.name]['profile'].disable()
+        outer.peak = max(outer.peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    _stack.append(_Active(name, switched))
+    _record(name)['profile'].enable()
+
+
+def _pop():
+    active = _stack.pop()
+    record = _phases[active.name]
+    record['profile'].disable()
+    peak = max(active.peak, tracemalloc.get_traced_memory()[1])
+    record['calls'] += 1
+    record['seconds'] += time.perf_counter() - active.start
+    record['peak'] = max(record['peak'], peak)
+    for stat in _snapshot().compare_to(active.snapshot, 'lineno')[:TOP_ALLOCATIONS]:
+        if stat.size_diff > 0:
+            where = str(stat.traceback[0])
+            record['allocations'][where] = record['allocations'].get(where, 0) + stat.size_diff
+    tracemalloc.reset_peak()
+    if _stack:
+        outer = _stack[-1]
+        outer.peak = max(outer.peak, peak)
+        _phases[outer.name]['profile'].enable()
+
+
+def _active_here():
+    return _enabled and threading.current_thread() is threading.main_thread()
+
+
+def _close_switched():
+    while _stack and _stack[-1].switched:
+        _pop()
+
+
+@contextmanager
+def phase(name):
+    """Profile the block as phase `name`."""
+    if not _active_here():
+        yield
+        return
+    _push(name, switched=False)
+    depth = len(_stack)
+    try:
+        yield
+    finally:
+        while len(_stack) > depth:
+            _pop()
+        _pop()
+
+
+def switch(name):
+    """End the phase started by the previous switch() and start `name` (None: start nothing)."""
+    if not _active_here():
+        return
+    _close_switched()
+    if name is not None:
+        _push(name, switched=True)
+
+
+def _format_size(n):
+    return f"{n / 1e6:.1f} MB" if n >= 1e5 else f"{n / 1e3:.1f} kB"
+
+
+def report_text():
+    lines = [f"Profile of {_job}: {time.perf_counter() - _started:.2f}s wall", ""]
+    lines.append(f"{'phase':<32} {'calls':>6} {'wall s':>9} {'peak':>10}")
+    ordered = sorted(_phases.items(), key=lambda kv: kv[1]['seconds'], reverse=True)
+    for name, record in ordered:
+        lines.append(f"{name:<32} {record['calls']:>6} {record['seconds']:>9.3f} {_format_size(record['peak']):>10}")
+    for name, record in ordered:
+        lines.append("")
+        lines.append(f"=== {name} ({record['seconds']:.3f}s, peak {_format_size(record['peak'])}) ===")
+        allocations = sorted(record['allocations'].items(), key=lambda kv: kv[1], reverse=True)
+        if allocations:
+            lines.append("Top allocations:")
+            for where, size in allocations[:TOP_ALLOCATIONS]:
+                lines.append(f"  {_format_size(size):>10}  {where}")
+        stream = io.StringIO()
+        stats = pstats.Stats(record['profile'], stream=stream)
+        if stats.total_calls:
+            stats.strip_dirs().sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            lines.append(stream.getvalue().strip('\n'))
+    return '\n'.join(lines) + '\n'
+
+
+def finish():
+    """Close open phases and write the text report and `.pstats` file."""
+    global _enabled
+    if not _enabled:
+        return None
+    while _stack:
+        _pop()
+    _enabled = False
+    os.makedirs(_out_dir, exist_ok=True)
+    text_path = os.path.join(_out_dir, f"{_job}.txt")
+    with open(text_path, 'w', encoding='utf-8') as f:
+        f.write(report_text())
+    combined = None
+    for record in _phases.values():
+        stats = pstats.Stats(record['profile'])
+        if not stats.total_calls:
+            continue
+        if combined is None:
+            combined = stats
+        else:
+            combined.add(stats)
+    if combined is not None:
+        combined.dump_stats(os.path.join(_out_dir, f"{_job}.pstats"))
+    tracemalloc.stop()
+    print(f"Profile written to {text_path}")
+    return text_path
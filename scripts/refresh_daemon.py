@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""Keep the statistics up to date in one long-running process.
+
+Every source is refreshed on its own schedule: "refresh" in sources.json
+("30m", "6h", "7d" or seconds), or DEFAULT_REFRESH for its type. The
+daemon sleeps until the next source is due, fetches the due sources
+(stage 1) and compares their entries with what it already knows:
+
+- entries whose link, date, title and type (and `revision`, for sources
+  that report one) are unchanged keep their word counts; only new and
+  changed entries are extracted and counted (stages 2 and 3),
+- the sources/content/statistics CSVs of the affected types are rewritten
+  and recorded in data/.pipeline_state.json, so run_pipeline.py sees them
+  as up to date,
+- stage 4 renders only the SVGs of the years whose entries changed and
+  rewrites docs/index.html and docs/README.md; a cycle without changes
+  leaves docs/ alone. The first cycle renders every year, since the SVGs
+  in docs/ may have been rendered with another `--words`/`--quantile`.
+
+The index of known entries is loaded from the CSVs at startup and kept in
+memory between cycles, as are the stage modules and the per-host latency
+and circuit breaker state of `resilience`, so that later cycles start with
+tuned timeouts. The time of each source's last refresh and the last
+counted `revision` of each entry are saved in data/.refresh_state.json,
+so a restart does not refetch sources that are not due and still sees
+notes edited while it was stopped. sources.json is reread when it changes.
+
+Sources of one type share their CSVs: when one of them is due, siblings
+that this process has not fetched yet are fetched with it. A source that
+fails, or returns nothing after having had entries, keeps its previous
+entries and is retried after RETRY_INTERVAL.
+
+Usage:
+    python scripts/refresh_daemon.py [type-or-name ...] [--once] [--all]
+                                     [--words] [--quantile]
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import signal
+import threading
+import time
+from datetime import date
+
+from run_pipeline import ROOT_DIR, SCRIPT_DIR, State, code_paths, content_inputs, inputs_hash, load_stage
+
+import diary_data
+import metrics
+import scheduler
+import term_stats
+
+DEFAULT_REFRESH = {'wordpress': '6h', 'quartz': '6h', 'legacy_html': '7d', 'github': '1h', 'local_markdown': '5m',
+                   'wordpress_wxr': '1h'}
+RETRY_INTERVAL = 15 * 60
+# Longest sleep between checks for a changed sources.json
+MAX_SLEEP = 60
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+def parse_interval(value):
+    """Seconds of a refresh interval: a number of seconds or '<n>s|m|h|d|w'."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*', str(value).lower())
+    if not m:
+        raise ValueError(f"Invalid refresh interval: {value!r}")
+    return float(m.group(1)) * UNITS[m.group(2) or 's']
+
+
+def source_key(source):
+    return source.get('name') or f"{source['type']}:{source['url']}"
+
+
+def refresh_interval(source):
+    return parse_interval(source.get('refresh', DEFAULT_REFRESH.get(source['type'], '1d')))
+
+
+def _year(day):
+    try:
+        return date.fromisoformat(day[:10]).year
+    except (TypeError, ValueError):
+        return None
+
+
+class Daemon:
+    def __init__(self, sources_file, data_dir, docs_dir, selection=(), weight='entries', scale='linear'):
+        self.sources_file = sources_file
+        self.data_dir = data_dir
+        self.docs_dir = docs_dir
+        self.selection = {s.lower() for s in selection}
+        self.weight = weight
+        self.scale = scale
+        self.state_path = os.path.join(data_dir, ".refresh_state.json")
+        self.pipeline_state = State(os.path.join(data_dir, ".pipeline_state.json"))
+        self.stopped = threading.Event()
+        self.config_mtime = None
+        self.config_changed = False
+        self.rendered_all = False   # every SVG rendered with this weight and scale
+        self.sources = []
+        self.source_config = {}
+        self.items = {}       # source key -> stage 1 entries of its last fetch
+        self.known = {}       # type -> {link: (date, title, row type, words, chars)}, sources CSV order
+        self.revisions = {}   # link -> last seen 'revision' of entries that have one (local notes)
+        self.refreshed = {}   # source key -> epoch seconds of the last successful fetch
+        self.failed = {}      # source key -> epoch seconds of the last failed fetch
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.refreshed = state.get('refreshed', {})
+            self.failed = state.get('failed', {})
+            self.revisions = state.get('revisions', {})
+
+    def selected(self, source):
+        return (not self.selection or source['type'].lower() in self.selection
+                or source.get('name', '').lower() in self.selection)
+
+    def reload_config(self):
+        """Reread sources.json if it changed; True if it did."""
+        mtime = os.path.getmtime(self.sources_file)
+        if mtime == self.config_mtime:
+            return False
+        with open(self.sources_file, 'r', encoding='utf-8') as f:
+            sources = json.load(f)
+        # Colours and names are in every SVG; the first load changes nothing
+        self.config_changed = self.config_changed or self.config_mtime is not None
+        self.config_mtime = mtime
+        self.sources = [s for s in sources if self.selected(s)]
+        self.source_config = diary_data.load_source_config(self.sources_file)
+        keys = {source_key(s) for s in self.sources}
+        for key in list(self.items):
+            if key not in keys:
+                del self.items[key]
+        for st in self.source_config:
+            if st not in self.known:
+                self.known[st] = self.load_type(st)
+        print(f"Loaded {len(self.sources)} sources from {self.sources_file}")
+        return True
+
+    def load_type(self, source_type):
+        """Known entries and counts of one type from its sources and statistics CSVs."""
+        sources_csv = os.path.join(self.data_dir, f"sources_{source_type}.csv")
+        stats_csv = os.path.join(self.data_dir, f"statistics_{source_type}.csv")
+        known = {}
+        if not os.path.exists(sources_csv):
+            return known
+        counts = {}
+        if os.path.exists(stats_csv):
+            counts = {e.link: (e.word_count, e.character_count)
+                      for e in diary_data.read_entries(stats_csv, source_type)}
+        with open(sources_csv, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                if row['Link'] in counts:
+                    known[row['Link']] = (row['Date'], row['Title'], row['Type'], *counts[row['Link']])
+        return known
+
+    def save_state(self):
+        with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'refreshed': self.refreshed, 'failed': self.failed, 'revisions': self.revisions},
+                      f, indent=2, sort_keys=True)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def due_at(self, source):
+        """When `source` is due; a changed "refresh" applies to the current wait."""
+        key = source_key(source)
+        interval = refresh_interval(source)
+        due = self.refreshed.get(key, 0) + interval
+        if key in self.failed:
+            due = min(due, self.failed[key] + min(RETRY_INTERVAL, interval))
+        return due
+
+    def due_sources(self, now, force=False):
+        """Due sources, plus the siblings whose entries are needed to rewrite their type."""
+        due = [s for s in self.sources if force or self.due_at(s) <= now]
+        types = {s['type'] for s in due}
+        return [s for s in self.sources
+                if s in due or (s['type'] in types and source_key(s) not in self.items)]
+
+    def fetch(self, sources):
+        """Stage 1 for `sources`, concurrently; {key: entries} of the fetches that succeeded."""
+        stage1 = load_stage(1)
+
+        def job(source, key):
+            def run(progress):
+                items = []
+                try:
+                    with metrics.timer('create_sources', key):
+                        for item in stage1.iter_source(source, self.data_dir):
+                            items.append(item)
+                            progress.add(key)
+                except Exception as e:
+                    # One failing source must not cost the others their results
+                    print(f"Error fetching {key}: {e}")
+                    metrics.count_error(type(e).__name__)
+                    return None
+                metrics.add_rows('create_sources', key, len(items))
+                return items
+            return run
+
+        results = scheduler.run_all({source_key(s): job(s, source_key(s)) for s in sources})
+        fetched = {}
+        for key, items in results.items():
+            if items is None:
+                continue
+            if not items and self.items.get(key):
+                print(f"{key} returned no entries; keeping the previous {len(self.items[key])}")
+                continue
+            fetched[key] = items
+        return fetched
+
+    def update_type(self, source_type, sources_of_type):
+        """Extract and count the new entries of one type and rewrite its CSVs; returns the changed years."""
+        stage1, stage2, stage3 = load_stage(1), load_stage(2), load_stage(3)
+        old = self.known.get(source_type, {})
+        rows = []
+        seen = set()
+        for source in sources_of_type:
+            for item in self.items.get(source_key(source), []):
+                if item['link'] not in seen:
+                    seen.add(item['link'])
+                    rows.append(item)
+
+        # An entry with a revision that was never counted (or not since it changed) is pending too
+        pending = [item for item in rows
+                   if old.get(item['link'], (None,) * 3)[:3] != (item['date'], item['title'], item['type'])
+                   or ('revision' in item and self.revisions.get(item['link']) != item['revision'])]
+        removed = [link for link in old if link not in seen]
+        print(f"[{source_type}] {len(rows)} entries: {len(pending)} new or changed, {len(removed)} removed")
+
+        contents = {}
+        if pending:
+            workers = scheduler.concurrency(sources_of_type)
+            with metrics.timer('parse_sources', source_type):
+                for link, content in stage2.extract_all([(i['link'], i['type'], i['title']) for i in pending],
+                                                        source_type, workers, data_dir=self.data_dir):
+                    contents[link] = content
+            metrics.add_rows('parse_sources', source_type, len(pending))
+
+        known = {}
+        years = set()
+        with metrics.timer('parse_content', source_type):
+            for item in rows:
+                link = item['link']
+                if link in contents:
+                    text = contents[link]
+                    known[link] = (item['date'], item['title'], item['type'], stage3.count_words(text),
+                                   len(text) if text else 0)
+                else:
+                    known[link] = old[link]
+                if known[link] != old.get(link):
+                    years.add(_year(item['date']))
+                    if link in old:
+                        years.add(_year(old[link][0]))
+        metrics.add_rows('parse_content', source_type, len(pending))
+        years.update(_year(old[link][0]) for link in removed)
+        self.known[source_type] = known
+        if pending or removed:
+            self.write_type(source_type, sources_of_type, rows, contents, stage1)
+        # Only once the new counts are saved; saved with the refresh state after the cycle
+        for item in rows:
+            if 'revision' in item:
+                self.revisions[item['link']] = item['revision']
+        years.discard(None)
+        return years
+
+    def write_type(self, source_type, sources_of_type, rows, contents, stage1):
+        sources_csv = os.path.join(self.data_dir, f"sources_{source_type}.csv")
+        content_csv = os.path.join(self.data_dir, f"content_{source_type}.csv")
+        stats_csv = os.path.join(self.data_dir, f"statistics_{source_type}.csv")
+
+        stage1.save_to_csv_with_dir(rows, f"sources_{source_type}.csv", self.data_dir)
+
+        # Unchanged content is copied from the previous file
+        wanted = {item['link'] for item in rows if item['link'] not in contents}
+        previous = {}
+        if wanted and os.path.exists(content_csv):
+            for link, text in load_stage(3).iter_content(content_csv):
+                if link in wanted:
+                    previous[link] = text
+        with open(content_csv + '.tmp', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Link', 'Content'])
+            for item in rows:
+                link = item['link']
+                writer.writerow([link, contents[link] if link in contents else previous.get(link, '')])
+        os.replace(content_csv + '.tmp', content_csv)
+
+        known = self.known[source_type]
+        with open(stats_csv + '.tmp', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Link', 'Date', 'Title', 'Word Count', 'Character Count'])
+            for item in rows:
+                day, title, _, words, chars = known[item['link']]
+                writer.writerow([item['link'], day, title, words, chars])
+        os.replace(stats_csv + '.tmp', stats_csv)
+        print(f"[{source_type}] saved {sources_csv}, {content_csv} and {stats_csv}")
+
+        # Same digests as run_pipeline computes for these artifacts
+        self.pipeline_state.record(sources_csv, inputs_hash(code_paths(1), sources_of_type))
+        self.pipeline_state.record(content_csv, inputs_hash(content_inputs(source_type, self.data_dir) + code_paths(2)))
+        self.pipeline_state.record(stats_csv, inputs_hash([sources_csv, content_csv] + code_paths(3)))
+
+    def all_entries(self):
+        """Entry records of every type in stage 4's order; the first link wins."""
+        all_data = []
+        seen = set()
+        for st in self.source_config:
+            for link, (day, title, _, words, chars) in self.known.get(st, {}).items():
+                if link not in seen:
+                    seen.add(link)
+                    all_data.append(diary_data.Entry(link, diary_data.parse_day(day), title, words, chars, st))
+        return all_data
+
+    def cycle(self, force=False):
+        """Refresh the due sources; returns the number of sources fetched."""
+        self.reload_config()
+        now = time.time()
+        due = self.due_sources(now, force)
+        config_changed, self.config_changed = self.config_changed, False
+        # New colours or names, or another weight or scale, change every year's SVG
+        render_all = config_changed or not self.rendered_all
+        if not due and not render_all:
+            return 0
+        metrics.reset()
+        if due:
+            print(f"\n=== Refreshing {', '.join(source_key(s) for s in due)} ===")
+        fetched = self.fetch(due) if due else {}
+        for source in due:
+            key = source_key(source)
+            if key in fetched:
+                self.items[key] = fetched[key]
+                self.refreshed[key] = now
+                self.failed.pop(key, None)
+            else:
+                self.failed[key] = now
+        self.save_state()
+
+        years = set()
+        for source_type in dict.fromkeys(s['type'] for s in due):
+            sources_of_type = [s for s in self.sources if s['type'] == source_type]
+            if not all(source_key(s) in self.items for s in sources_of_type):
+                print(f"[{source_type}] not all sources fetched; keeping its files")
+                continue
+            try:
+                type_years = self.update_type(source_type, sources_of_type)
+            except Exception as e:
+                print(f"[{source_type}] failed: {e}")
+                metrics.count_error(type(e).__name__)
+                continue
+            years |= type_years
+        self.save_state()
+
+        if years or render_all:
+            if years:
+                # Like the heatmaps, the terms cover every configured type, not only the selected ones
+                term_stats.build(self.data_dir, list(self.source_config))
+            all_data = self.all_entries()
+            with metrics.timer('generate_heatmaps'):
+                load_stage(4).generate_reports(all_data, self.source_config, self.docs_dir, self.weight, self.scale,
+                                               years=None if render_all else years,
+                                               terms=term_stats.load(self.data_dir))
+            self.rendered_all = True
+            metrics.add_rows('generate_heatmaps', '', len(all_data))
+            print(f"Reports updated ({'all years' if render_all else ', '.join(map(str, sorted(years)))})")
+        else:
+            print("No changes; reports left as they are")
+        metrics.write_report('refresh_daemon', self.data_dir)
+        return len(due)
+
+    def seconds_to_next(self):
+        now = time.time()
+        waits = [self.due_at(s) - now for s in self.sources]
+        return max(0.0, min(waits)) if waits else MAX_SLEEP
+
+    def run(self, once=False, force=False):
+        self.cycle(force)
+        while not once and not self.stopped.is_set():
+            wait = self.seconds_to_next()
+            if wait > 0:
+                print(f"Next refresh in {wait / 60:.1f} min")
+            # Wake up regularly to notice a changed sources.json
+            while wait > 0 and not self.stopped.wait(min(wait, MAX_SLEEP)):
+                if self.reload_config():
+                    break
+                wait = self.seconds_to_next()
+            if not self.stopped.is_set():
+                self.cycle()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the sources on their schedules.")
+    parser.add_argument('selection', nargs='*', help="source types or names (default: all)")
+    parser.add_argument('--once', action='store_true', help="refresh the due sources once and exit")
+    parser.add_argument('--all', action='store_true', help="treat every source as due in the first cycle")
+    parser.add_argument('--words', action='store_true', help="weight heatmap intensity by words")
+    parser.add_argument('--quantile', action='store_true', help="use per-year quartiles for intensity")
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.join(ROOT_DIR, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    daemon = Daemon(os.path.join(SCRIPT_DIR, "sources.json"), data_dir, os.path.join(ROOT_DIR, "docs"),
+                    args.selection, 'words' if args.words else 'entries',
+                    'quantile' if args.quantile else 'linear')
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stopped.set())
+    try:
+        daemon.run(once=args.once, force=args.all)
+    except KeyboardInterrupt:
+        pass
+    print("Stopped.")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,255 @@
+"""Adaptive timeouts, retries and per-host circuit breakers for all fetches.
+
+Stages 1 and 2 open every request with `urlopen` from this module, which
+makes each attempt through `metrics.urlopen` and adds:
+
+- timeouts that follow each host's latency: after a few requests the
+  timeout is the smoothed time to the response headers plus four times
+  its deviation (as TCP does for retransmissions), within
+  MIN_TIMEOUT..MAX_TIMEOUT; the caller's timeout is the starting value
+  and a retry after a timeout doubles it;
+- up to MAX_RETRIES retries of GET requests that failed with a 5xx status
+  or a connection error, after a jittered exponential backoff (or the
+  server's Retry-After, if longer);
+- a circuit breaker per host that opens after FAILURE_THRESHOLD failed
+  attempts in a row. While it is open, requests to the host fail at once
+  with CircuitOpenError instead of waiting for their timeout; after the
+  cooldown one request is let through and decides whether it closes again
+  (the cooldown doubles every time it does not).
+
+Client errors (4xx, including GitHub's rate-limit 403) are returned to
+the caller unchanged.
+
+Processes that run many jobs against the same hosts (batch_diaries.py)
+can turn on a governor with `govern(per_host)`: at most `per_host`
+requests to a host are in flight at once over all threads, and once a
+response reports an exhausted rate limit (X-RateLimit-Remaining: 0) no
+request goes to that host until its X-RateLimit-Reset. With
+response_cache enabled, repeated GET requests are answered from memory.
+"""
+import http.client
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import metrics
+import response_cache
+
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30.0
+MIN_TIMEOUT = 2.0
+MAX_TIMEOUT = 60.0
+# Requests before the observed latency replaces the caller's timeout
+MIN_SAMPLES = 3
+FAILURE_THRESHOLD = 5
+COOLDOWN = 30.0
+MAX_COOLDOWN = 900.0
+
+_lock = threading.Lock()
+_hosts = {}
+_per_host = None    # in-flight requests per host while the governor is on
+
+
+class CircuitOpenError(urllib.error.URLError):
+    """Raised without a request while the circuit breaker of a host is open."""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} is failing, not retrying for {retry_in:.0f}s")
+        self.host = host
+
+
+class _Host:
+    def __init__(self):
+        self.samples = 0
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = COOLDOWN
+        self.probing = False
+        self.slots = threading.BoundedSemaphore(_per_host) if _per_host else None
+        self.paused_until = 0.0
+
+
+def _host(name):
+    with _lock:
+        return _hosts.setdefault(name, _Host())
+
+
+def reset():
+    with _lock:
+        _hosts.clear()
+
+
+def govern(per_host):
+    """Limit requests in flight per host to `per_host` and honour exhausted rate limits; None turns it off."""
+    global _per_host
+    with _lock:
+        _per_host = per_host
+        for h in _hosts.values():
+            h.slots = threading.BoundedSemaphore(per_host) if per_host else None
+
+
+def timeout_for(host, default):
+    """Timeout for the next request to `host`; `default` until there are enough samples."""
+    h = _host(host)
+    with _lock:
+        if h.samples < MIN_SAMPLES:
+            return default
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, h.srtt + 4 * h.rttvar))
+
+
+def _observe(h, seconds):
+    with _lock:
+        if h.samples == 0:
+            h.srtt, h.rttvar = seconds, seconds / 2
+        else:
+            h.rttvar = 0.75 * h.rttvar + 0.25 * abs(h.srtt - seconds)
+            h.srtt = 0.875 * h.srtt + 0.125 * seconds
+        h.samples += 1
+        h.failures = 0
+        h.probing = False
+        h.cooldown = COOLDOWN
+
+
+def _fail(h, host):
+    with _lock:
+        h.failures += 1
+        if h.probing or h.failures >= FAILURE_THRESHOLD:
+            if h.probing:
+                h.cooldown = min(MAX_COOLDOWN, h.cooldown * 2)
+            h.probing = False
+            h.open_until = time.time() + h.cooldown
+            opened = True
+        else:
+            opened = False
+    if opened:
+        print(f"Circuit breaker open for {host} ({h.failures} failures), cooling down {h.cooldown:.0f}s")
+        metrics.circuit_open(host)
+
+
+def _admit(h, host):
+    """Raise CircuitOpenError unless a request to `host` may go out now."""
+    with _lock:
+        now = time.time()
+        if not h.open_until:
+            return
+        if now < h.open_until or h.probing:
+            retry_in = max(0.0, h.open_until - now)
+        else:
+            # Half-open: this request decides
+            h.probing = True
+            return
+    metrics.count_error('circuit_open')
+    raise CircuitOpenError(host, retry_in)
+
+
+def _close(h):
+    with _lock:
+        h.open_until = 0.0
+
+
+def is_retryable(e):
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code >= 500
+    if isinstance(e, CircuitOpenError):
+        return False
+    if isinstance(e, urllib.error.URLError):
+        return isinstance(e.reason, (OSError, socket.timeout))
+    return isinstance(e, (OSError, http.client.HTTPException))
+
+
+def _is_timeout(e):
+    reason = getattr(e, 'reason', e)
+    return isinstance(reason, (socket.timeout, TimeoutError))
+
+
+def backoff(attempt, e=None):
+    """Seconds before retry `attempt` (1-based): full jitter over 0.5, 1, 2, ... or Retry-After."""
+    delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * 2 ** attempt))
+    retry_after = getattr(e, 'headers', None) and e.headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return min(MAX_BACKOFF, delay)
+
+
+def _wait_for_rate_limit(h, host):
+    wait = h.paused_until - time.time()
+    if wait > 0:
+        print(f"Rate limit of {host} exhausted, waiting {wait:.0f}s")
+        metrics.rate_limit_sleep(wait, host)
+
+
+def _pause_if_exhausted(h, headers):
+    if headers is None:
+        return
+    remaining, reset_at = headers.get('X-RateLimit-Remaining'), headers.get('X-RateLimit-Reset')
+    if remaining == '0' and reset_at and reset_at.isdigit():
+        with _lock:
+            h.paused_until = max(h.paused_until, float(reset_at) + 1)
+
+
+def _attempt(req, h, host, wait):
+    """One metrics.urlopen, within the governor's limits when it is on."""
+    slots = h.slots
+    if slots is None:
+        return metrics.urlopen(req, timeout=wait)
+    _wait_for_rate_limit(h, host)
+    with slots:
+        try:
+            response = metrics.urlopen(req, timeout=wait)
+        except urllib.error.HTTPError as e:
+            _pause_if_exhausted(h, e.headers)
+            raise
+    _pause_if_exhausted(h, response.headers)
+    return response
+
+
+def urlopen(req, timeout=10, max_bytes=None):
+    """metrics.urlopen with adaptive timeouts, retries and the host's circuit breaker.
+
+    `max_bytes` is the most of the body the caller reads, if it has a cap;
+    the response cache reads no further ahead.
+    """
+    if isinstance(req, str):
+        req = urllib.request.Request(req)
+    if response_cache.is_enabled() and req.get_method() == 'GET':
+        return response_cache.urlopen(req, lambda r: _urlopen(r, timeout), max_bytes)
+    return _urlopen(req, timeout)
+
+
+def _urlopen(req, timeout):
+    host = urllib.parse.urlsplit(req.full_url).hostname or ''
+    h = _host(host)
+    retries = MAX_RETRIES if req.get_method() in ('GET', 'HEAD') else 0
+    wait = timeout_for(host, timeout)
+    attempt = 0
+    while True:
+        _admit(h, host)
+        start = time.perf_counter()
+        try:
+            response = _attempt(req, h, host, wait)
+        except Exception as e:
+            if not is_retryable(e):
+                if isinstance(e, urllib.error.HTTPError):
+                    # The host answered; only its request was bad
+                    _observe(h, time.perf_counter() - start)
+                    _close(h)
+                raise
+            _fail(h, host)
+            attempt += 1
+            if attempt > retries:
+                raise
+            if _is_timeout(e):
+                wait = min(MAX_TIMEOUT, wait * 2)
+            metrics.count_retry(host)
+            time.sleep(backoff(attempt, e))
+            continue
+        _observe(h, time.perf_counter() - start)
+        _close(h)
+        return response
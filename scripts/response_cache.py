@@ -0,0 +1,156 @@
+"""In-memory cache of GET responses, shared by all threads of a process.
+
+Off by default. When several jobs in one process fetch the same URLs (the
+diaries of batch_diaries.py), `enable()` makes `resilience.urlopen`
+answer repeated GET requests from memory: the first request for a URL is
+sent, and requests for it that arrive while it is in flight wait for its
+response instead of sending their own. The key is the URL together with
+the Accept and Authorization headers, so requests with different tokens
+are not mixed up.
+
+Only complete 200 responses with a text, JSON or XML Content-Type are
+kept, up to MAX_ENTRY_BYTES or the byte cap of the request that fetched
+them, least recently used first out once the cache holds `max_bytes`.
+Other responses and longer bodies are passed on to their caller as they
+stream in, without being cached. The X-RateLimit-* headers describe the
+moment a response was sent, so hits are answered without them.
+"""
+import email.message
+import io
+import threading
+from collections import OrderedDict
+
+import http_cassette
+import metrics
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+MAX_ENTRY_BYTES = 8 * 1024 * 1024
+KEY_HEADERS = ('Accept', 'Authorization')
+CACHED_TYPES = ('text/', 'application/json', 'application/xml')
+CACHED_SUFFIXES = ('+json', '+xml')
+
+_lock = threading.Lock()
+_cache = None           # key -> (status, headers, body, url), when enabled
+_in_flight = {}         # key -> Event set when its response is known
+_max_bytes = DEFAULT_MAX_BYTES
+_size = 0
+
+
+class _Rest(io.RawIOBase):
+    """The bytes already read from a response, then the rest of it."""
+
+    def __init__(self, head, response):
+        self.head = head
+        self.response = response
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.head:
+            n = min(len(b), len(self.head))
+            b[:n] = self.head[:n]
+            self.head = self.head[n:]
+            return n
+        data = self.response.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.response.close()
+        super().close()
+
+
+def enable(max_bytes=DEFAULT_MAX_BYTES):
+    global _cache, _max_bytes, _size
+    with _lock:
+        _cache = OrderedDict()
+        _max_bytes = max_bytes
+        _size = 0
+
+
+def disable():
+    global _cache, _size
+    with _lock:
+        _cache = None
+        _size = 0
+
+
+def is_enabled():
+    return _cache is not None
+
+
+def cache_key(req):
+    return (req.full_url,) + tuple(req.get_header(h) or req.get_header(h.lower()) for h in KEY_HEADERS)
+
+
+def is_cacheable(headers):
+    """Whether a response with `headers` has a text, JSON or XML Content-Type."""
+    mime = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    return mime.startswith(CACHED_TYPES) or mime.endswith(CACHED_SUFFIXES)
+
+
+def _without_rate_limit(headers):
+    kept = email.message.Message()
+    for name, value in headers.items():
+        if not name.lower().startswith('x-ratelimit-'):
+            kept[name] = value
+    return kept
+
+
+def _response(entry):
+    status, headers, body, url = entry
+    return http_cassette.Response(io.BytesIO(body), headers, url, status)
+
+
+def _store(key, entry):
+    global _size
+    with _lock:
+        if _cache is None or key in _cache:
+            return
+        _cache[key] = entry
+        _size += len(entry[2])
+        while _size > _max_bytes and _cache:
+            _, old = _cache.popitem(last=False)
+            _size -= len(old[2])
+
+
+def urlopen(req, fetch, max_bytes=None):
+    """Response to GET `req` from the cache, or from `fetch(req)` (then cached).
+
+    A caller that reads at most `max_bytes` of the body passes them on, so
+    no more than that (and one byte to tell it is longer) is read ahead.
+    """
+    key = cache_key(req)
+    while True:
+        with _lock:
+            entry = _cache.get(key) if _cache is not None else None
+            if entry is not None:
+                _cache.move_to_end(key)
+                break
+            waiting = _in_flight.get(key)
+            if waiting is None:
+                _in_flight[key] = threading.Event()
+        if waiting is None:
+            break
+        waiting.wait()
+
+    if entry is not None:
+        metrics.cache_hit('http')
+        return _response(entry)
+
+    try:
+        response = fetch(req)
+        if response.status != 200 or not is_cacheable(response.headers):
+            return response
+        limit = MAX_ENTRY_BYTES if max_bytes is None else min(max_bytes, MAX_ENTRY_BYTES)
+        body = response.read(limit + 1)
+        if len(body) > limit:
+            return http_cassette.Response(io.BufferedReader(_Rest(body, response)), response.headers,
+                                          response.geturl(), response.status)
+        response.close()
+        _store(key, (response.status, _without_rate_limit(response.headers), body, response.geturl()))
+        return http_cassette.Response(io.BytesIO(body), response.headers, response.geturl(), response.status)
+    finally:
+        with _lock:
+            _in_flight.pop(key).set()
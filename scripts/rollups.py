@@ -0,0 +1,224 @@
+"""Precomputed rollups over a DayCube for pattern queries.
+
+Everything expensive happens once in `Rollups.__init__`: prefix sums over
+days, month/week/weekday aggregates per year and source, streak runs and
+the ranking orders for top-k lists. Queries afterwards are array lookups
+(O(1)) or slices of a precomputed order (O(k)).
+"""
+from datetime import timedelta
+
+import numpy as np
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _runs(active, breaks):
+    """Start indices and lengths of consecutive True runs; `breaks` force a new run."""
+    if active.size == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    starts = active & (np.r_[True, ~active[:-1]] | breaks)
+    ends = active & np.r_[~active[1:] | breaks[1:], True]
+    start_idx = np.flatnonzero(starts)
+    end_idx = np.flatnonzero(ends)
+    return start_idx, end_idx - start_idx + 1
+
+
+def _sums(bins, nbins, values):
+    """(nbins, sources) sums of the rows of `values` (days x sources) per bin."""
+    nsrc = values.shape[1]
+    cells = (bins[:, None] * nsrc + np.arange(nsrc)).ravel()
+    sums = np.bincount(cells, weights=values.ravel(), minlength=nbins * nsrc)
+    return sums.astype(np.int64).reshape(nbins, nsrc)
+
+
+class Rollups:
+    def __init__(self, cube, entries=()):
+        self.cube = cube
+        self.entries = list(entries)
+        n, nsrc = cube.counts.shape
+        days = cube.first_day + np.arange(n)
+
+        # Prefix sums: any [start, end] range total is two lookups
+        self.prefix_counts = np.zeros((n + 1, nsrc), dtype=np.int64)
+        self.prefix_words = np.zeros((n + 1, nsrc), dtype=np.int64)
+        np.cumsum(cube.counts, axis=0, out=self.prefix_counts[1:])
+        np.cumsum(cube.words, axis=0, out=self.prefix_words[1:])
+
+        self.first_year = int(cube.years.min()) if n else 0
+        nyears = int(cube.years.max()) - self.first_year + 1 if n else 0
+        year_ids = cube.years - self.first_year
+        months = days.astype('datetime64[M]').astype(int) % 12
+        weekdays = (days.astype(int) + 3) % 7  # 1970-01-01 was a Thursday
+        self.year_starts = np.flatnonzero(np.r_[True, year_ids[1:] != year_ids[:-1]]) if n else np.zeros(0, dtype=np.intp)
+
+        # Month, weekday and week tables are sums over the active days only
+        active = np.flatnonzero(cube.totals > 0)
+        counts, words = cube.counts[active], cube.words[active]
+        month_bins = year_ids[active] * 12 + months[active]
+        self.monthly_counts = _sums(month_bins, nyears * 12, counts).reshape(nyears, 12, nsrc)
+        self.monthly_words = _sums(month_bins, nyears * 12, words).reshape(nyears, 12, nsrc)
+
+        weekday_bins = year_ids[active] * 7 + weekdays[active]
+        self.weekday_counts = _sums(weekday_bins, nyears * 7, counts).reshape(nyears, 7, nsrc)
+        self.weekday_words = _sums(weekday_bins, nyears * 7, words).reshape(nyears, 7, nsrc)
+
+        # Weeks start on Sunday, like the heatmap columns
+        self.week_origin = cube.first_day - (weekdays[0] + 1) % 7 if n else cube.first_day
+        week_ids = (days - self.week_origin).astype(int) // 7
+        nweeks = int(week_ids.max()) + 1 if n else 0
+        self.weekly_counts = _sums(week_ids[active], nweeks, counts)
+        self.weekly_words = _sums(week_ids[active], nweeks, words)
+
+        # Longest streak overall and per year, for all sources and for each one
+        new_year = np.zeros(n, dtype=bool)
+        new_year[self.year_starts] = True
+        self.streaks = {}
+        for src in [None] + list(range(nsrc)):
+            active = cube.totals > 0 if src is None else cube.counts[:, src] > 0
+            starts, lengths = _runs(active, np.zeros(n, dtype=bool))
+            best = (int(starts[lengths.argmax()]), int(lengths.max())) if lengths.size else None
+            per_year = {}
+            starts, lengths = _runs(active, new_year)
+            for s, length in zip(starts.tolist(), lengths.tolist()):
+                y = int(cube.years[s])
+                if y not in per_year or length > per_year[y][1]:
+                    per_year[y] = (s, length)
+            self.streaks[src] = (best, per_year)
+
+        # Ranking orders: busiest days overall and within each year
+        self.day_order = np.argsort(-cube.totals, kind='stable')
+        self.day_order_by_year = np.lexsort((-cube.totals, cube.years))
+
+        # Entry ranking by word count, overall and per source
+        words = np.fromiter((e.word_count for e in self.entries), dtype=np.int64, count=len(self.entries))
+        self.entry_order = np.argsort(-words, kind='stable')
+        entry_src = np.array([e.source_type for e in self.entries], dtype=object)
+        self.entry_order_by_source = {
+            st: self.entry_order[entry_src[self.entry_order] == st] for st in set(entry_src.tolist())
+        }
+
+    def _src(self, source):
+        return None if source is None else self.cube.source_index[source]
+
+    def _year_id(self, year):
+        y = year - self.first_year
+        if not 0 <= y < self.monthly_counts.shape[0]:
+            raise KeyError(f"No data for {year}")
+        return y
+
+    def day(self, i):
+        """`datetime.date` of cube row `i`."""
+        return (self.cube.first_day + i).astype(object)
+
+    def range_total(self, start, end, source=None, words=False):
+        """Entries (or words) between two dates, both inclusive."""
+        prefix = self.prefix_words if words else self.prefix_counts
+        n = len(self.cube)
+        lo = min(max(int((np.datetime64(start, 'D') - self.cube.first_day).astype(int)), 0), n)
+        hi = min(max(int((np.datetime64(end, 'D') - self.cube.first_day).astype(int)) + 1, 0), n)
+        if hi <= lo:
+            return 0
+        totals = prefix[hi] - prefix[lo]
+        src = self._src(source)
+        return int(totals.sum() if src is None else totals[src])
+
+    def longest_streak(self, source=None, year=None):
+        """(first day, last day, length) of the longest run of active days, or None."""
+        best, per_year = self.streaks[self._src(source)]
+        run = best if year is None else per_year.get(year)
+        if run is None:
+            return None
+        start, length = run
+        first = self.day(start)
+        return first, first + timedelta(days=length - 1), length
+
+    def weekday_totals(self, year=None, source=None, words=False):
+        table = self.weekday_words if words else self.weekday_counts
+        table = table.sum(axis=0) if year is None else table[self._year_id(year)]
+        src = self._src(source)
+        return table.sum(axis=1) if src is None else table[:, src]
+
+    def busiest_weekday(self, year=None, source=None, words=False):
+        """(weekday name, total) with the most entries (or words)."""
+        totals = self.weekday_totals(year, source, words)
+        i = int(totals.argmax())
+        return WEEKDAYS[i], int(totals[i])
+
+    def monthly(self, year, source=None, words=False):
+        """Twelve per-month totals of entries (or words) for `year`."""
+        table = (self.monthly_words if words else self.monthly_counts)[self._year_id(year)]
+        src = self._src(source)
+        return (table.sum(axis=1) if src is None else table[:, src]).tolist()
+
+    def busiest_month(self, source=None, words=False):
+        """((year, month), total) of the busiest calendar month."""
+        table = self.monthly_words if words else self.monthly_counts
+        src = self._src(source)
+        flat = (table.sum(axis=2) if src is None else table[:, :, src]).ravel()
+        if flat.size == 0:
+            return None
+        i = int(flat.argmax())
+        return (self.first_year + i // 12, i % 12 + 1), int(flat[i])
+
+    def top_weeks(self, k=3, source=None, words=False):
+        """[(first Sunday, total)] of the k busiest weeks."""
+        table = self.weekly_words if words else self.weekly_counts
+        src = self._src(source)
+        totals = table.sum(axis=1) if src is None else table[:, src]
+        k = min(k, totals.size)
+        idx = np.argpartition(-totals, k - 1)[:k] if k else np.zeros(0, dtype=np.intp)
+        idx = idx[np.argsort(-totals[idx], kind='stable')]
+        return [((self.week_origin + 7 * int(i)).astype(object), int(totals[i])) for i in idx if totals[i]]
+
+    def top_days(self, k=3, year=None):
+        """[(date, entries)] of the k busiest days, optionally within `year`."""
+        if year is None:
+            order = self.day_order
+        else:
+            order = self.day_order_by_year[self.cube.year_slice(year)]
+        return [(self.day(i), int(self.cube.totals[i])) for i in order[:k].tolist() if self.cube.totals[i]]
+
+    def top_entries(self, k=3, source=None):
+        """The k entries with the most words, optionally for one source type."""
+        order = self.entry_order if source is None else self.entry_order_by_source.get(source, self.entry_order[:0])
+        return [self.entries[i] for i in order[:k].tolist()]
+
+
+def _entries(n):
+    return f"{n} entry" if n == 1 else f"{n} entries"
+
+
+def pattern_lines(rollups, source_config):
+    """Markdown bullet lines summarising streaks and busiest periods."""
+    lines = []
+    streak = rollups.longest_streak()
+    if streak:
+        first, last, length = streak
+        lines.append(f"- **Longest streak:** {length} days ({first} to {last})")
+    for st in rollups.cube.source_types:
+        streak = rollups.longest_streak(source=st)
+        if streak:
+            first, last, length = streak
+            name = source_config.get(st, {}).get('name', st)
+            lines.append(f"- **Longest {name} streak:** {length} days ({first} to {last})")
+    if len(rollups.cube):
+        weekday, n = rollups.busiest_weekday()
+        lines.append(f"- **Busiest weekday:** {weekday} ({_entries(n)})")
+    month = rollups.busiest_month()
+    if month:
+        (y, m), n = month
+        lines.append(f"- **Busiest month:** {MONTHS[m - 1]} {y} ({_entries(n)})")
+    for d, n in rollups.top_days(1):
+        lines.append(f"- **Busiest day:** {d} ({_entries(n)})")
+    return lines
+
+
+def weekday_by_year_lines(rollups, years):
+    """Markdown bullet lines with the busiest weekday of each year."""
+    lines = []
+    for year in years:
+        weekday, n = rollups.busiest_weekday(year)
+        if n:
+            lines.append(f"- {year}: {weekday} ({_entries(n)})")
+    return lines
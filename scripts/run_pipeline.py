@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Run the four stages like `make`, skipping work whose inputs did not change.
+
+Dependency graph per source type:
+
+    sources.json -> sources_<type>.csv -> content_<type>.csv -> statistics_<type>.csv
+                                                                      \\-> docs/
+    content_<type>.csv of all types -> terms.json -> docs/
+
+Each artifact records a hash of its inputs (upstream files, the source's
+`sources.json` entries and the stage code) in `data/.pipeline_state.json`.
+The stage code is the stage script and every module of scripts/ it
+imports, directly or through other modules (`code_paths`).
+A stage runs only when its artifact is missing or that hash changed. Stage 1
+reads from the network, so it also reruns with `--refetch` or when its
+output is older than `--max-age` hours. Source types run in parallel; the
+runner never shows the interactive menus.
+
+Usage:
+    python scripts/run_pipeline.py [type-or-name ...] [--refetch] [--max-age H]
+                                   [--force] [--jobs N] [--dry-run]
+"""
+import argparse
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+import metrics
+import scheduler
+import side_texts
+import term_stats
+
+STAGE_FILES = {
+    1: "1_create_sources.py",
+    2: "2_parse_sources.py",
+    3: "3_parse_content.py",
+    4: "4_generate_heatmaps.py",
+}
+# Scripts of each step; they and the modules they import make up its code
+STAGE_CODE = {
+    1: ["1_create_sources.py"],
+    2: ["2_parse_sources.py"],
+    3: ["3_parse_content.py"],
+    4: ["4_generate_heatmaps.py"],
+    'terms': ["term_stats.py"],
+}
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def load_stage(n):
+    """Import a numbered stage script as a module."""
+    with _modules_lock:
+        if n in _modules:
+            return _modules[n]
+        path = os.path.join(SCRIPT_DIR, STAGE_FILES[n])
+        spec = importlib.util.spec_from_file_location(f"stage{n}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[n] = module
+        return module
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def inputs_hash(paths, extra=None):
+    """Combined hash of input files (missing ones count as empty) and `extra` data."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode())
+        h.update((file_hash(path) if os.path.exists(path) else '-').encode())
+    if extra is not None:
+        h.update(json.dumps(extra, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class State:
+    """Input hashes recorded per artifact; thread-safe and saved after each update."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    def is_current(self, artifact, digest):
+        return os.path.exists(artifact) and self.data.get(self._key(artifact), {}).get('inputs') == digest
+
+    def record(self, artifact, digest):
+        with self.lock:
+            self.data[self._key(artifact)] = {'inputs': digest, 'built': time.time()}
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def _key(artifact):
+        return os.path.relpath(artifact, ROOT_DIR)
+
+
+def imported_modules(path):
+    """Names of the modules of scripts/ that the file at `path` imports."""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    return {name for name in names if os.path.exists(os.path.join(SCRIPT_DIR, f"{name}.py"))}
+
+
+def code_paths(stage):
+    """The scripts of `stage` and all modules of scripts/ they import, in name order."""
+    seen = set(STAGE_CODE[stage])
+    todo = list(seen)
+    while todo:
+        for name in imported_modules(os.path.join(SCRIPT_DIR, todo.pop())):
+            if f"{name}.py" not in seen:
+                seen.add(f"{name}.py")
+                todo.append(f"{name}.py")
+    return [os.path.join(SCRIPT_DIR, name) for name in sorted(seen)]
+
+
+def content_inputs(type_name, data_dir):
+    """Input files of stage 2 for one type: its sources CSV and side files."""
+    return [os.path.join(data_dir, f"sources_{type_name}.csv")] + side_texts.side_files(data_dir, type_name)
+
+
+def run_type(type_name, sources_of_type, data_dir, state, args):
+    """Bring sources/content/statistics of one type up to date; True if anything was rebuilt."""
+    sources_csv = os.path.join(data_dir, f"sources_{type_name}.csv")
+    content_csv = os.path.join(data_dir, f"content_{type_name}.csv")
+    stats_csv = os.path.join(data_dir, f"statistics_{type_name}.csv")
+
+    steps = [
+        (1, sources_csv, inputs_hash(code_paths(1), sources_of_type),
+         lambda: load_stage(1).create_sources(type_name, sources_of_type, data_dir)),
+        (2, content_csv, None,
+         lambda: load_stage(2).process_csv(type_name, data_dir, workers=scheduler.concurrency(sources_of_type))),
+        (3, stats_csv, None,
+         lambda: load_stage(3).process_statistics(type_name, data_dir)),
+    ]
+    # Side files are only known once stage 1 has run
+    upstream = {2: lambda: content_inputs(type_name, data_dir), 3: lambda: [sources_csv, content_csv]}
+
+    changed = False
+    for stage, artifact, digest, build in steps:
+        if digest is None:
+            digest = inputs_hash(upstream[stage]() + code_paths(stage))
+        stale = args.force or not state.is_current(artifact, digest)
+        if stage == 1 and not stale:
+            age_hours = (time.time() - os.path.getmtime(artifact)) / 3600
+            stale = args.refetch or (args.max_age is not None and age_hours > args.max_age)
+        name = os.path.relpath(artifact, ROOT_DIR)
+        if not stale:
+            print(f"[{type_name}] {name} is up to date")
+            metrics.cache_hit('pipeline')
+            continue
+        if args.dry_run:
+            print(f"[{type_name}] would rebuild {name} (stage {stage})")
+            # Downstream hashes cannot be known without running; assume they change
+            args = argparse.Namespace(**{**vars(args), 'force': True})
+            changed = True
+            continue
+        print(f"[{type_name}] rebuilding {name} (stage {stage})")
+        build()
+        state.record(artifact, digest)
+        changed = True
+    return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the diary pipeline, skipping up-to-date stages.")
+    parser.add_argument('selection', nargs='*', help="source types or names (default: all)")
+    parser.add_argument('--refetch', action='store_true', help="rerun stage 1 even if its config is unchanged")
+    parser.add_argument('--max-age', type=float, help="rerun stage 1 when its output is older than this many hours")
+    parser.add_argument('--force', action='store_true', help="rebuild every artifact")
+    parser.add_argument('--jobs', type=int, help="source types processed in parallel (default: all)")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would run")
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.join(ROOT_DIR, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    sources_file = os.path.join(SCRIPT_DIR, "sources.json")
+    with open(sources_file, 'r', encoding='utf-8') as f:
+        sources = json.load(f)
+
+    wanted = {a.lower() for a in args.selection}
+    sources_by_type = {}
+    for source in sources:
+        if wanted and source['type'].lower() not in wanted and source.get('name', '').lower() not in wanted:
+            continue
+        sources_by_type.setdefault(source['type'], []).append(source)
+    if not sources_by_type:
+        print("No matching sources.")
+        return 1
+
+    state = State(os.path.join(data_dir, ".pipeline_state.json"))
+    jobs = args.jobs or len(sources_by_type)
+    failed = []
+    any_changed = False
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {t: pool.submit(run_type, t, s, data_dir, state, args) for t, s in sources_by_type.items()}
+        for type_name, future in futures.items():
+            try:
+                any_changed |= future.result()
+            except Exception as e:
+                print(f"[{type_name}] failed: {e}")
+                metrics.count_error(type(e).__name__)
+                failed.append(type_name)
+
+    # Top terms per year, from the content (and dates) of every configured type
+    all_types = list(dict.fromkeys(s['type'] for s in sources))
+    terms_file = os.path.join(data_dir, term_stats.TERMS_FILE)
+    term_inputs = [os.path.join(data_dir, f"{kind}_{t}.csv") for t in all_types for kind in ('sources', 'content')]
+    digest = inputs_hash(term_inputs + code_paths('terms'))
+    if not args.force and not (args.dry_run and any_changed) and state.is_current(terms_file, digest):
+        print(f"{os.path.relpath(terms_file, ROOT_DIR)} is up to date")
+        metrics.cache_hit('pipeline')
+    elif args.dry_run:
+        print(f"would rebuild {os.path.relpath(terms_file, ROOT_DIR)}")
+    else:
+        term_stats.build(data_dir, all_types)
+        state.record(terms_file, digest)
+
+    # Stage 4 reads the statistics of every configured type and the top terms
+    stats_files = [os.path.join(data_dir, f"statistics_{t}.csv") for t in all_types]
+    readme = os.path.join(ROOT_DIR, "docs", "README.md")
+    digest = inputs_hash(stats_files + [terms_file, sources_file] + code_paths(4))
+    if not args.force and not (args.dry_run and any_changed) and state.is_current(readme, digest):
+        print("docs/ is up to date")
+        metrics.cache_hit('pipeline')
+    elif args.dry_run:
+        print("would regenerate docs/ (stage 4)")
+    else:
+        print("regenerating docs/ (stage 4)")
+        load_stage(4).main([])
+        state.record(readme, digest)
+    if not args.dry_run:
+        metrics.write_report('run_pipeline', data_dir)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
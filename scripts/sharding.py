@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Split a rebuild into N shards that run stages 1-3 on their own, then merge them.
+
+Every shard K of N gets a stable share of the work, decided by a hash of
+names that does not change between runs or machines:
+
+- GitHub sources run in every shard, each reading only the repos whose
+  full name hashes to it (through the API or from local clones);
+- legacy_html sources run in every shard, each crawling only the subtrees
+  (first path segment below the site URL) that hash to it;
+- every other source runs whole in the shard its type and URL hash to;
+- with `--skip-fetch` stage 1 is not run: the shard takes the rows of the
+  existing data/sources_<type>.csv whose links hash to it.
+
+A shard writes its partial sources_/content_/statistics_ files (and the
+side files of local sources) to data/shards/shard_<K>_of_<N>/, and
+shard.json once it has finished. The shards of one run can run as
+separate processes on one machine or on several machines that share the
+data directory. `merge` checks that all N shards finished with the same
+sources.json, then writes data/sources_/content_/statistics_<type>.csv:
+entries are deduplicated by link (the lowest shard wins) and sorted by
+date (newest first) and link, so the result does not depend on N or on
+the order the shards finished in. The merged files are recorded in
+data/.pipeline_state.json, so `run_pipeline.py` goes straight to stage 4.
+
+Usage:
+    python scripts/sharding.py run K/N [type-or-name ...] [--skip-fetch] [--jobs J] [--dir DIR]
+    python scripts/sharding.py merge N [--dir DIR]
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from run_pipeline import ROOT_DIR, SCRIPT_DIR, State, code_paths, content_inputs, inputs_hash, load_stage
+
+import metrics
+import scheduler
+import side_texts
+
+csv.field_size_limit(sys.maxsize)
+
+# Types whose sources are split inside the source rather than assigned whole
+SPLIT_TYPES = ('github', 'legacy_html')
+MARKER = 'shard.json'
+
+
+def shard_of(key, count):
+    """Shard (0..count-1) of a name; the same on every run and machine."""
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) % count
+
+
+def owns(shard, key):
+    """True if `shard` ((K, N), or None for an unsharded run) owns `key`."""
+    return shard is None or shard_of(key, shard[1]) == shard[0]
+
+
+def label(shard):
+    return f"{shard[0]}/{shard[1]}"
+
+
+def parse_shard(text):
+    """(K, N) of 'K/N'."""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected K/N, got {text!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard {text} out of range: K must be 0..N-1")
+    return index, count
+
+
+def shard_dir(root, index, count):
+    return os.path.join(root, f"shard_{index}_of_{count}")
+
+
+def assign(sources, shard):
+    """The sources a shard runs, with the `shard` key set on the ones it runs a part of."""
+    assigned = []
+    for source in sources:
+        if source['type'] in SPLIT_TYPES:
+            assigned.append({**source, 'shard': list(shard)})
+        elif owns(shard, f"{source['type']} {source['url']}"):
+            assigned.append(source)
+    return assigned
+
+
+def copy_side_files(src, dst):
+    for pattern in side_texts.SIDE_FILES.values():
+        for path in glob.glob(os.path.join(src, pattern)):
+            shutil.copy2(path, os.path.join(dst, os.path.basename(path)))
+
+
+def split_rows(type_name, data_dir, out_dir, shard):
+    """Write the rows of the existing sources CSV that the shard owns; returns their number."""
+    with open(os.path.join(data_dir, f"sources_{type_name}.csv"), 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if owns(shard, row[0])]
+    with open(os.path.join(out_dir, f"sources_{type_name}.csv"), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return len(rows)
+
+
+def run_shard(shard, sources, data_dir, root, skip_fetch=False, jobs=None):
+    """Run stages 1-3 of one shard into its directory below `root`."""
+    out_dir = shard_dir(root, *shard)
+    # Start from scratch: a shard without its marker is never merged
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    if skip_fetch:
+        copy_side_files(data_dir, out_dir)
+
+    sources_by_type = {}
+    for source in sources:
+        sources_by_type.setdefault(source['type'], []).append(source)
+
+    def run_type(type_name, sources_of_type):
+        assigned = assign(sources_of_type, shard)
+        if skip_fetch:
+            n = split_rows(type_name, data_dir, out_dir, shard)
+            print(f"[{type_name}] shard {label(shard)}: {n} rows of sources_{type_name}.csv")
+        elif assigned:
+            load_stage(1).create_sources(type_name, assigned, out_dir)
+        else:
+            print(f"[{type_name}] no sources in shard {label(shard)}")
+            return
+        load_stage(2).process_csv(type_name, out_dir, workers=scheduler.concurrency(sources_of_type))
+        load_stage(3).process_statistics(type_name, out_dir)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=jobs or len(sources_by_type) or 1) as pool:
+        futures = {t: pool.submit(run_type, t, s) for t, s in sources_by_type.items()}
+        for type_name, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[{type_name}] failed: {e}")
+                metrics.count_error(type(e).__name__)
+                failed.append(type_name)
+    if failed:
+        return False
+
+    with open(os.path.join(out_dir, MARKER), 'w', encoding='utf-8') as f:
+        json.dump({'shard': shard[0], 'of': shard[1], 'sources': sources,
+                   'skip_fetch': skip_fetch, 'finished': time.time()}, f, indent=2)
+    print(f"Shard {label(shard)} finished: {out_dir}")
+    return True
+
+
+def read_rows(path):
+    """{link: row} of a partial CSV (empty if the shard has none)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return {row[0]: row for row in reader}
+
+
+def write_csv(path, header, rows):
+    with open(path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(path + '.tmp', path)
+
+
+def merge(count, data_dir, root, all_sources):
+    """Combine the partial outputs of shards 0..count-1 into `data_dir`; returns False if any is missing."""
+    markers = []
+    for index in range(count):
+        path = os.path.join(shard_dir(root, index, count), MARKER)
+        if not os.path.exists(path):
+            print(f"Shard {index}/{count} has not finished ({path} missing)")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            markers.append(json.load(f))
+    if len(markers) < count:
+        return False
+    sources = markers[0]['sources']
+    if any(m['sources'] != sources for m in markers):
+        print("The shards ran with different sources; run them again")
+        return False
+
+    # The side files are inputs of the merged content files
+    for index in range(count):
+        copy_side_files(shard_dir(root, index, count), data_dir)
+
+    state = State(os.path.join(data_dir, ".pipeline_state.json"))
+    for type_name in dict.fromkeys(s['type'] for s in sources):
+        merged = {}   # link -> (sources row, content row, statistics row)
+        for index in range(count):
+            part = shard_dir(root, index, count)
+            rows = read_rows(os.path.join(part, f"sources_{type_name}.csv"))
+            contents = read_rows(os.path.join(part, f"content_{type_name}.csv"))
+            stats = read_rows(os.path.join(part, f"statistics_{type_name}.csv"))
+            for link, row in rows.items():
+                if link not in merged:
+                    merged[link] = (row, contents.get(link, [link, '']), stats.get(link))
+        # Newest first, then by link: the same order for any number of shards
+        order = sorted(merged, key=lambda link: (merged[link][0][1], link))
+        order.sort(key=lambda link: merged[link][0][1], reverse=True)
+
+        sources_csv = os.path.join(data_dir, f"sources_{type_name}.csv")
+        content_csv = os.path.join(data_dir, f"content_{type_name}.csv")
+        stats_csv = os.path.join(data_dir, f"statistics_{type_name}.csv")
+        write_csv(sources_csv, ['Link', 'Date', 'Title', 'Type'], (merged[link][0] for link in order))
+        write_csv(content_csv, ['Link', 'Content'], (merged[link][1] for link in order))
+        write_csv(stats_csv, ['Link', 'Date', 'Title', 'Word Count', 'Character Count'],
+                  (merged[link][2] or [link, merged[link][0][1], merged[link][0][2], 0, 0] for link in order))
+        print(f"[{type_name}] merged {len(order)} entries from {count} shards")
+
+        # Same digests as run_pipeline computes, when the shards ran every source of the type
+        sources_of_type = [s for s in all_sources if s['type'] == type_name]
+        if sources_of_type == [s for s in sources if s['type'] == type_name]:
+            state.record(sources_csv, inputs_hash(code_paths(1), sources_of_type))
+            state.record(content_csv, inputs_hash(content_inputs(type_name, data_dir) + code_paths(2)))
+            state.record(stats_csv, inputs_hash([sources_csv, content_csv] + code_paths(3)))
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run stages 1-3 in shards and merge their outputs.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="run stages 1-3 of one shard")
+    run.add_argument('shard', type=parse_shard, help="K/N: shard K (from 0) of N")
+    run.add_argument('selection', nargs='*', help="source types or names (default: all)")
+    run.add_argument('--skip-fetch', action='store_true', help="split the existing sources CSVs instead of stage 1")
+    run.add_argument('--jobs', type=int, help="source types processed in parallel (default: all)")
+    run.add_argument('--dir', help="directory of the shard outputs (default: data/shards)")
+    mrg = sub.add_parser('merge', help="combine the outputs of N finished shards")
+    mrg.add_argument('count', type=int, help="number of shards")
+    mrg.add_argument('--dir', help="directory of the shard outputs (default: data/shards)")
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.join(ROOT_DIR, "data")
+    root = args.dir or os.path.join(data_dir, "shards")
+    with open(os.path.join(SCRIPT_DIR, "sources.json"), 'r', encoding='utf-8') as f:
+        sources = json.load(f)
+
+    if args.command == 'merge':
+        ok = merge(args.count, data_dir, root, sources)
+        metrics.write_report('sharding', data_dir)
+        return 0 if ok else 1
+
+    wanted = {a.lower() for a in args.selection}
+    selected = [s for s in sources
+                if not wanted or s['type'].lower() in wanted or s.get('name', '').lower() in wanted]
+    if not selected:
+        print("No matching sources.")
+        return 1
+    ok = run_shard(args.shard, selected, data_dir, root, args.skip_fetch, args.jobs)
+    metrics.write_report(f"sharding_{args.shard[0]}_of_{args.shard[1]}", data_dir)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,56 @@
+"""Texts that local sources save next to their CSVs in stage 1, for stage 2.
+
+Stage 1 already reads the full text of a local entry: the notes of a vault
+(local_vault.py) and the posts of a WordPress export (wordpress_wxr.py).
+It saves them in side files in the data directory, SIDE_FILES below, and
+stage 2 takes the text of each entry from there instead of fetching it.
+
+A `SideTexts` reads the side files of a data directory and type on the
+first lookup and keeps them for the rest of its life. Stage 2 makes one
+per run (see `extract_all`), so every run reads the files stage 1 just
+wrote, once, and the texts of different data directories (shards, the
+diaries of a batch) are not mixed up.
+"""
+import glob
+import os
+import threading
+
+import local_vault
+import wordpress_wxr
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "data")
+SIDE_FILES = {
+    'local_markdown': 'vault_*.json',
+    'wordpress_wxr': 'wxr_*.jsonl',
+}
+READERS = {
+    'local_markdown': local_vault.read_texts,
+    'wordpress_wxr': wordpress_wxr.read_texts,
+}
+
+
+def side_files(data_dir, source_type):
+    """Side files of `source_type` in `data_dir`, in name order."""
+    if source_type not in SIDE_FILES:
+        return []
+    return sorted(glob.glob(os.path.join(data_dir or DATA_DIR, SIDE_FILES[source_type])))
+
+
+class SideTexts:
+    """Texts of the side files, by data directory, type and link; thread-safe."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.texts = {}     # (data dir, type) -> {link: text}
+
+    def text(self, source_type, link, data_dir=None):
+        """Text of the entry behind `link`; '' if no side file has it."""
+        key = (os.path.abspath(data_dir or DATA_DIR), source_type)
+        with self.lock:
+            texts = self.texts.get(key)
+            if texts is None:
+                texts = self.texts[key] = {}
+                for path in side_files(key[0], source_type):
+                    texts.update(READERS[source_type](path))
+        return texts.get(link, '')
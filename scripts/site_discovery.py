@@ -0,0 +1,223 @@
+"""Page discovery from sitemaps and feeds, ahead of crawling a site.
+
+`discover(base_url)` looks for the pages below `base_url` in
+
+- the `Sitemap:` lines of the site's robots.txt,
+- `<base>/sitemap.xml` and `<base>/sitemap_index.xml` (and the same at the
+  site root when the base has a path); sitemap indexes are followed and
+  gzipped sitemaps unpacked,
+- and, without a sitemap, the RSS/Atom feeds linked from the start page
+  plus the usual feed locations.
+
+A sitemap lists every page, so a site that has one is enumerated in a
+few requests and needs no crawl. Feeds usually only carry the latest
+items; their pages are known up front and the crawl fills in the rest.
+`pubDate`, `published` and `updated` of a feed item give the page date.
+A sitemap's `lastmod` is when a page last changed (or was deployed), not
+its date: it only tells whether a page read in an earlier run needs to be
+fetched again (see `load_lastmods`).
+"""
+import gzip
+import html
+import json
+import os
+import re
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import resilience
+
+MAX_SITEMAPS = 50
+FEED_PATHS = ('feed.xml', 'rss.xml', 'atom.xml', 'index.xml', 'feed/')
+
+
+class Discovery:
+    def __init__(self):
+        self.pages = {}        # url -> {'date', 'title', 'lastmod'}: 'YYYY-MM-DD' / str, or None
+        self.sitemaps = 0      # sitemaps with pages below the base URL
+        self.feeds = 0
+        self.requests = 0
+
+    @property
+    def complete(self):
+        """Whether a sitemap listed the site, so that no crawl is needed."""
+        return self.sitemaps > 0
+
+    def add(self, url, day=None, title=None, lastmod=None):
+        page = self.pages.setdefault(url, {'date': None, 'title': None, 'lastmod': None})
+        page['date'] = page['date'] or day
+        page['title'] = page['title'] or title
+        page['lastmod'] = page['lastmod'] or lastmod
+
+    def summary(self):
+        return (f"Discovered {len(self.pages)} pages from {self.sitemaps} sitemap(s) and {self.feeds} feed(s) "
+                f"in {self.requests} requests")
+
+
+def _fetch(url, found):
+    """Response body of `url`, or None; probes of missing files are expected and not reported."""
+    found.requests += 1
+    try:
+        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+        with resilience.urlopen(req, timeout=10) as response:
+            body = response.read()
+    except Exception:
+        return None
+    if body[:2] == b'\x1f\x8b':
+        try:
+            body = gzip.decompress(body)
+        except OSError:
+            return None
+    return body
+
+
+def _xml(body):
+    try:
+        return ET.fromstring(body)
+    except ET.ParseError:
+        return None
+
+
+def _tag(element):
+    return element.tag.rsplit('}', 1)[-1].lower()
+
+
+def _child_text(element, *names):
+    for child in element:
+        if _tag(child) in names and child.text and child.text.strip():
+            return child.text.strip()
+    return None
+
+
+def parse_date(value):
+    """'YYYY-MM-DD' from a W3C datetime or RFC 822 date, or None."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip()[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def read_sitemap(url, base_url, found, seen):
+    """Add the pages of a sitemap (or, recursively, a sitemap index) below `base_url`."""
+    if url in seen or len(seen) >= MAX_SITEMAPS:
+        return
+    seen.add(url)
+    body = _fetch(url, found)
+    root = _xml(body) if body else None
+    if root is None:
+        return
+    if _tag(root) == 'sitemapindex':
+        for sitemap in root:
+            loc = _child_text(sitemap, 'loc')
+            if loc:
+                read_sitemap(loc, base_url, found, seen)
+    elif _tag(root) == 'urlset':
+        before = len(found.pages)
+        for entry in root:
+            loc = _child_text(entry, 'loc')
+            if loc and loc.startswith(base_url):
+                found.add(loc, lastmod=_child_text(entry, 'lastmod'))
+        if len(found.pages) > before:
+            found.sitemaps += 1
+
+
+def read_feed(url, base_url, found):
+    """Add the items of an RSS or Atom feed below `base_url`; False if `url` is no feed."""
+    body = _fetch(url, found)
+    root = _xml(body) if body else None
+    if root is None or _tag(root) not in ('rss', 'feed', 'rdf'):
+        return False
+    found.feeds += 1
+    for item in root.iter():
+        if _tag(item) not in ('item', 'entry'):
+            continue
+        link = _child_text(item, 'link')
+        if not link:
+            # Atom: <link rel="alternate" href="..."/>
+            for child in item:
+                if _tag(child) == 'link' and child.get('rel', 'alternate') == 'alternate' and child.get('href'):
+                    link = child.get('href')
+                    break
+        if not link:
+            continue
+        link = urllib.parse.urljoin(url, link)
+        if link.startswith(base_url):
+            day = parse_date(_child_text(item, 'pubdate', 'published', 'updated', 'date'))
+            title = _child_text(item, 'title')
+            found.add(link, day, title)
+    return True
+
+
+def feed_links(page, page_url):
+    """Feed URLs announced with <link rel="alternate" type="application/rss+xml|atom+xml">."""
+    links = []
+    for tag in re.findall(r'<link\b[^>]*>', page, re.IGNORECASE):
+        if re.search(r'type=["\']application/(rss|atom)\+xml["\']', tag, re.IGNORECASE):
+            href = re.search(r'href=["\'](.*?)["\']', tag, re.IGNORECASE)
+            if href:
+                links.append(urllib.parse.urljoin(page_url, html.unescape(href.group(1))))
+    return links
+
+
+def discover(base_url):
+    """Pages below `base_url` from its sitemaps, or else from its feeds."""
+    base_url = base_url.rstrip('/') + '/'
+    parts = urllib.parse.urlsplit(base_url)
+    root_url = f"{parts.scheme}://{parts.netloc}/"
+    found = Discovery()
+
+    sitemaps = []
+    robots = _fetch(root_url + 'robots.txt', found)
+    if robots:
+        for line in robots.decode('utf-8', errors='ignore').splitlines():
+            if line.lower().startswith('sitemap:'):
+                sitemaps.append(line.split(':', 1)[1].strip())
+    sitemaps += [base_url + 'sitemap.xml', base_url + 'sitemap_index.xml']
+    if base_url != root_url:
+        sitemaps += [root_url + 'sitemap.xml', root_url + 'sitemap_index.xml']
+    seen = set()
+    for sitemap in sitemaps:
+        read_sitemap(sitemap, base_url, found, seen)
+        if found.complete:
+            return found
+
+    start = _fetch(base_url, found)
+    feeds = feed_links(start.decode('utf-8', errors='ignore'), base_url) if start else []
+    for feed in feeds + [base_url + path for path in FEED_PATHS]:
+        if feed.startswith(root_url) and read_feed(feed, base_url, found) and feed in feeds:
+            # An announced feed is the site's own; the usual locations need no probing
+            break
+    return found
+
+
+def lastmods_path(data_dir, base_url):
+    parts = urllib.parse.urlsplit(base_url)
+    slug = re.sub(r'[^a-z0-9]+', '_', (parts.netloc + parts.path).lower()).strip('_') or 'site'
+    return os.path.join(data_dir, f"sitemap_{slug}.json")
+
+
+def load_lastmods(path):
+    """{url: {'lastmod', 'post'}} of the sitemap pages read in the last run; `post` if it was an entry."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_lastmods(path, lastmods):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(lastmods, f, sort_keys=True)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""One-shot streaming run of all four stages without intermediate CSVs.
+
+Fetchers (stage 1) run one thread per source and feed a bounded queue.
+Worker threads extract the content (stage 2) and count words (stage 3),
+then hand compact Entry records to the main thread, which keeps them for
+the heatmaps (stage 4). Page content is dropped as soon as it is counted,
+and the bounded queues make fast fetchers wait for slow workers, so only
+in-flight entries are held in memory. A source also waits while
+`--queue-size` of its entries are fetched but not yet passed on in fetch
+order, so one slow entry cannot make the reorder buffer grow without
+bound.
+
+With `--write-csv` the usual sources_/content_/statistics_ CSVs are written
+as side outputs while entries pass through. Source types that are not
+selected keep their existing statistics CSVs in the report.
+
+Usage:
+    python scripts/stream_pipeline.py [type-or-name ...] [--workers N] [--queue-size N]
+                                      [--write-csv] [--words] [--quantile]
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from run_pipeline import ROOT_DIR, SCRIPT_DIR, load_stage
+
+import diary_data
+import metrics
+import side_texts
+import term_stats
+
+DONE = object()
+
+
+class SideOutputs:
+    """Lazily opened CSV writers for the optional per-type side outputs."""
+
+    HEADERS = {
+        'sources': ['Link', 'Date', 'Title', 'Type'],
+        'content': ['Link', 'Content'],
+        'statistics': ['Link', 'Date', 'Title', 'Word Count', 'Character Count'],
+    }
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.files = {}
+        self.writers = {}
+
+    def write(self, kind, source_type, row):
+        key = (kind, source_type)
+        if key not in self.writers:
+            path = os.path.join(self.data_dir, f"{kind}_{source_type}.csv")
+            f = open(path, 'w', newline='', encoding='utf-8')
+            self.files[key] = f
+            self.writers[key] = csv.writer(f)
+            self.writers[key].writerow(self.HEADERS[kind])
+        self.writers[key].writerow(row)
+
+    def close(self):
+        for (kind, source_type), f in self.files.items():
+            f.close()
+            print(f"Saved to {f.name}")
+
+
+def produce(index, source, entries, window, data_dir=None):
+    """Stage 1 for one source: push numbered entries into the bounded queue.
+
+    Each entry takes a slot of the source's `window`, which the main thread
+    gives back once the entry is passed on in order.
+    """
+    stage1 = load_stage(1)
+    name = source.get('name', source['type'])
+    seq = 0
+    with metrics.timer('create_sources', name):
+        try:
+            for item in stage1.iter_source(source, data_dir):
+                window.acquire()
+                entries.put((index, seq, source['type'], item))
+                seq += 1
+        except Exception as e:
+            print(f"Error fetching {name}: {e}")
+            metrics.count_error(type(e).__name__)
+    metrics.add_rows('create_sources', name, seq)
+
+
+def work(entries, results, keep_content, data_dir=None, texts=None):
+    """Stages 2 and 3 for queued entries until the DONE marker arrives."""
+    stage2 = load_stage(2)
+    stage3 = load_stage(3)
+    while True:
+        job = entries.get()
+        if job is DONE:
+            results.put(DONE)
+            return
+        index, seq, source_type, item = job
+        try:
+            content = stage2.extract_content(item['link'], item['type'], item['title'], source_type, data_dir, texts)
+        except Exception as e:
+            print(f"Error extracting {item['link']}: {e}")
+            metrics.count_error(type(e).__name__)
+            content = ""
+        results.put((index, seq, source_type, item, stage3.count_words(content), len(content) if content else 0,
+                     content if keep_content else None))
+
+
+def run(selected_sources, source_config, data_dir, workers=8, queue_size=64, write_csv=False):
+    """Stream the selected sources through stages 1-3; returns their Entry records.
+
+    Workers finish out of order, so results are put back into fetch order
+    per source before they are written or kept. That makes the output
+    identical to running the stages one after another. At most
+    `queue_size` entries per source wait to be put back in order.
+    """
+    entries = queue.Queue(maxsize=queue_size)
+    results = queue.Queue(maxsize=queue_size)
+    side = SideOutputs(data_dir) if write_csv else None
+
+    # Local sources save their side files before their first entry is queued
+    texts = side_texts.SideTexts()
+    windows = [threading.Semaphore(queue_size) for _ in selected_sources]
+    consumers = [threading.Thread(target=work, args=(entries, results, write_csv, data_dir, texts), daemon=True)
+                 for _ in range(workers)]
+    for t in consumers:
+        t.start()
+
+    def fetch_all():
+        with ThreadPoolExecutor(max_workers=len(selected_sources)) as pool:
+            for index, source in enumerate(selected_sources):
+                pool.submit(produce, index, source, entries, windows[index], data_dir)
+        for _ in consumers:
+            entries.put(DONE)
+    threading.Thread(target=fetch_all, daemon=True).start()
+
+    kept = [[] for _ in selected_sources]
+    pending = [{} for _ in selected_sources]
+    next_seq = [0] * len(selected_sources)
+    processed = 0
+    remaining = len(consumers)
+    while remaining:
+        result = results.get()
+        if result is DONE:
+            remaining -= 1
+            continue
+        index, seq, *rest = result
+        pending[index][seq] = rest
+        while next_seq[index] in pending[index]:
+            source_type, item, words, chars, content = pending[index].pop(next_seq[index])
+            next_seq[index] += 1
+            windows[index].release()
+            if side is not None:
+                side.write('sources', source_type, [item['link'], item['date'], item['title'], item['type']])
+                side.write('content', source_type, [item['link'], content])
+                side.write('statistics', source_type, [item['link'], item['date'], item['title'], words, chars])
+            kept[index].append(diary_data.Entry(item['link'], diary_data.parse_day(item['date']), item['title'],
+                                                words, chars, source_type))
+            processed += 1
+            if processed % 500 == 0:
+                print(f"  {processed} entries processed...")
+
+    if side is not None:
+        side.close()
+
+    # Same order as stage 4 reads the CSVs: by type, then sources.json order
+    types = list(dict.fromkeys(s['type'] for s in selected_sources))
+    order = sorted(range(len(selected_sources)), key=lambda i: types.index(selected_sources[i]['type']))
+    all_data = []
+    seen_links = set()
+    for item in (e for i in order for e in kept[i]):
+        if item.link not in seen_links:
+            seen_links.add(item.link)
+            all_data.append(item)
+    return all_data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream all stages in one process.")
+    parser.add_argument('selection', nargs='*', help="source types or names (default: all)")
+    parser.add_argument('--workers', type=int, default=8, help="content extraction threads")
+    parser.add_argument('--queue-size', type=int, default=64, help="bound of the in-flight queues")
+    parser.add_argument('--write-csv', action='store_true', help="also write the stage CSVs")
+    parser.add_argument('--words', action='store_true', help="weight heatmap intensity by words")
+    parser.add_argument('--quantile', action='store_true', help="use per-year quartiles for intensity")
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.join(ROOT_DIR, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    sources_file = os.path.join(SCRIPT_DIR, "sources.json")
+    with open(sources_file, 'r', encoding='utf-8') as f:
+        sources = json.load(f)
+    source_config = diary_data.load_source_config(sources_file)
+
+    wanted = {a.lower() for a in args.selection}
+    selected = [s for s in sources
+                if not wanted or s['type'].lower() in wanted or s.get('name', '').lower() in wanted]
+    if not selected:
+        print("No matching sources.")
+        return 1
+
+    with metrics.timer('stream'):
+        streamed = run(selected, source_config, data_dir, args.workers, args.queue_size, args.write_csv)
+    metrics.add_rows('stream', '', len(streamed))
+    streamed_types = {s['type'] for s in selected}
+    other_types = [st for st in source_config if st not in streamed_types]
+    # Merge in the order stage 4 would read the types; the first link wins
+    rank = {st: i for i, st in enumerate(source_config)}
+    merged = sorted(streamed + diary_data.load_statistics(data_dir, other_types),
+                    key=lambda item: rank.get(item.source_type, len(rank)))
+    all_data = []
+    seen_links = set()
+    for item in merged:
+        if item.link not in seen_links:
+            seen_links.add(item.link)
+            all_data.append(item)
+
+    if args.write_csv:
+        term_stats.build(data_dir, list(source_config))
+    with metrics.timer('generate_heatmaps'):
+        # Without the CSVs, the top terms are those of the last full run
+        load_stage(4).generate_reports(all_data, source_config, os.path.join(ROOT_DIR, "docs"),
+                                       'words' if args.words else 'entries',
+                                       'quantile' if args.quantile else 'linear', terms=term_stats.load(data_dir))
+    metrics.add_rows('generate_heatmaps', '', len(all_data))
+    metrics.write_report('stream_pipeline', data_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Most frequent terms per year and source, counted in a fixed amount of memory.
+
+Counting every word of every year and source exactly would keep a counter
+entry for every distinct term, which grows with the corpus. This stage
+reads the content_<type>.csv files (or content stores) once, entry by
+entry, and keeps two fixed-size summaries instead:
+
+- one count-min sketch (`CountMinSketch`) for all groups: DEPTH rows of
+  counters, each indexed by its own part of a BLAKE2b hash of
+  "<group> <term>". Its estimate of a count is never too low, and too high
+  by at most e/width of all terms added to the sketch, over all groups
+  (with probability 1 - e^-depth);
+- a space-saving summary (`SpaceSaving`) of `capacity` terms per group
+  (a year, and a year and source). A term that is not in a full summary
+  takes the place of its least frequent term only once the sketch says it
+  is more frequent, and starts from the sketch's estimate.
+
+The groups are bounded by the years and sources, the sketch by
+`--memory-mb`, so memory does not grow with the corpus. Terms are words of
+three or more letters outside URLs, lowercased, without the English and German
+stopwords (or the lists given with `--stopwords`). The result is
+data/terms.json, from which stage 4 renders the top terms of each year.
+
+`--check` counts every term exactly as well (memory grows with the
+vocabulary, so only for small corpora) and exits with 1 if a reported
+count is off by more than its `max_error`, or a term is missing from a
+top list it belongs in.
+
+Usage:
+    python scripts/term_stats.py [--memory-mb M] [--capacity K] [--top N]
+                                 [--stopwords en,de|none|FILE,...] [--check]
+"""
+import argparse
+import array
+import csv
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+from datetime import date
+
+import content_store
+import diary_data
+import metrics
+import profiling
+
+csv.field_size_limit(sys.maxsize)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "data")
+TERMS_FILE = "terms.json"
+VERSION = 1
+DEPTH = 4
+DEFAULT_MEMORY_MB = 16
+DEFAULT_CAPACITY = 100
+DEFAULT_TOP = 10
+DEFAULT_STOPWORDS = 'en,de'
+MIN_LENGTH = 3
+TERM = re.compile(r'[^\W\d_]{%d,}' % MIN_LENGTH)
+URL = re.compile(r'\b(?:https?://|www\.)\S+')
+
+STOPWORDS = {
+    'en': """about above after again against all also and any are because been before being below
+        between both but can could did does doing down during each few for from further had has have
+        having her here hers herself him himself his how into its itself just like more most much
+        not now off once only other our ours out over own same she should some such than that the
+        their theirs them then there these they this those through too under until very was were
+        what when where which while who whom why will with would you your yours yourself one two
+        get got use used using new""",
+    'de': """aber alle allem allen aller alles als also andere anderem anderen anderer anderes auch
+        auf aus bei beim bin bis bist da damit dann das dass dein deine dem den denn der des dessen
+        dich die dies diese diesem diesen dieser dieses dir doch dort durch ein eine einem einen
+        einer eines einige für gegen hab habe haben hat hatte hatten hier hin hinter ich ihm ihn ihnen
+        ihr ihre ihrem ihren ihrer ihres im in ist jede jedem jeden jeder jedes jetzt kann kein keine
+        keinem keinen keiner können könnte machen man manche mehr mein meine mich mir mit muss musste
+        nach nicht nichts noch nun nur ob oder ohne schon sehr sein seine seinem seinen seiner sich
+        sie sind so solche soll sollte sondern sonst über um und uns unser unsere unter vom von vor
+        war waren warst was weil weiter welche wenn wer werde werden wie wieder will wir wird wirst
+        wo wollen wollte würde würden zum zur zwar zwischen""",
+}
+
+
+class CountMinSketch:
+    """`depth` rows of `width` 32-bit counters; estimates are upper bounds of true counts."""
+
+    def __init__(self, width, depth=DEPTH):
+        if not 1 <= depth <= 8:
+            raise ValueError("depth must be 1..8 (one 64-bit part of a BLAKE2b digest per row)")
+        self.width = width
+        self.depth = depth
+        self.rows = [array.array('I', bytes(4 * width)) for _ in range(depth)]
+        self.total = 0
+
+    def _columns(self, key):
+        # Row i takes the i-th 64 bits of one digest: rows collide independently
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8 * self.depth).digest()
+        return [int.from_bytes(digest[8 * i:8 * i + 8], 'little') % self.width for i in range(self.depth)]
+
+    def add(self, key, n=1):
+        """Add `n` to `key` and return its new estimate."""
+        self.total += n
+        estimate = None
+        for row, col in zip(self.rows, self._columns(key)):
+            value = min(row[col] + n, 0xFFFFFFFF)
+            row[col] = value
+            estimate = value if estimate is None else min(estimate, value)
+        return estimate
+
+    def estimate(self, key):
+        return min(row[col] for row, col in zip(self.rows, self._columns(key)))
+
+    def error_bound(self):
+        """Overestimate that any count stays within with probability 1 - e^-depth."""
+        return math.ceil(math.e / self.width * self.total)
+
+
+class SpaceSaving:
+    """The (at most) `capacity` most frequent terms of a stream, with counts from a sketch."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.heap = []      # (count, term), stale entries skipped when popped
+        self.total = 0
+
+    def _min(self):
+        while True:
+            count, term = self.heap[0]
+            if self.counts.get(term) == count:
+                return count, term
+            heapq.heappop(self.heap)
+
+    def add(self, term, n, estimate):
+        """Count `n` more of `term`, whose sketch estimate (including `n`) is `estimate`."""
+        self.total += n
+        if term in self.counts:
+            count = min(self.counts[term] + n, estimate)
+        elif len(self.counts) < self.capacity:
+            count = estimate
+        else:
+            low, low_term = self._min()
+            if estimate <= low:
+                return
+            heapq.heappop(self.heap)
+            del self.counts[low_term]
+            count = estimate
+        self.counts[term] = count
+        heapq.heappush(self.heap, (count, term))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c, t) for t, c in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+
+def load_stopwords(spec):
+    """Stopwords of a comma-separated list of language codes and word-list files; 'none' for none."""
+    words = set()
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part or part == 'none':
+            continue
+        if part in STOPWORDS:
+            words.update(STOPWORDS[part].split())
+        else:
+            with open(part, 'r', encoding='utf-8') as f:
+                words.update(line.strip().lower() for line in f if line.strip() and not line.startswith('#'))
+    return frozenset(words)
+
+
+def iter_content(data_dir, source_type):
+    """(link, content) of a type, from its content store or CSV; nothing if there is neither."""
+    store = content_store.store_path(data_dir, source_type)
+    if os.path.exists(store):
+        with content_store.ContentStore(store) as s:
+            yield from s.items()
+        return
+    path = os.path.join(data_dir, f"content_{source_type}.csv")
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                yield row['Link'], row['Content']
+
+
+def terms_of(text, stopwords):
+    """Term counts of one text; URLs are not words."""
+    return Counter(t for t in TERM.findall(URL.sub(' ', text.lower())) if t not in stopwords)
+
+
+def iter_terms(data_dir, source_types, stopwords):
+    """Yield (year, source type, term counts) of every dated entry with content."""
+    for source_type in source_types:
+        sources_csv = os.path.join(data_dir, f"sources_{source_type}.csv")
+        if not os.path.exists(sources_csv):
+            continue
+        years = {e.link: date.fromordinal(e.day).year if e.day else None for e in diary_data.read_entries(sources_csv, source_type)}
+        with metrics.timer('term_stats', source_type):
+            rows = 0
+            for link, text in iter_content(data_dir, source_type):
+                year = years.get(link)
+                if not year or not text:
+                    continue
+                rows += 1
+                # Counting within one entry first saves sketch updates for repeated words
+                yield year, source_type, terms_of(text, stopwords)
+        metrics.add_rows('term_stats', source_type, rows)
+
+
+def count_terms(data_dir, source_types, memory_mb=DEFAULT_MEMORY_MB, capacity=DEFAULT_CAPACITY,
+                top=DEFAULT_TOP, stopwords=None):
+    """One pass over the content of `source_types`; returns the terms.json document."""
+    if stopwords is None:
+        stopwords = load_stopwords(DEFAULT_STOPWORDS)
+    width = max(1024, memory_mb * 1024 * 1024 // (4 * DEPTH))
+    sketch = CountMinSketch(width)
+    groups = {}     # (year, source type or '') -> SpaceSaving
+    entries = 0
+    for year, source_type, counts in iter_terms(data_dir, source_types, stopwords):
+        entries += 1
+        for term, n in counts.items():
+            for key in ((year, ''), (year, source_type)):
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = SpaceSaving(capacity)
+                estimate = sketch.add(f"{key[0]}/{key[1]} {term}", n)
+                group.add(term, n, estimate)
+
+    # The bound depends on everything in the shared sketch, not on one group's terms
+    max_error = sketch.error_bound()
+    result = {}
+    for (year, source_type), group in sorted(groups.items()):
+        result.setdefault(str(year), {})[source_type or 'all'] = {
+            'terms': group.total,
+            'max_error': max_error,
+            'top': [[term, count] for term, count in group.top(top)],
+        }
+    return {'version': VERSION, 'entries': entries, 'width': width, 'depth': DEPTH,
+            'capacity': capacity, 'years': result}
+
+
+def check(doc, data_dir, source_types, stopwords):
+    """Compare `doc` with exact counts; returns a line per count off by more than its bound or missing term."""
+    exact = {}      # (year, 'all' or source type) -> Counter
+    for year, source_type, counts in iter_terms(data_dir, source_types, stopwords):
+        for key in ((str(year), 'all'), (str(year), source_type)):
+            exact.setdefault(key, Counter()).update(counts)
+    problems = []
+    for (year, group), counts in sorted(exact.items()):
+        summary = doc['years'].get(year, {}).get(group)
+        if summary is None:
+            problems.append(f"{year} {group}: missing")
+            continue
+        top = dict(summary['top'])
+        for term, count in top.items():
+            if not counts[term] <= count <= counts[term] + summary['max_error']:
+                problems.append(f"{year} {group}: {term} reported {count}, exact {counts[term]}")
+        # A term left out must not be more frequent than the lowest count listed
+        if len(top) == len(counts) or not top:
+            continue
+        least = min(top.values())
+        for term, count in counts.most_common(len(top) + 1):
+            if term not in top and count > least:
+                problems.append(f"{year} {group}: {term} ({count}) missing from the top {len(top)}")
+    return problems
+
+
+def save(doc, data_dir):
+    path = os.path.join(data_dir, TERMS_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(doc, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def load(data_dir=None):
+    """The terms.json document of `data_dir`, or None if there is none."""
+    path = os.path.join(data_dir or DATA_DIR, TERMS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        doc = json.load(f)
+    return doc if doc.get('version') == VERSION else None
+
+
+def build(data_dir, source_types, **options):
+    """Count the terms of `source_types` in `data_dir` and write terms.json; returns its path."""
+    doc = count_terms(data_dir, source_types, **options)
+    path = save(doc, data_dir)
+    print(f"Saved top terms of {len(doc['years'])} years ({doc['entries']} entries) to {path}")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count the most frequent terms per year and source.")
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB, help="size of the count-min sketch")
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help="terms tracked per year and source")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="terms kept per year and source")
+    parser.add_argument('--stopwords', default=DEFAULT_STOPWORDS, help="languages (en, de) or files, comma-separated; 'none'")
+    parser.add_argument('--check', action='store_true', help="compare the result with exact counts")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(SCRIPT_DIR, "sources.json"), 'r', encoding='utf-8') as f:
+        source_types = list(dict.fromkeys(s['type'] for s in json.load(f)))
+    profiling.setup('term_stats', sys.argv[1:] if argv is None else argv, DATA_DIR)
+    stopwords = load_stopwords(args.stopwords)
+    build(DATA_DIR, source_types, memory_mb=max(1, args.memory_mb), capacity=max(args.top, args.capacity),
+          top=args.top, stopwords=stopwords)
+    metrics.write_report('term_stats', DATA_DIR)
+    if args.check:
+        problems = check(load(DATA_DIR), DATA_DIR, source_types, stopwords)
+        for line in problems:
+            print(line)
+        print(f"Check against exact counts: {len(problems)} problems")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+"""Posts of a WordPress export (WXR) file, read from disk.
+
+A `wordpress_wxr` source in sources.json names the file that "Tools >
+Export" in WordPress saved as its "url":
+
+    {"type": "wordpress_wxr", "url": "~/Downloads/blog.WordPress.2025-12-20.xml", "name": "Blog export"}
+
+`scan()` reads the export with `iterparse` and clears every <item> (and
+every other child of <channel>) once it is read, so memory stays flat
+however large the archive is. Published posts become entries with their
+permalink, the date of `wp:post_date` (the site's local time, like the
+REST API's `date`) and their title; pages, attachments, menu items,
+drafts and private posts are left out.
+
+The text of a post is its own body, `content:encoded` without markup,
+shortcodes and block comments; there is no theme, sidebar or comment
+form around it as on the rendered page that stage 2 fetches for the
+`wordpress` source. `scan()` writes the texts to data/wxr_<name>.jsonl as
+it goes, and stage 2 takes them from there (see side_texts.py).
+"""
+import html
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "data")
+CONTENT_NS = '{http://purl.org/rss/1.0/modules/content/}'
+# WXR 1.0 to 1.2 differ only in the version of this namespace
+WP_NS = re.compile(r'^\{http://wordpress\.org/export/[\d.]+/\}')
+POST_TYPES = ('post',)
+STATUSES = ('publish',)
+
+
+def texts_path(data_dir, name):
+    slug = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') or 'export'
+    return os.path.join(data_dir or DATA_DIR, f"wxr_{slug}.jsonl")
+
+
+def post_body_text(body):
+    """Readable text of a post body as stored by WordPress."""
+    text = re.sub(r'<(script|style).*?>.*?</\1>', '', body, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<!--.*?-->', '', text, flags=re.DOTALL)                  # block comments
+    text = re.sub(r'\[/?[a-z][\w-]*(?:\s[^\]]*)?\]', '', text)               # [shortcodes]
+    text = re.sub(r'<[^<]+?>', '', text)
+    return html.unescape(text).strip()
+
+
+def _field(tag):
+    """Short name of an item field: 'title', 'wp:post_type', 'content:encoded', ..."""
+    if tag.startswith(CONTENT_NS):
+        return 'content:' + tag[len(CONTENT_NS):]
+    m = WP_NS.match(tag)
+    if m:
+        return 'wp:' + tag[m.end():]
+    return tag
+
+
+def _post(item):
+    """(entry, text) of a published post <item>, or None."""
+    fields = {}
+    for child in item:
+        fields.setdefault(_field(child.tag), child.text or '')
+    if fields.get('wp:post_type', 'post') not in POST_TYPES or fields.get('wp:status') not in STATUSES:
+        return None
+    day = fields.get('wp:post_date', '')[:10]
+    if not re.match(r'\d{4}-\d{2}-\d{2}$', day) or day.startswith('0000'):
+        try:
+            day = parsedate_to_datetime(fields.get('pubDate', '')).date().isoformat()
+        except (TypeError, ValueError):
+            return None
+    link = (fields.get('link') or fields.get('guid') or '').strip()
+    if not link:
+        return None
+    entry = {'link': link, 'date': day, 'title': fields.get('title', '').strip(), 'type': 'wordpress_wxr',
+             'revision': fields.get('wp:post_modified_gmt') or fields.get('wp:post_modified')}
+    return entry, post_body_text(fields.get('content:encoded', ''))
+
+
+def iter_posts(export_path):
+    """Yield (entry, text) of the published posts of an export, in file order."""
+    depth = 0
+    channel = None
+    for event, elem in ET.iterparse(export_path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag == 'channel':
+                channel = elem
+            continue
+        depth -= 1
+        if depth == 2 and channel is not None:
+            # A child of <channel> is complete: read it if it is an item, then drop it
+            if elem.tag == 'item':
+                post = _post(elem)
+                if post:
+                    yield post
+            elem.clear()
+            del channel[:]
+
+
+def scan(export_path, texts=None):
+    """Yield the entries of the posts in `export_path` and write their texts to `texts`."""
+    path = os.path.abspath(os.path.expanduser(export_path))
+    entries = []
+    out = None
+    if texts:
+        os.makedirs(os.path.dirname(texts), exist_ok=True)
+        out = open(texts + '.tmp', 'w', encoding='utf-8')
+    try:
+        for entry, text in iter_posts(path):
+            entries.append(entry)
+            if out:
+                out.write(json.dumps({'link': entry['link'], 'text': text}, ensure_ascii=False) + '\n')
+    finally:
+        if out:
+            out.close()
+    if texts:
+        os.replace(texts + '.tmp', texts)
+    print(f"Read {len(entries)} published posts from {path}")
+    # The texts are on disk before the first entry reaches stage 2
+    yield from entries
+
+
+def read_texts(path):
+    """Yield (link, text) of the posts in a texts file written by `scan()`."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            yield record['link'], record['text']
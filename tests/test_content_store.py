@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import content_store
+
+
+class ContentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "content_test.dcs")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        rows = [(f"https://example.org/{i}", f"Entry {i} ünïcode " * (i % 7)) for i in range(200)]
+        rows.append(("https://example.org/none", None))
+        # Small blocks, so the entries spread over many of them
+        n, raw, stored = content_store.write_store(self.path, rows, block_size=1024)
+        self.assertEqual(n, len(rows))
+        self.assertEqual(raw, sum(len((text or '').encode('utf-8')) for _, text in rows))
+        self.assertEqual(stored, os.path.getsize(self.path))
+
+        with content_store.ContentStore(self.path) as store:
+            self.assertEqual(len(store), len(rows))
+            self.assertGreater(len(store._blocks), 1)
+            self.assertEqual(list(store.items()), [(link, text or '') for link, text in rows])
+            # Random access, in any order
+            for link, text in reversed(rows):
+                self.assertEqual(store[link], text or '')
+            self.assertIn("https://example.org/3", store)
+            self.assertNotIn("https://example.org/missing", store)
+            self.assertEqual(store.get("https://example.org/missing", 'default'), 'default')
+            with self.assertRaises(KeyError):
+                store["https://example.org/missing"]
+
+    def test_empty_store(self):
+        self.assertEqual(content_store.write_store(self.path, [])[0], 0)
+        with content_store.ContentStore(self.path) as store:
+            self.assertEqual(len(store), 0)
+            self.assertEqual(list(store.items()), [])
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'Link,Content\n')
+        with self.assertRaises(ValueError):
+            content_store.ContentStore(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
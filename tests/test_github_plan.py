@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import github_plan
+
+TARGET = github_plan.SEARCH_RANGE_TARGET
+
+
+class SearchRangesTest(unittest.TestCase):
+    def check_cover(self, ranges, first, last):
+        """The ranges are in order, without gaps or overlaps, from `first` to `last`."""
+        self.assertEqual(ranges[0][0], first)
+        self.assertEqual(ranges[-1][1], last)
+        for (_, end, _), (start, _, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(start, end + timedelta(days=1))
+        for start, end, _ in ranges:
+            self.assertLessEqual(start, end)
+
+    def test_quiet_months_share_a_range(self):
+        months = {'2020-01': 100, '2020-02': 200, '2020-03': 300}
+        ranges = github_plan.search_ranges(months, date(2020, 1, 1), date(2020, 3, 31))
+        self.assertEqual(ranges, [(date(2020, 1, 1), date(2020, 3, 31), 600)])
+
+    def test_split_at_month_boundaries(self):
+        months = {f"2020-{m:02d}": 300 for m in range(1, 13)}
+        first, last = date(2020, 1, 1), date(2020, 12, 31)
+        ranges = github_plan.search_ranges(months, first, last)
+        self.check_cover(ranges, first, last)
+        self.assertEqual(len(ranges), 6)
+        self.assertTrue(all(n <= TARGET for _, _, n in ranges))
+        self.assertEqual(sum(n for _, _, n in ranges), 3600)
+        # Every range starts on the first of a month
+        self.assertTrue(all(start.day == 1 for start, _, _ in ranges))
+
+    def test_busy_month_is_sliced_by_days(self):
+        months = {'2021-05': 100, '2021-06': 3000, '2021-07': 100}
+        first, last = date(2021, 5, 1), date(2021, 7, 31)
+        ranges = github_plan.search_ranges(months, first, last)
+        self.check_cover(ranges, first, last)
+        june = [r for r in ranges if r[0].month == 6]
+        self.assertEqual(len(june), int(3000 // TARGET) + 1)
+        self.assertEqual((june[0][0], june[-1][1]), (date(2021, 6, 1), date(2021, 6, 30)))
+        self.assertAlmostEqual(sum(n for _, _, n in june), 3000)
+        self.assertTrue(all(n <= TARGET for _, _, n in ranges))
+
+    def test_partial_first_and_last_month(self):
+        months = {'2022-01': 900, '2022-02': 10}
+        first, last = date(2022, 1, 20), date(2022, 2, 5)
+        ranges = github_plan.search_ranges(months, first, last)
+        self.check_cover(ranges, first, last)
+        self.assertEqual(sum(n for _, _, n in ranges), 910)
+
+    def test_no_commits(self):
+        first, last = date(2023, 1, 1), date(2023, 6, 30)
+        self.assertEqual(github_plan.search_ranges({}, first, last), [(first, last, 0.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
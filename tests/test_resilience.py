@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import resilience
+
+HOST = 'breaker.test'
+
+
+def post():
+    """A request that is not retried, so every call is one attempt."""
+    return urllib.request.Request(f"http://{HOST}/", data=b'x', method='POST')
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        resilience.reset()
+        self.calls = 0
+        self.fail = True
+        patcher = mock.patch.object(resilience.metrics, 'urlopen', self.fake_urlopen)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(resilience.reset)
+
+    def fake_urlopen(self, req, timeout=None):
+        self.calls += 1
+        if self.fail:
+            raise urllib.error.URLError(ConnectionRefusedError("refused"))
+        return 'response'
+
+    def open_breaker(self):
+        for _ in range(resilience.FAILURE_THRESHOLD):
+            with self.assertRaises(urllib.error.URLError):
+                resilience.urlopen(post())
+
+    def cool_down(self):
+        resilience._host(HOST).open_until = time.time() - 1
+
+    def test_opens_after_threshold(self):
+        self.open_breaker()
+        self.assertEqual(self.calls, resilience.FAILURE_THRESHOLD)
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.urlopen(post())
+        # Rejected without a request
+        self.assertEqual(self.calls, resilience.FAILURE_THRESHOLD)
+
+    def test_half_open_lets_one_request_through(self):
+        self.open_breaker()
+        self.cool_down()
+        nested = []
+
+        def probe(req, timeout=None):
+            # While the probe is out, other requests are still rejected
+            try:
+                resilience.urlopen(post())
+            except resilience.CircuitOpenError as e:
+                nested.append(e)
+            return 'response'
+
+        with mock.patch.object(resilience.metrics, 'urlopen', probe):
+            self.assertEqual(resilience.urlopen(post()), 'response')
+        self.assertEqual(len(nested), 1)
+
+    def test_failed_probe_reopens_with_longer_cooldown(self):
+        self.open_breaker()
+        self.cool_down()
+        with self.assertRaises(urllib.error.URLError):
+            resilience.urlopen(post())
+        self.assertEqual(self.calls, resilience.FAILURE_THRESHOLD + 1)
+        self.assertEqual(resilience._host(HOST).cooldown, 2 * resilience.COOLDOWN)
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.urlopen(post())
+
+    def test_successful_probe_closes(self):
+        self.open_breaker()
+        self.cool_down()
+        self.fail = False
+        self.assertEqual(resilience.urlopen(post()), 'response')
+        h = resilience._host(HOST)
+        self.assertEqual((h.open_until, h.failures, h.cooldown), (0.0, 0, resilience.COOLDOWN))
+        for _ in range(3):
+            resilience.urlopen(post())
+        self.assertEqual(self.calls, resilience.FAILURE_THRESHOLD + 4)
+
+    def test_client_errors_do_not_count(self):
+        def not_found(req, timeout=None):
+            raise urllib.error.HTTPError(req.full_url, 404, 'Not Found', {}, None)
+
+        with mock.patch.object(resilience.metrics, 'urlopen', not_found):
+            for _ in range(resilience.FAILURE_THRESHOLD + 1):
+                with self.assertRaises(urllib.error.HTTPError):
+                    resilience.urlopen(post())
+        self.assertEqual(resilience._host(HOST).failures, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import sharding
+
+SOURCES = [{'type': 'wordpress', 'url': 'https://blog.example.org', 'name': 'Blog'},
+           {'type': 'quartz', 'url': 'https://notes.example.org', 'name': 'Notes'}]
+FILES = ('sources', 'content', 'statistics')
+
+
+def entries(type_name, n, rng):
+    """(sources row, content row, statistics row) of `n` entries, with repeated dates."""
+    rows = []
+    for i in range(n):
+        link = f"https://{type_name}.example.org/{rng.randrange(10 ** 6)}/{i}"
+        day = f"2024-{rng.randint(1, 3):02d}-{rng.randint(1, 5):02d}"
+        title = f"{type_name} {i}"
+        text = f"text of {title}"
+        rows.append(([link, day, title, 'post'], [link, text], [link, day, title, 4, len(text)]))
+    return rows
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        rng = random.Random(7)
+        self.entries = {s['type']: entries(s['type'], 60, rng) for s in SOURCES}
+
+    def write_shards(self, root, count, seed):
+        """Shard outputs as `run_shard` leaves them, each shard's rows in its own order."""
+        rng = random.Random(seed)
+        for index in range(count):
+            out_dir = sharding.shard_dir(root, index, count)
+            os.makedirs(out_dir)
+            for type_name, rows in self.entries.items():
+                owned = [row for row in rows if sharding.owns((index, count), row[0][0])]
+                rng.shuffle(owned)
+                write_csv(os.path.join(out_dir, f"sources_{type_name}.csv"), ['Link', 'Date', 'Title', 'Type'],
+                          [r[0] for r in owned])
+                write_csv(os.path.join(out_dir, f"content_{type_name}.csv"), ['Link', 'Content'],
+                          [r[1] for r in owned])
+                write_csv(os.path.join(out_dir, f"statistics_{type_name}.csv"),
+                          ['Link', 'Date', 'Title', 'Word Count', 'Character Count'], [r[2] for r in owned])
+            with open(os.path.join(out_dir, sharding.MARKER), 'w', encoding='utf-8') as f:
+                json.dump({'shard': index, 'of': count, 'sources': SOURCES}, f)
+
+    def merged(self, count, seed=0):
+        """{file name: bytes} of the merge of `count` shards."""
+        root = os.path.join(self.tmp.name, f"shards_{count}_{seed}")
+        data_dir = os.path.join(self.tmp.name, f"data_{count}_{seed}")
+        os.makedirs(data_dir)
+        self.write_shards(root, count, seed)
+        self.assertTrue(sharding.merge(count, data_dir, root, SOURCES))
+        files = {}
+        for s in SOURCES:
+            for kind in FILES:
+                name = f"{kind}_{s['type']}.csv"
+                with open(os.path.join(data_dir, name), 'rb') as f:
+                    files[name] = f.read()
+        return files
+
+    def test_same_result_for_any_shard_count(self):
+        single = self.merged(1)
+        for count in (2, 3, 5):
+            self.assertEqual(self.merged(count), single, f"{count} shards")
+
+    def test_same_result_for_any_row_order(self):
+        self.assertEqual(self.merged(3, seed=1), self.merged(3, seed=2))
+
+    def test_newest_first_then_by_link(self):
+        rows = list(csv.reader(self.merged(2)['sources_wordpress.csv'].decode('utf-8').splitlines()))[1:]
+        self.assertEqual(len(rows), 60)
+        keys = [(row[1], row[0]) for row in rows]
+        expected = sorted(keys, key=lambda k: k[1])
+        expected.sort(key=lambda k: k[0], reverse=True)
+        self.assertEqual(keys, expected)
+
+    def test_missing_shard(self):
+        root = os.path.join(self.tmp.name, "incomplete")
+        self.write_shards(root, 3, 0)
+        os.remove(os.path.join(sharding.shard_dir(root, 1, 3), sharding.MARKER))
+        data_dir = os.path.join(self.tmp.name, "data_incomplete")
+        os.makedirs(data_dir)
+        self.assertFalse(sharding.merge(3, data_dir, root, SOURCES))
+        self.assertEqual(os.listdir(data_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()